@@ -0,0 +1,330 @@
+"""
+Benchmark de las operaciones de pdf_tools sobre PDFs sintéticos generados con reportlab.
+
+Uso:
+    python benchmark.py                                  # tamaños 10, 100 y 1000 páginas
+    python benchmark.py --sizes 10,5000 --kinds text     # documentos de texto de 10 y 5000 páginas
+    python benchmark.py --output nuevo.json --baseline base.json
+
+Cada operación se ejecuta en un proceso propio para medir su pico de memoria (RSS)
+sin arrastrar el de las anteriores. Los resultados se guardan en JSON y, si se indica
+--baseline, se comparan con una ejecución anterior.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from queue import Empty
+
+import pdf_tools
+
+FIXTURE_KINDS = ('text', 'image', 'fonts')
+DEFAULT_SIZES = (10, 100, 1000)
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+         "tempor incididunt ut labore et dolore magna aliqua contrato clausula. ")
+
+# --- Generación de fixtures ---
+
+def _fixture_path(fixtures_dir, kind, pages):
+    return os.path.join(fixtures_dir, f"{kind}_{pages}.pdf")
+
+def _make_sample_images(count=16, size=400):
+    """Imágenes de prueba distintas entre sí (degradados con ruido) para el fixture de imágenes"""
+    from PIL import Image
+
+    images = []
+    for i in range(count):
+        img = Image.radial_gradient('L').resize((size, size))
+        noise = Image.effect_noise((size, size), 40 + i * 5)
+        images.append(Image.merge('RGB', (img, noise, img.rotate(i * 20))))
+    return images
+
+def generate_fixture(path, kind, pages):
+    """
+    Genera un PDF sintético.
+    kind: 'text' (páginas densas en texto), 'image' (una imagen grande por página)
+          o 'fonts' (texto con una fuente TrueType embebida compartida por todas las páginas)
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+
+    font_name = "Helvetica"
+    if kind == 'fonts':
+        import reportlab
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        font_path = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+        pdfmetrics.registerFont(TTFont('BenchVera', font_path))
+        font_name = 'BenchVera'
+
+    images = [ImageReader(img) for img in _make_sample_images()] if kind == 'image' else []
+
+    can = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for page in range(pages):
+        if kind == 'image':
+            can.drawImage(images[page % len(images)], 50, 150, width=width - 100, height=width - 100)
+            can.setFont("Helvetica", 12)
+            can.drawString(50, 100, f"Página {page + 1} - contrato")
+        else:
+            can.setFont(font_name, 9)
+            y = height - 50
+            line = 0
+            while y > 50:
+                can.drawString(40, y, f"{page + 1}.{line} {LOREM[:95]}")
+                y -= 11
+                line += 1
+        can.showPage()
+    can.save()
+
+def ensure_fixtures(fixtures_dir, kinds, sizes):
+    """Genera los fixtures que falten y retorna {(kind, pages): ruta}"""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    fixtures = {}
+    for kind in kinds:
+        for pages in sizes:
+            path = _fixture_path(fixtures_dir, kind, pages)
+            if not os.path.exists(path):
+                print(f"Generando fixture {os.path.basename(path)}...", file=sys.stderr)
+                generate_fixture(path, kind, pages)
+            fixtures[(kind, pages)] = path
+    return fixtures
+
+# --- Operaciones medidas ---
+# Cada operación recibe (ruta, número de páginas, carpeta temporal) y retorna
+# cuántas páginas procesó, para calcular páginas por segundo.
+
+def _op_merge(path, pages, work_dir):
+    pdf_tools.merge_pdfs([path, path], os.path.join(work_dir, "merged.pdf"))
+    return pages * 2
+
+def _op_split(path, pages, work_dir):
+    # Dividir miles de páginas a archivos mide sobre todo el disco: se limita a 50
+    selected = list(range(min(pages, 50)))
+    pdf_tools.split_pdf(path, work_dir, pages_to_extract=selected)
+    return len(selected)
+
+def _op_extract_text(path, pages, work_dir):
+    pdf_tools.extract_text(path)
+    return pages
+
+def _op_find_text(path, pages, work_dir):
+    pdf_tools.find_text_coordinates(path, "contrato")
+    return pages
+
+def _op_page_to_image(path, pages, work_dir):
+    pdf_tools.pdf_page_to_image(path, 1, dpi=144)
+    return 1
+
+def _op_add_text(path, pages, work_dir):
+    pdf_tools.add_text_to_pdf(path, os.path.join(work_dir, "text.pdf"), "Benchmark", 1, 100, 100)
+    return pages
+
+def _op_add_image(path, pages, work_dir):
+    image_path = os.path.join(work_dir, "stamp.png")
+    _make_sample_images(count=1, size=200)[0].save(image_path)
+    pdf_tools.add_image_to_pdf(path, os.path.join(work_dir, "image.pdf"), image_path, 1, 100, 100, 150, 150)
+    return pages
+
+OPERATIONS = {
+    'merge_pdfs': _op_merge,
+    'split_pdf': _op_split,
+    'extract_text': _op_extract_text,
+    'find_text_coordinates': _op_find_text,
+    'pdf_page_to_image': _op_page_to_image,
+    'add_text_to_pdf': _op_add_text,
+    'add_image_to_pdf': _op_add_image,
+}
+
+def _reset_peak_rss():
+    """
+    Reinicia el pico de memoria del proceso (VmHWM) a su memoria actual. Solo en Linux:
+    ru_maxrss se hereda a través de exec, así que un hijo lanzado con spawn arrastraría
+    el pico del proceso padre. Retorna True si se pudo reiniciar.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_bytes(reset_ok):
+    """Pico de memoria residente del proceso actual (None si la plataforma no lo expone)"""
+    if reset_ok:
+        try:
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            return None
+        return None
+    if sys.platform == 'linux':
+        # Sin clear_refs el pico podría ser el del padre: mejor no dar un dato engañoso
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reporta bytes (BSD, KiB)
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _run_operation(op_name, path, pages, queue):
+    """Ejecuta una operación dentro de un proceso hijo y envía sus métricas por la cola"""
+    work_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+    try:
+        reset_ok = _reset_peak_rss()
+        start = time.perf_counter()
+        processed = OPERATIONS[op_name](path, pages, work_dir)
+        wall = time.perf_counter() - start
+        queue.put({
+            'ok': True,
+            'wall_seconds': wall,
+            'pages_processed': processed,
+            'pages_per_second': processed / wall if wall > 0 else None,
+            'peak_rss_bytes': _peak_rss_bytes(reset_ok)
+        })
+    except Exception as e:
+        queue.put({'ok': False, 'error': f"{type(e).__name__}: {e}"})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _wait_result(proc, queue, timeout):
+    """
+    Espera el resultado del proceso hijo. Si muere sin enviarlo (falta de memoria, segfault)
+    o supera timeout segundos, retorna un resultado fallido en vez de bloquear para siempre.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            pass
+        if not proc.is_alive():
+            # El resultado pudo llegar justo antes de terminar
+            try:
+                return queue.get(timeout=1)
+            except Empty:
+                return {'ok': False, 'error': f"El proceso terminó sin resultado (código {proc.exitcode})"}
+        if deadline is not None and time.monotonic() > deadline:
+            proc.terminate()
+            return {'ok': False, 'error': f"Tiempo agotado ({timeout:.0f} s)"}
+
+def measure(op_name, path, pages, repeat=1, timeout=None):
+    """
+    Mide una operación repeat veces (un proceso por repetición) y se queda con la más rápida.
+    timeout: segundos máximos por repetición (None sin límite)
+    """
+    ctx = multiprocessing.get_context('spawn')
+    best = None
+    for _ in range(repeat):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_operation, args=(op_name, path, pages, queue))
+        proc.start()
+        result = _wait_result(proc, queue, timeout)
+        proc.join()
+        if not result['ok']:
+            return result
+        if best is None or result['wall_seconds'] < best['wall_seconds']:
+            best = result
+    return best
+
+# --- Informe y comparación ---
+
+def run_benchmarks(fixtures, operations, repeat=1, timeout=None):
+    results = []
+    for (kind, pages), path in sorted(fixtures.items()):
+        for op_name in operations:
+            result = measure(op_name, path, pages, repeat=repeat, timeout=timeout)
+            result.update({'operation': op_name, 'fixture': kind, 'pages': pages,
+                           'file_size': os.path.getsize(path)})
+            results.append(result)
+            if result['ok']:
+                rss = result['peak_rss_bytes']
+                rss_text = f"{rss / 2**20:7.1f} MiB" if rss else "      n/d"
+                print(f"{op_name:24} {kind:6} {pages:6} págs  {result['wall_seconds']:8.3f} s  "
+                      f"{result['pages_per_second']:9.1f} págs/s  {rss_text}")
+            else:
+                print(f"{op_name:24} {kind:6} {pages:6} págs  ERROR {result['error']}")
+    return results
+
+def compare_with_baseline(results, baseline_path, threshold=0.10):
+    """Compara con una ejecución anterior; retorna el número de regresiones por encima de threshold"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['operation'], r['fixture'], r['pages']): r
+                for r in baseline['results'] if r.get('ok')}
+
+    regressions = 0
+    print(f"\nComparación con {baseline_path} (umbral {threshold:.0%}):")
+    for r in results:
+        key = (r['operation'], r['fixture'], r['pages'])
+        old = previous.get(key)
+        if not r.get('ok') or not old:
+            continue
+        ratio = r['wall_seconds'] / old['wall_seconds'] if old['wall_seconds'] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  << REGRESIÓN"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  mejora"
+        print(f"{key[0]:24} {key[1]:6} {key[2]:6} págs  {old['wall_seconds']:8.3f} s -> "
+              f"{r['wall_seconds']:8.3f} s  ({ratio:5.2f}x){flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de pdf_tools con PDFs sintéticos")
+    parser.add_argument('--sizes', default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Números de páginas separados por comas (ej: 10,100,5000)")
+    parser.add_argument('--kinds', default=",".join(FIXTURE_KINDS),
+                        help=f"Tipos de fixture: {', '.join(FIXTURE_KINDS)}")
+    parser.add_argument('--ops', default=",".join(OPERATIONS),
+                        help="Operaciones a medir, separadas por comas")
+    parser.add_argument('--fixtures-dir', default=os.path.join(tempfile.gettempdir(), "pdf_tools_bench"),
+                        help="Carpeta donde se generan (y reutilizan) los fixtures")
+    parser.add_argument('--repeat', type=int, default=1, help="Repeticiones por medición (se usa la mejor)")
+    parser.add_argument('--timeout', type=float, default=600,
+                        help="Segundos máximos por medición antes de darla por fallida (0 sin límite)")
+    parser.add_argument('--output', default="bench_results.json", help="Archivo JSON de resultados")
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior para comparar")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Empeoramiento relativo a partir del cual se marca regresión")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    kinds = [k.strip() for k in args.kinds.split(',') if k.strip()]
+    operations = [o.strip() for o in args.ops.split(',') if o.strip()]
+    unknown = [k for k in kinds if k not in FIXTURE_KINDS] + [o for o in operations if o not in OPERATIONS]
+    if unknown:
+        parser.error(f"Valores desconocidos: {', '.join(unknown)}")
+
+    fixtures = ensure_fixtures(args.fixtures_dir, kinds, sizes)
+    results = run_benchmarks(fixtures, operations, repeat=args.repeat, timeout=args.timeout or None)
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
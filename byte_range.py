@@ -0,0 +1,249 @@
+"""
+Lectura por rangos de bytes para abrir PDFs enormes o remotos sin cargarlos enteros.
+
+PdfReader en modo estricto solo lee el final del archivo (startxref), la tabla xref, el
+trailer y los objetos que se le piden (en modo no estricto salta además a la cabecera de
+cada objeto: ver pdf_tools.open_reader). RangeFile le ofrece un archivo de solo lectura
+que pide a una fuente de bytes únicamente los bloques que se tocan y los guarda en una
+cache LRU. Fuentes disponibles:
+  FileSource   archivo local (pread)
+  MmapSource   archivo local mapeado en memoria
+  HttpSource   URL http(s) con peticiones Range (el servidor debe responder 206)
+
+    source = byte_range.open_source("https://portal/archivo.pdf")
+    reader = PdfReader(source, strict=True)
+
+pdf_tools.open_reader ya lo hace con las URLs y con los archivos locales grandes.
+"""
+import collections
+import io
+import mmap
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import instrumentation
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+# Bloques que se conservan por archivo abierto (16 MB con el tamaño de bloque por defecto)
+DEFAULT_CACHE_BLOCKS = 256
+
+
+def is_url(location):
+    return isinstance(location, str) and location.lower().startswith(('http://', 'https://'))
+
+
+class FileSource:
+    """Archivo local leído con pread (sin mover un puntero compartido entre hilos)"""
+
+    def __init__(self, path):
+        self.name = path
+        self._fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        stat = os.fstat(self._fd)
+        self.size = stat.st_size
+        self.validator = str(stat.st_mtime_ns)
+        self._lock = threading.Lock()
+
+    def read_range(self, start, length):
+        if hasattr(os, 'pread'):
+            return os.pread(self._fd, length, start)
+        with self._lock:
+            os.lseek(self._fd, start, os.SEEK_SET)
+            return os.read(self._fd, length)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class MmapSource:
+    """Archivo local mapeado en memoria: el sistema operativo pagina solo lo que se toca"""
+
+    def __init__(self, path):
+        self.name = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.size = stat.st_size
+            self.validator = str(stat.st_mtime_ns)
+            # mmap no admite archivos vacíos
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def read_range(self, start, length):
+        if self._map is None:
+            return b""
+        return self._map[start:start + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class HttpSource:
+    """
+    URL servida por HTTP con soporte de Range. Se exige respuesta 206 a cada petición:
+    un servidor que ignore Range devolvería el archivo entero, justo lo que se quiere evitar.
+    Con If-Range, si el archivo cambia en el servidor la lectura falla en vez de mezclar versiones.
+    """
+
+    def __init__(self, url, timeout=30, headers=None):
+        self.name = url
+        self.url = url
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.size, self.validator = self._probe()
+
+    def _open(self, request):
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _probe(self):
+        # Un GET del primer byte da el tamaño (Content-Range) y el validador en una sola petición
+        request = urllib.request.Request(self.url, headers={**self.headers, 'Range': 'bytes=0-0'})
+        with self._open(request) as response:
+            if response.status != 206:
+                raise IOError(f"El servidor no admite peticiones por rangos: {self.url}")
+            content_range = response.headers.get('Content-Range', '')
+            try:
+                size = int(content_range.rsplit('/', 1)[1])
+            except (IndexError, ValueError):
+                raise IOError(f"Content-Range inválido ({content_range!r}): {self.url}")
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        return size, validator
+
+    def read_range(self, start, length):
+        headers = {**self.headers, 'Range': f"bytes={start}-{start + length - 1}"}
+        if self.validator:
+            headers['If-Range'] = self.validator
+        request = urllib.request.Request(self.url, headers=headers)
+        with instrumentation.span('http.range', start=start, length=length):
+            with self._open(request) as response:
+                if response.status != 206:
+                    raise IOError(f"El archivo cambió en el servidor o no admite rangos: {self.url}")
+                data = response.read()
+        instrumentation.count('http.range_requests')
+        return data
+
+    def close(self):
+        pass
+
+
+class RangeFile(io.RawIOBase):
+    """
+    Archivo de solo lectura sobre una fuente de rangos, con cache LRU de bloques.
+    Los bloques contiguos que faltan se piden en una sola lectura de la fuente.
+    """
+
+    def __init__(self, source, block_size=DEFAULT_BLOCK_SIZE, cache_blocks=DEFAULT_CACHE_BLOCKS):
+        super().__init__()
+        self.source = source
+        self.name = source.name
+        self.size = source.size
+        self.validator = source.validator
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self._blocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._pos = 0
+        # Estadísticas: lecturas a la fuente y bytes traídos
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if pos < 0:
+            raise ValueError("Posición negativa")
+        self._pos = pos
+        return pos
+
+    def _fetch(self, first, last):
+        """Trae los bloques first..last (inclusivos) en una sola lectura y los guarda en cache"""
+        start = first * self.block_size
+        length = min((last + 1) * self.block_size, self.size) - start
+        data = self.source.read_range(start, length)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        instrumentation.count('range.bytes', len(data))
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            self._blocks[index] = data[offset:offset + self.block_size]
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+
+    def read_at(self, start, length):
+        """Lee length bytes a partir de start sin mover la posición"""
+        end = min(start + length, self.size)
+        if start >= end:
+            return b""
+        first = start // self.block_size
+        last = (end - 1) // self.block_size
+        with self._lock:
+            missing = [i for i in range(first, last + 1) if i not in self._blocks]
+            # Agrupar los bloques que faltan en tramos contiguos
+            run_start = None
+            for i, index in enumerate(missing):
+                if run_start is None:
+                    run_start = index
+                if i + 1 == len(missing) or missing[i + 1] != index + 1:
+                    self._fetch(run_start, index)
+                    run_start = None
+            chunks = []
+            for index in range(first, last + 1):
+                self._blocks.move_to_end(index)
+                chunks.append(self._blocks[index])
+        data = b"".join(chunks)
+        offset = start - first * self.block_size
+        return data[offset:offset + (end - start)]
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._pos
+        data = self.read_at(self._pos, size)
+        self._pos += len(data)
+        return data
+
+    def readall(self):
+        return self.read(-1)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.source.close()
+            self._blocks.clear()
+        super().close()
+
+
+def open_source(location, backend='auto', block_size=DEFAULT_BLOCK_SIZE,
+                cache_blocks=DEFAULT_CACHE_BLOCKS, **options):
+    """
+    Abre location (ruta o URL http/https) como RangeFile.
+    backend: 'auto' (http para URLs, file para rutas), 'file', 'mmap' o 'http'
+    options: argumentos extra de la fuente (p.ej. timeout y headers para http)
+    """
+    if backend == 'auto':
+        backend = 'http' if is_url(location) else 'file'
+    sources = {'file': FileSource, 'mmap': MmapSource, 'http': HttpSource}
+    if backend not in sources:
+        raise ValueError(f"Fuente desconocida: {backend}")
+    return RangeFile(sources[backend](location, **options), block_size=block_size, cache_blocks=cache_blocks)
@@ -0,0 +1,250 @@
+"""
+Índice de texto persistente para buscar en carpetas con miles de PDFs.
+
+El texto de cada página se guarda en una tabla FTS5 de SQLite (tokenizador unicode61
+sin tildes, así que "clausula" encuentra "cláusula") junto con los fragmentos posicionados
+que devuelve pdf_tools.extract_page_text_chunks, para poder dar el rectángulo de cada
+coincidencia sin volver a abrir el PDF.
+
+    index = corpus_index.CorpusIndex()
+    index.update("/ruta/contratos")           # solo procesa lo nuevo o modificado
+    for hit in index.search("fuerza mayor"):
+        print(hit['path'], hit['page'], hit['rects'])
+
+Actualización incremental: un archivo con el mismo mtime y tamaño no se vuelve a leer;
+si cambió el mtime se calcula su SHA-1 y solo se extrae de nuevo si el contenido cambió.
+La extracción (y el hash) se reparten entre procesos: pypdf es Python puro y en hilos
+no pasaría del GIL.
+
+Se configura con la variable de entorno:
+  PDF_EDITOR_INDEX_PATH=ruta    base de datos del índice (~/.cache/pdf_tools/corpus.sqlite)
+"""
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+
+DEFAULT_INDEX_PATH = os.environ.get("PDF_EDITOR_INDEX_PATH") or os.path.join(
+    os.path.expanduser("~"), ".cache", "pdf_tools", "corpus.sqlite")
+# Archivos por transacción al escribir el índice
+COMMIT_EVERY = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha1 TEXT,
+    page_count INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    page INTEGER NOT NULL,
+    chunks TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_file ON pages(file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(text, tokenize="unicode61 remove_diacritics 2");
+"""
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _index_file(path, known_sha1=None):
+    """
+    Trabajo de un proceso: hash del archivo y, si cambió respecto a known_sha1, texto y
+    fragmentos de cada página. Retorna {path, sha1, unchanged, pages, error}.
+    """
+    import pdf_tools
+
+    result = {'path': path, 'sha1': None, 'unchanged': False, 'pages': [], 'error': None}
+    try:
+        result['sha1'] = _file_sha1(path)
+        if result['sha1'] == known_sha1:
+            result['unchanged'] = True
+            return result
+        reader = pdf_tools.open_reader(path)
+        if reader.is_encrypted:
+            reader.decrypt("")
+        for page in reader.pages:
+            text, chunks = pdf_tools.extract_page_text_chunks(page)
+            # Coordenadas redondeadas: el índice ocupa bastante menos y sobra precisión
+            chunks = [[t, round(float(x), 1), round(float(y), 1), round(float(size), 1)]
+                      for t, x, y, size in chunks]
+            result['pages'].append((text or "", json.dumps(chunks, ensure_ascii=False)))
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['pages'] = []
+    return result
+
+def find_pdfs(folder):
+    """Rutas absolutas de los PDFs bajo folder (recursivo)"""
+    paths = []
+    for root, _dirs, files in os.walk(folder):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith('.pdf'))
+    return sorted(os.path.abspath(p) for p in paths)
+
+def fts_phrase(query):
+    """Convierte el texto buscado en una frase FTS5 (sin operadores: se busca tal cual)"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+class CorpusIndex:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_INDEX_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with contextlib.closing(self._connect()) as conn:
+            # WAL: se puede buscar mientras otra conexión actualiza el índice
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _delete_pages(self, conn, file_id):
+        conn.execute("DELETE FROM pages_fts WHERE rowid IN (SELECT id FROM pages WHERE file_id = ?)", (file_id,))
+        conn.execute("DELETE FROM pages WHERE file_id = ?", (file_id,))
+
+    def _store(self, conn, file_id, path, stat, result):
+        if file_id is None:
+            file_id = conn.execute(
+                "INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                (path, stat.st_mtime_ns, stat.st_size)).lastrowid
+        else:
+            self._delete_pages(conn, file_id)
+        conn.execute("UPDATE files SET mtime_ns = ?, size = ?, sha1 = ?, page_count = ?, error = ? WHERE id = ?",
+                     (stat.st_mtime_ns, stat.st_size, result['sha1'], len(result['pages']), result['error'], file_id))
+        for page_num, (text, chunks) in enumerate(result['pages'], start=1):
+            page_id = conn.execute("INSERT INTO pages (file_id, page, chunks) VALUES (?, ?, ?)",
+                                   (file_id, page_num, chunks)).lastrowid
+            conn.execute("INSERT INTO pages_fts (rowid, text) VALUES (?, ?)", (page_id, text))
+
+    @instrumentation.traced('corpus_index.update')
+    def update(self, folder, max_workers=None, progress=None):
+        """
+        Pone al día el índice con los PDFs de folder: añade los nuevos, vuelve a extraer los
+        modificados y quita los que ya no existen.
+        progress: función opcional progress(procesados, total) (se llama desde este hilo)
+        Retorna {'files', 'added', 'updated', 'unchanged', 'removed', 'failed'}.
+        """
+        folder = os.path.abspath(folder)
+        paths = find_pdfs(folder)
+        report = {'files': len(paths), 'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+        with contextlib.closing(self._connect()) as conn:
+            prefix = os.path.join(folder, "")
+            known = {row[1]: row for row in conn.execute(
+                "SELECT id, path, mtime_ns, size, sha1 FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix))}
+
+            # Quitar los archivos que ya no están en la carpeta
+            present = set(paths)
+            for file_id, path, *_ in known.values():
+                if path not in present:
+                    self._delete_pages(conn, file_id)
+                    conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                    report['removed'] += 1
+            conn.commit()
+
+            # Solo se procesan los que no conservan mtime y tamaño
+            pending = {}
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                row = known.get(path)
+                if row and row[2] == stat.st_mtime_ns and row[3] == stat.st_size:
+                    report['unchanged'] += 1
+                    continue
+                pending[path] = (row, stat)
+
+            done = report['unchanged']
+            if progress:
+                progress(done, len(paths))
+            if pending:
+                # spawn: no se duplica el proceso de la interfaz (hilos de Tk) con fork
+                ctx = multiprocessing.get_context('spawn')
+                workers = max_workers or min(len(pending), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+                    futures = [executor.submit(_index_file, path, row[4] if row else None)
+                               for path, (row, _stat) in pending.items()]
+                    for count, future in enumerate(as_completed(futures), start=1):
+                        result = future.result()
+                        row, stat = pending[result['path']]
+                        if result['unchanged']:
+                            # Solo se tocó el archivo: se guarda el mtime nuevo
+                            conn.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?",
+                                         (stat.st_mtime_ns, stat.st_size, row[0]))
+                            report['unchanged'] += 1
+                        else:
+                            self._store(conn, row[0] if row else None, result['path'], stat, result)
+                            report['failed' if result['error'] else ('updated' if row else 'added')] += 1
+                            instrumentation.count('corpus.pages_indexed', len(result['pages']))
+                        if count % COMMIT_EVERY == 0:
+                            conn.commit()
+                        done += 1
+                        if progress:
+                            progress(done, len(paths))
+                conn.commit()
+        return report
+
+    def search(self, query, limit=200, folder=None):
+        """
+        Busca query como frase (sin distinguir mayúsculas ni tildes).
+        Retorna [{'path', 'page' (1-indexed), 'rects': [[x, y, w, h], ...], 'snippet'}],
+        ordenado por archivo y página. rects queda vacío si la frase cruza varios fragmentos
+        de texto y tampoco se localizan sus palabras por separado.
+        """
+        import pdf_tools
+
+        query = query.strip()
+        if not query:
+            return []
+        sql = ("SELECT files.path, pages.page, pages.chunks, "
+               "snippet(pages_fts, 0, '[', ']', '…', 12) "
+               "FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid "
+               "JOIN files ON files.id = pages.file_id WHERE pages_fts MATCH ?")
+        params = [fts_phrase(query)]
+        if folder:
+            prefix = os.path.join(os.path.abspath(folder), "")
+            sql += " AND substr(files.path, 1, ?) = ?"
+            params += [len(prefix), prefix]
+        sql += " ORDER BY files.path, pages.page LIMIT ?"
+        params.append(limit)
+
+        folded = pdf_tools.fold_accents(query)
+        phrase = re.compile(r"\s+".join(re.escape(w) for w in folded.split()), re.IGNORECASE)
+        words = [re.compile(re.escape(w), re.IGNORECASE) for w in folded.split()]
+        hits = []
+        with instrumentation.span('corpus_index.search'):
+            with contextlib.closing(self._connect()) as conn:
+                rows = conn.execute(sql, params).fetchall()
+            for path, page, chunks, snippet in rows:
+                chunks = json.loads(chunks)
+                rects = pdf_tools.chunk_match_rects(chunks, phrase, ignore_accents=True)
+                if not rects and len(words) > 1:
+                    for word in words:
+                        rects.extend(pdf_tools.chunk_match_rects(chunks, word, ignore_accents=True))
+                hits.append({'path': path, 'page': page, 'rects': rects, 'snippet': snippet})
+        return hits
+
+    def stats(self):
+        """Número de archivos y páginas indexados"""
+        with contextlib.closing(self._connect()) as conn:
+            files = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            pages = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {'files': files, 'pages': pages}
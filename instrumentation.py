@@ -0,0 +1,161 @@
+"""
+Instrumentación ligera de las rutas críticas (parseo con pypdf, rasterizado con
+poppler, conversión a PhotoImage y dibujado en Tk).
+
+Se configura con variables de entorno:
+  PDF_EDITOR_TRACE=1            activa los spans y contadores
+  PDF_EDITOR_TRACE_BUFFER=N     número de operaciones recientes que se conservan (4096)
+  PDF_EDITOR_TRACE_FILE=ruta    exporta un trace de Chrome (chrome://tracing, Perfetto) al salir
+                                (implica PDF_EDITOR_TRACE=1)
+
+Desactivada, span() devuelve un contexto vacío compartido y count() retorna enseguida,
+así que los puntos instrumentados no cuestan prácticamente nada.
+"""
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+_T0_NS = time.perf_counter_ns()
+_NULL_SPAN = contextlib.nullcontext()
+
+_enabled = (os.environ.get("PDF_EDITOR_TRACE", "") not in ("", "0")
+            or bool(os.environ.get("PDF_EDITOR_TRACE_FILE")))
+_lock = threading.Lock()
+_events = collections.deque(maxlen=int(os.environ.get("PDF_EDITOR_TRACE_BUFFER", "4096")))
+_counters = collections.Counter()
+
+
+def is_enabled():
+    return _enabled
+
+def set_enabled(enabled):
+    """Activa o desactiva la instrumentación en caliente (p.ej. desde la ventana de rendimiento)"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        with _lock:
+            _events.append(('X', self.name, self.cat, self.start, end - self.start,
+                            threading.get_ident(), self.args))
+        return False
+
+
+def span(name, cat='pdf', **args):
+    """
+    Mide la duración de un bloque:
+        with instrumentation.span('poppler.rasterize', pages=3):
+            ...
+    Los argumentos extra se guardan con el evento (se ven en el trace de Chrome).
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+def traced(name=None, cat='pdf'):
+    """Decorador que envuelve cada llamada a la función en un span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, value=1):
+    """Suma value al contador name (p.ej. páginas rasterizadas o bytes leídos)"""
+    if not _enabled:
+        return
+    now = time.perf_counter_ns()
+    with _lock:
+        _counters[name] += value
+        _events.append(('C', name, 'counter', now, 0, threading.get_ident(), {name: _counters[name]}))
+
+
+def recent(limit=200):
+    """
+    Últimos spans completados, del más reciente al más antiguo.
+    Cada uno es un diccionario {name, cat, start_ms, duration_ms, thread, args}.
+    """
+    with _lock:
+        spans = [e for e in _events if e[0] == 'X'][-limit:]
+    return [{
+        'name': name,
+        'cat': cat,
+        'start_ms': (start - _T0_NS) / 1e6,
+        'duration_ms': dur / 1e6,
+        'thread': tid,
+        'args': args
+    } for _, name, cat, start, dur, tid, args in reversed(spans)]
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+def summary():
+    """Totales por nombre de span sobre el buffer: {name: {count, total_ms, max_ms}}, ordenado por total"""
+    totals = {}
+    with _lock:
+        spans = [e for e in _events if e[0] == 'X']
+    for _, name, _cat, _start, dur, _tid, _args in spans:
+        entry = totals.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += dur / 1e6
+        entry['max_ms'] = max(entry['max_ms'], dur / 1e6)
+    return dict(sorted(totals.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+def reset():
+    with _lock:
+        _events.clear()
+        _counters.clear()
+
+def export_chrome_trace(path):
+    """
+    Escribe el buffer en formato Trace Event de Chrome (abrir con chrome://tracing o ui.perfetto.dev).
+    Retorna el número de eventos exportados.
+    """
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+    trace_events = []
+    for ph, name, cat, start, dur, tid, args in events:
+        event = {'name': name, 'cat': cat, 'ph': ph, 'ts': (start - _T0_NS) / 1000,
+                 'pid': pid, 'tid': tid, 'args': args}
+        if ph == 'X':
+            event['dur'] = dur / 1000
+        trace_events.append(event)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f, default=str)
+    os.replace(tmp_path, path)
+    return len(trace_events)
+
+
+_trace_file = os.environ.get("PDF_EDITOR_TRACE_FILE")
+if _trace_file:
+    atexit.register(export_chrome_trace, _trace_file)
@@ -0,0 +1,228 @@
+"""
+Diario de las ediciones pendientes (textos, imágenes y enlaces que aún no se aplicaron
+al PDF) para recuperarlas si el programa se cierra de forma inesperada.
+
+Cada sesión escribe un archivo JSON Lines propio (session-<pid>.jsonl) al que solo se
+añaden registros pequeños: añadir un elemento a una lista de pendientes o limpiarla.
+Un hilo en segundo plano los escribe por lotes y hace un único fsync por lote, así que
+la interfaz nunca espera al disco. Cuando el documento base cambia (se abre otro PDF,
+se aplica una operación, se deshace, se guarda) el diario se compacta a un solo
+registro con el estado completo: la recuperación cuesta lo que el número de ediciones
+desde entonces, no lo que el tamaño del documento.
+
+Al cerrar normalmente el diario se borra; al arrancar, un diario cuyo proceso ya no
+existe es de una sesión que terminó mal y se puede reproducir con replay().
+
+Se configura con variables de entorno:
+  PDF_EDITOR_JOURNAL_DIR=ruta    carpeta de los diarios (~/.cache/pdf_tools/journal)
+  PDF_EDITOR_JOURNAL_SYNC_MS=N   tiempo máximo que un registro espera su fsync (500)
+"""
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+import instrumentation
+
+JOURNAL_DIR = os.environ.get("PDF_EDITOR_JOURNAL_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "pdf_tools", "journal")
+SYNC_INTERVAL = int(os.environ.get("PDF_EDITOR_JOURNAL_SYNC_MS", "500")) / 1000
+# Registros por lote como máximo (una ráfaga de ediciones no retrasa el fsync indefinidamente)
+MAX_BATCH = 256
+# Listas de cambios pendientes que se registran
+KINDS = ('texts', 'images', 'links')
+
+
+def _empty_state(pdf_path=None):
+    return {'pdf_path': pdf_path, 'texts': [], 'images': [], 'links': []}
+
+def _fsync_directory(directory):
+    """Hace duradero un os.replace dentro de directory (no disponible en Windows)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EditJournal:
+    """
+    Diario de solo añadido de la sesión actual.
+        journal.append('add', kind='texts', item={...})
+        journal.snapshot({'pdf_path': ..., 'texts': [...], 'images': [...], 'links': [...]})
+    Los registros se serializan en el hilo que llama (las listas pueden cambiar después)
+    y se escriben en el hilo del diario.
+    """
+
+    def __init__(self, directory=None, sync_interval=SYNC_INTERVAL):
+        self.directory = directory or JOURNAL_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"session-{os.getpid()}.jsonl")
+        self.sync_interval = sync_interval
+        self._queue = queue.Queue()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, op, **fields):
+        """Añade un registro: op es 'add' (con kind e item) o 'clear' (con kind)"""
+        if self._closed:
+            return
+        record = {'op': op, 't': round(time.time(), 3), **fields}
+        self._queue.put(('append', json.dumps(record, ensure_ascii=False)))
+
+    def snapshot(self, state):
+        """Sustituye el diario por un único registro con el estado completo"""
+        if self._closed:
+            return
+        record = {'op': 'snapshot', 't': round(time.time(), 3), 'state': state}
+        self._queue.put(('snapshot', json.dumps(record, ensure_ascii=False)))
+
+    def flush(self, timeout=5):
+        """Espera a que todo lo registrado hasta ahora esté en disco"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self, discard=True, timeout=5):
+        """Termina el hilo del diario; con discard (cierre normal) borra el archivo"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(('close', discard))
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Agrupar lo que llegue durante el intervalo en un solo fsync
+            deadline = time.monotonic() + self.sync_interval
+            while batch[-1][0] == 'append' and len(batch) < MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                closing = self._write_batch(batch)
+            except OSError as e:
+                # Disco lleno, carpeta borrada...: se pierde la protección, no la sesión
+                print(f"Error al escribir el diario de ediciones: {e}")
+                closing = next((payload for kind, payload in batch if kind == 'close'), None)
+            for kind, payload in batch:
+                if kind == 'flush':
+                    payload.set()
+            if closing is not None:
+                self._finish(discard=closing)
+                return
+
+    def _write_batch(self, batch):
+        """Escribe un lote con un solo fsync; retorna el discard de un 'close' del lote o None"""
+        closing = None
+        lines = []
+        for kind, payload in batch:
+            if kind == 'append':
+                lines.append(payload)
+            elif kind == 'snapshot':
+                # El estado completo deja obsoleto todo lo anterior, incluido lo del lote
+                lines = []
+                self._rewrite(payload)
+            elif kind == 'close':
+                closing = payload
+        if lines:
+            with instrumentation.span('journal.fsync', records=len(lines)):
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            instrumentation.count('journal.records', len(lines))
+        return closing
+
+    def _rewrite(self, line):
+        """Compacta el diario de forma atómica: archivo nuevo con un registro y os.replace"""
+        tmp_path = f"{self.path}.tmp"
+        with instrumentation.span('journal.snapshot', bytes=len(line)):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            _fsync_directory(self.directory)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _finish(self, discard):
+        try:
+            self._file.close()
+            if discard:
+                os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        # os.kill(pid, 0) terminaría el proceso en Windows: sin comprobación fiable,
+        # se trata como huérfano todo diario que no sea de esta sesión
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def find_orphaned_journals(directory=None):
+    """Diarios de sesiones cuyo proceso ya no existe, del más reciente al más antiguo"""
+    orphans = []
+    for path in glob.glob(os.path.join(directory or JOURNAL_DIR, "session-*.jsonl")):
+        try:
+            pid = int(os.path.basename(path)[len("session-"):-len(".jsonl")])
+        except ValueError:
+            continue
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        orphans.append(path)
+    return sorted(orphans, key=os.path.getmtime, reverse=True)
+
+def replay(path):
+    """
+    Reproduce un diario y retorna el estado al que llegó la sesión:
+    {pdf_path, texts, images, links}. Una última línea incompleta (el proceso murió
+    a mitad de escritura) se ignora.
+    """
+    state = _empty_state()
+    with instrumentation.span('journal.replay'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                op = record.get('op')
+                if op == 'snapshot':
+                    state = {**_empty_state(), **record['state']}
+                elif op == 'add' and record.get('kind') in KINDS:
+                    state[record['kind']].append(record['item'])
+                elif op == 'clear' and record.get('kind') in KINDS:
+                    state[record['kind']] = []
+    return state
+
+def pending_count(state):
+    return sum(len(state[kind]) for kind in KINDS)
+
+def discard(path):
+    """Borra un diario ya recuperado o descartado"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,32 +1,252 @@
+import time
+import sys
+import importlib.util
+
+# Marcas de tiempo del arranque (ver print_startup_report)
+_STARTUP_T0 = time.perf_counter()
+_startup_marks = []
+
+def _mark_startup(label):
+    """Registra el tiempo transcurrido desde el inicio del proceso para una fase del arranque"""
+    _startup_marks.append((label, time.perf_counter() - _STARTUP_T0))
+
+def _lazy_import(name):
+    """Importa un módulo de forma diferida: se ejecuta en el primer acceso a un atributo"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
 import customtkinter as ctk
-from tkinter import filedialog, messagebox, Canvas, colorchooser
+from tkinter import filedialog, messagebox, Canvas, Label, Menu, colorchooser
+# customtkinter ya carga PIL.Image e ImageTk, así que importarlos aquí no cuesta nada
+from PIL import Image, ImageTk
 import os
-import pdf_tools
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+import re
 import threading
+import heapq
+# Solo biblioteca estándar: se puede importar en el arranque sin coste
+import instrumentation
+import journal
+_mark_startup("import customtkinter/tkinter/PIL")
+
+# pdf_tools arrastra pypdf: se carga la primera vez que se usa. Las dependencias
+# opcionales pesadas (reportlab, pdf2image, pdfplumber, pandas, pdf2docx, pyhanko, pikepdf)
+# se importan dentro de cada función de pdf_tools.
+pdf_tools = _lazy_import("pdf_tools")
+corpus_index = _lazy_import("corpus_index")
+_mark_startup("imports diferidos")
+
+# Módulos que no deberían cargarse durante el arranque
+HEAVY_MODULES = ('pypdf', 'reportlab', 'pdf2image', 'pdfplumber', 'pandas', 'pdf2docx', 'pyhanko', 'pikepdf')
+
+def print_startup_report():
+    """
+    Imprime en stderr el tiempo de cada fase del arranque y los módulos pesados
+    que ya se cargaron. Se activa con la variable de entorno PDF_EDITOR_STARTUP_REPORT=1
+    (para el detalle por módulo, usar python -X importtime main.py).
+    """
+    if not os.environ.get("PDF_EDITOR_STARTUP_REPORT"):
+        return
+    print("--- Informe de arranque ---", file=sys.stderr)
+    previous = 0.0
+    for label, elapsed in _startup_marks:
+        print(f"{elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:7.1f} ms)  {label}", file=sys.stderr)
+        previous = elapsed
+    
+    # Un módulo diferido que aún no se ejecutó sigue siendo de tipo _LazyModule
+    loaded = [m for m in HEAVY_MODULES
+              if m in sys.modules and type(sys.modules[m]).__name__ != '_LazyModule']
+    if loaded:
+        print(f"Módulos pesados cargados en el arranque: {', '.join(loaded)}", file=sys.stderr)
+    else:
+        print("Ningún módulo pesado cargado en el arranque.", file=sys.stderr)
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
+class RenderScheduler:
+    """
+    Cola de prioridad de páginas pendientes de renderizar (1-indexed).
+    Orden: páginas visibles, luego las vecinas y por último el resto como
+    prefetch en segundo plano. set_visible() la reprioriza al hacer scroll.
+    """
+    VISIBLE = 0
+    NEIGHBOR = 1
+    BACKGROUND = 2
+
+    def __init__(self, total_pages, neighbor_pages=2):
+        self.neighbor_pages = neighbor_pages
+        self._lock = threading.Lock()
+        self._pending = set(range(1, total_pages + 1))
+        self._visible = (1, 1)
+        self._heap = []
+        self._rebuild()
+
+    def _priority(self, page_num):
+        first, last = self._visible
+        if first <= page_num <= last:
+            return (self.VISIBLE, page_num - first)
+        distance = first - page_num if page_num < first else page_num - last
+        if distance <= self.neighbor_pages:
+            return (self.NEIGHBOR, distance)
+        return (self.BACKGROUND, distance)
+
+    def _rebuild(self):
+        self._heap = [(self._priority(p), p) for p in self._pending]
+        heapq.heapify(self._heap)
+
+    def set_visible(self, first, last):
+        """Actualiza el rango de páginas visibles y reordena la cola"""
+        with self._lock:
+            if (first, last) == self._visible:
+                return
+            self._visible = (first, last)
+            self._rebuild()
+
+    def next_page(self):
+        """Retorna la siguiente página a renderizar, o None si no quedan"""
+        with self._lock:
+            while self._heap:
+                _, page_num = heapq.heappop(self._heap)
+                if page_num in self._pending:
+                    self._pending.discard(page_num)
+                    return page_num
+            return None
+
+    def close(self):
+        """Vacía la cola; el hilo que la consume termina en la siguiente página"""
+        with self._lock:
+            self._pending.clear()
+            self._heap = []
+
+
+class EditHistory:
+    """
+    Pilas de deshacer/rehacer. Cada operación guarda dos diferencias por páginas
+    (pdf_tools.diff_pdf_pages): cómo volver a la versión anterior y cómo rehacerla.
+    Solo las páginas nuevas o modificadas se guardan, dentro de un PDF pequeño en memoria;
+    si se supera el presupuesto se descartan las operaciones más antiguas.
+    """
+    BUDGET = int(os.environ.get("PDF_EDITOR_UNDO_BUDGET_MB", "256")) * 1024 * 1024
+
+    def __init__(self, budget_bytes=None):
+        self.budget = self.BUDGET if budget_bytes is None else budget_bytes
+        self.undo_stack = []
+        self.redo_stack = []
+        self.memory_used = 0
+
+    def record(self, label, before_path, after_path):
+        """
+        Registra la operación que convirtió before_path en after_path.
+        Retorna las páginas (1-indexed) de after_path que cambiaron.
+        """
+        entry = {
+            'label': label,
+            'backward': pdf_tools.diff_pdf_pages(after_path, before_path),
+            'forward': pdf_tools.diff_pdf_pages(before_path, after_path)
+        }
+        entry['bytes'] = entry['backward']['size'] + entry['forward']['size']
+        self.undo_stack.append(entry)
+        self.memory_used += entry['bytes']
+        for dropped in self.redo_stack:
+            self.memory_used -= dropped['bytes']
+        self.redo_stack = []
+        self._enforce_budget()
+        return entry['forward']['changed']
+
+    def _enforce_budget(self):
+        while self.memory_used > self.budget and (self.undo_stack or self.redo_stack):
+            # Primero lo más lejano: lo más antiguo de deshacer y luego lo más nuevo de rehacer
+            dropped = self.undo_stack.pop(0) if self.undo_stack else self.redo_stack.pop(0)
+            self.memory_used -= dropped['bytes']
+
+    def _step(self, source, target, key, current_path):
+        import tempfile
+        entry = source.pop()
+        handle, output = tempfile.mkstemp(suffix=".pdf")
+        os.close(handle)
+        try:
+            pdf_tools.apply_pdf_diff(current_path, entry[key], output)
+        except Exception:
+            source.append(entry)
+            raise
+        target.append(entry)
+        return output, entry[key]['changed'], entry['label']
+
+    def undo(self, current_path):
+        """Reconstruye la versión anterior en un temporal. Retorna (ruta, páginas cambiadas, etiqueta)"""
+        return self._step(self.undo_stack, self.redo_stack, 'backward', current_path)
+
+    def redo(self, current_path):
+        return self._step(self.redo_stack, self.undo_stack, 'forward', current_path)
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def clear(self):
+        self.undo_stack = []
+        self.redo_stack = []
+        self.memory_used = 0
+
+
 class InteractivePDFViewer(ctk.CTkScrollableFrame):
     """Visor interactivo de PDF con capacidad de edición directa"""
+    # Borradores rápidos: escala de grises a baja resolución, varias páginas por llamada
+    DRAFT_DPI = 24
+    DRAFT_BATCH = 25
+    # Presupuesto de memoria para los bitmaps de las páginas (PIL + PhotoImage)
+    MEMORY_BUDGET = int(os.environ.get("PDF_EDITOR_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024
+
     def __init__(self, master, **kwargs):
         super().__init__(master, **kwargs)
         self.current_pdf = None
         self.zoom_level = 1.0
         self.zoom_mode = 'fit_width'  # 'fixed' or 'fit_width'
         self.pages_data = []  # Lista de {canvas, image, page_num, width, height}
+        # Índice de geometría (mediabox, cropbox, /Rotate) de todas las páginas del PDF actual
+        self.page_geometry = None
         self.interaction_mode = 'view'  # 'view', 'add_text', 'add_image', 'select_pages'
         self.on_click_callback = None
+        self.on_load_callback = None
+        # Recibe (ruta, páginas) cuando update_pages cambia solo algunas páginas
+        self.on_pages_changed_callback = None
+        self.on_selection_callback = None
         self.selected_pages = set()
         self.loading_active = False
         self.load_thread = None
+        # Cada carga recibe un ID de generación; los hilos y callbacks de
+        # generaciones anteriores se descartan en cuanto lo detectan
+        self.render_generation = 0
+        self._render_procs = set()
+        self._render_procs_lock = threading.Lock()
+        self.render_scheduler = None
+        self.visible_timer = None
+        # Re-render diferido de las páginas visibles tras un cambio de zoom
+        self.rerender_timer = None
+        self.zoom_generation = 0
+        # Bytes de bitmaps en memoria (suma de page_data['bytes']) y aviso a la barra de estado
+        self.memory_budget = self.MEMORY_BUDGET
+        self.memory_used = 0
+        self.memory_timer = None
+        self.on_memory_callback = None
         self.resize_timer = None
         self.last_width = 0
         
         # Vincular evento de resize para modo responsivo
         self.bind("<Configure>", self._on_container_resize)
         
+        # Interceptar el scroll para repriorizar el render de las páginas visibles
+        self._parent_canvas.configure(yscrollcommand=self._on_viewer_scroll)
+        
         # Info panel - oculto en el nuevo diseño pro
         self.info_frame = ctk.CTkFrame(self, height=1, fg_color="transparent")
         # self.info_frame.pack(fill="x", padx=5, pady=5)
@@ -36,78 +256,265 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
         
     def load_pdf(self, file_path):
         """Carga y muestra las páginas del PDF de forma incremental"""
-        # Cancelar cualquier carga activa previa
-        self.loading_active = False
-        if self.load_thread and self.load_thread.is_alive():
-            # Esperar un poco a que el hilo actual detecte el flag de parada
-            pass
-            
+        # La selección de páginas sobrevive a recargas del mismo archivo (p.ej. zoom)
+        kept_selection = self.selected_pages if file_path == self.current_pdf else set()
+        
+        # clear() cancela la generación anterior y mata sus procesos de poppler
         self.clear()
+        self.selected_pages = kept_selection
         self.current_pdf = file_path
         self.loading_active = True
         self.pages_data = [] # Reset data
+        gen = self.render_generation
         
         # Mostrar mensaje de carga inicial
         self.loading_label = ctk.CTkLabel(self, text="Cargando PDF...", 
                                          font=("Arial", 16, "bold"))
         self.loading_label.pack(pady=50)
         
+        if self.on_load_callback:
+            self.on_load_callback(file_path)
+        
+        # Medir el ancho disponible aquí: el hilo de carga no puede consultar a Tk
+        available_width = self._available_width() if self.zoom_mode == 'fit_width' else None
+        
         def load_incremental():
             try:
-                # Obtener número de páginas
-                total_pages = pdf_tools.get_pdf_page_count(file_path)
+                # Geometría de todas las páginas en una sola pasada (incluye el número de páginas)
+                geometry = pdf_tools.get_page_geometry(file_path)
+                total_pages = geometry['page_count']
+                if gen != self.render_generation:
+                    return
+                self.page_geometry = geometry
+                
+                if available_width is not None:
+                    self.zoom_level = self._fit_width_zoom(available_width, geometry)
                 
-                # Cargar dimensiones de la primera página para el cálculo de zoom inicial
-                pdf_w, pdf_h = pdf_tools.get_pdf_page_size(file_path, 1)
+                # Crear todos los huecos de página antes de renderizar para poder
+                # saltar a cualquier página y que se renderice primero
+                scheduler = RenderScheduler(total_pages)
+                self._post_to_ui(gen, self._create_page_placeholders, scheduler, geometry)
                 
-                for i in range(1, total_pages + 1):
-                    if not self.loading_active:
+                # Primera pasada en paralelo: borradores para que el documento sea
+                # navegable enseguida; esta pasada los sustituye por la versión final
+                threading.Thread(target=self._load_drafts, args=(gen, file_path, total_pages),
+                                 daemon=True).start()
+                
+                while True:
+                    # Frontera de página: un hilo obsoleto se detiene aquí
+                    if gen != self.render_generation:
                         return
+                    i = scheduler.next_page()
+                    if i is None:
+                        break
                         
-                    # Cargar una sola página a la vez
-                    img = pdf_tools.pdf_page_to_image(file_path, i, dpi=int(144 * self.zoom_level))
+                    # Cargar una sola página a la vez (el zoom puede cambiar durante la carga)
+                    dpi = self._target_dpi()
+                    img = pdf_tools.pdf_page_to_image(
+                        file_path, i, dpi=dpi,
+                        on_process=lambda proc: self._register_render_proc(gen, proc))
+                    self._prune_render_procs()
                     
-                    if img and self.loading_active:
+                    if img:
                         # Mostrar página en la UI
-                        self.after(0, lambda p=img, n=i, tp=total_pages, pw=pdf_w, ph=pdf_h: 
-                                   self._add_page_to_ui(p, n, tp, pw, ph))
+                        pdf_w, pdf_h = pdf_tools.get_page_display_size(geometry, i)
+                        self._post_to_ui(gen, self._add_page_to_ui, img, i, total_pages, pdf_w, pdf_h, dpi)
                 
                 # Al finalizar, remover label de carga
-                if self.loading_active:
-                    self.after(0, self._finalize_loading)
+                self._post_to_ui(gen, self._finalize_loading)
                 
             except Exception as e:
-                if self.loading_active:
-                    self.after(0, lambda msg=str(e): self._show_error(msg))
+                self._post_to_ui(gen, self._show_error, str(e))
         
-        if self.zoom_mode == 'fit_width':
-            self.update_idletasks()
-            available_width = self.winfo_width()
-            if available_width <= 1:
-                # Si aún no tiene ancho definido, usar el del maestro
-                parent = self.master
-                while parent and parent.winfo_width() <= 1:
-                    parent = parent.master
-                available_width = parent.winfo_width() - 300 if parent else 800
-            
-            # Obtener ancho real del PDF en puntos
-            try:
-                pdf_w, _ = pdf_tools.get_pdf_page_size(file_path, 1)
-            except:
-                pdf_w = 612.0
-            
-            # Pixel width at 144 DPI (2x 72)
-            base_pixel_width = pdf_w * 2.0
-            
-            if available_width > 100:
-                self.zoom_level = (available_width - 80) / base_pixel_width
-            else:
-                self.zoom_level = 0.8
-            self.last_width = available_width
-
         self.load_thread = threading.Thread(target=load_incremental, daemon=True)
         self.load_thread.start()
 
+    def update_pages(self, file_path, changed_pages):
+        """
+        Pasa a otra versión del mismo documento re-renderizando solo changed_pages (1-indexed).
+        Si cambió el número de páginas o la geometría de alguna otra página, o aún se está
+        cargando el documento, se recarga entero con load_pdf.
+        """
+        if self.loading_active or not self.pages_data or self.page_geometry is None:
+            self.load_pdf(file_path)
+            return
+        try:
+            geometry = pdf_tools.get_page_geometry(file_path)
+        except Exception:
+            self.load_pdf(file_path)
+            return
+        changed = {n for n in changed_pages if 1 <= n <= len(self.pages_data)}
+        old = self.page_geometry
+        if geometry['page_count'] != len(self.pages_data) or any(
+                geometry[key][i * width:(i + 1) * width] != old[key][i * width:(i + 1) * width]
+                for key, width in (('mediabox', 4), ('cropbox', 4), ('rotation', 1))
+                for i in range(geometry['page_count']) if i + 1 not in changed):
+            self.load_pdf(file_path)
+            return
+        
+        self.current_pdf = file_path
+        self.page_geometry = geometry
+        # Los re-renders en curso son del archivo anterior
+        self.zoom_generation += 1
+        for page_num in sorted(changed):
+            page_data = self.pages_data[page_num - 1]
+            pdf_w, pdf_h = pdf_tools.get_page_display_size(geometry, page_num)
+            page_data.update({
+                'pdf_width': pdf_w,
+                'pdf_height': pdf_h,
+                'pdf_box': pdf_tools.get_page_box(geometry, page_num),
+                'rotation': geometry['rotation'][page_num - 1]
+            })
+            page_data['canvas'].delete('search_highlight')
+            width, height = self._target_size(page_data)
+            self._resize_page(page_data, width, height, resample=False)
+            self._evict_page(page_data)
+            self._account_page(page_data)
+        self._rerender_visible()
+        
+        if self.on_pages_changed_callback:
+            self.on_pages_changed_callback(file_path, sorted(changed))
+
+    def _available_width(self):
+        """Ancho en píxeles disponible para las páginas del visor"""
+        self.update_idletasks()
+        available_width = self.winfo_width()
+        if available_width <= 1:
+            # Si aún no tiene ancho definido, usar el del maestro
+            parent = self.master
+            while parent and parent.winfo_width() <= 1:
+                parent = parent.master
+            available_width = parent.winfo_width() - 300 if parent else 800
+        return available_width
+
+    def _fit_width_zoom(self, available_width, geometry=None):
+        """Calcula el zoom que ajusta la página más ancha al ancho disponible"""
+        geometry = geometry or self.page_geometry
+        # Ancho real del PDF en puntos, según el índice de geometría
+        if geometry and geometry['page_count']:
+            pdf_w = max(pdf_tools.get_page_display_size(geometry, p)[0]
+                        for p in range(1, geometry['page_count'] + 1))
+        else:
+            pdf_w = 612.0
+        
+        # Pixel width at 144 DPI (2x 72)
+        base_pixel_width = pdf_w * 2.0
+        self.last_width = available_width
+        
+        if available_width > 100:
+            return (available_width - 80) / base_pixel_width
+        return 0.8
+
+    def _target_dpi(self):
+        """Resolución de render para el zoom actual (144 DPI al 100%)"""
+        return int(144 * self.zoom_level)
+
+    def _target_size(self, page_data):
+        """Tamaño en píxeles que debe mostrar una página con el zoom actual"""
+        return (max(1, int(page_data['pdf_width'] * 2.0 * self.zoom_level)),
+                max(1, int(page_data['pdf_height'] * 2.0 * self.zoom_level)))
+
+    def _load_drafts(self, gen, file_path, total_pages):
+        """Renderiza borradores de baja resolución por lotes con una llamada a poppler por lote"""
+        try:
+            for first in range(1, total_pages + 1, self.DRAFT_BATCH):
+                if gen != self.render_generation:
+                    return
+                last = min(first + self.DRAFT_BATCH - 1, total_pages)
+                drafts = pdf_tools.render_pages(
+                    file_path, first, last, dpi=self.DRAFT_DPI, grayscale=True,
+                    on_process=lambda proc: self._register_render_proc(gen, proc))
+                self._prune_render_procs()
+                
+                for offset, img in enumerate(drafts):
+                    self._post_to_ui(gen, self._add_draft_to_ui, img, first + offset)
+        except Exception as e:
+            # Los borradores son opcionales; la pasada final reporta los errores reales
+            print(f"Error al generar borradores: {e}")
+
+    def _cancel_render(self):
+        """Invalida la generación de render actual y mata sus procesos de poppler"""
+        self.render_generation += 1
+        self.loading_active = False
+        if self.render_scheduler:
+            self.render_scheduler.close()
+            self.render_scheduler = None
+        with self._render_procs_lock:
+            procs = list(self._render_procs)
+            self._render_procs.clear()
+        for proc in procs:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def _register_render_proc(self, gen, proc):
+        """Registra un proceso de poppler lanzado por la generación gen"""
+        with self._render_procs_lock:
+            if gen == self.render_generation:
+                self._render_procs.add(proc)
+                return
+        # La generación ya fue cancelada mientras se lanzaba el proceso
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+    def _prune_render_procs(self):
+        """Olvida los procesos de poppler que ya terminaron"""
+        with self._render_procs_lock:
+            self._render_procs = {p for p in self._render_procs if p.poll() is None}
+
+    def _on_viewer_scroll(self, first, last):
+        """Reenvía el scroll a la barra y reprioriza el render con debounce"""
+        self._scrollbar.set(first, last)
+        if self.visible_timer:
+            self.after_cancel(self.visible_timer)
+        self.visible_timer = self.after(50, self._update_render_priorities)
+
+    def _update_render_priorities(self):
+        """Informa al scheduler de qué páginas están ahora en pantalla"""
+        self.visible_timer = None
+        if not self.render_scheduler:
+            return
+        visible = self._visible_page_range()
+        if visible:
+            self.render_scheduler.set_visible(*visible)
+            self._refresh_visible_pages(*visible)
+
+    def _visible_page_range(self):
+        """Retorna (primera, última) página visible en el área de scroll, o None"""
+        total_height = self._get_scroll_height()
+        if not self.pages_data or total_height <= 0:
+            return None
+        top, bottom = self._parent_canvas.yview()
+        top_px = top * total_height
+        bottom_px = bottom * total_height
+        
+        first = last = None
+        for page_data in self.pages_data:
+            frame = page_data['frame']
+            y = frame.winfo_y()
+            if y + frame.winfo_height() < top_px:
+                continue
+            if y > bottom_px:
+                break
+            if first is None:
+                first = page_data['page_num']
+            last = page_data['page_num']
+        return (first, last) if first is not None else None
+
+    def _post_to_ui(self, gen, func, *args):
+        """Encola func en el hilo de Tk; se descarta si la generación quedó obsoleta"""
+        def dispatch():
+            if gen == self.render_generation:
+                func(*args)
+        try:
+            self.after(0, dispatch)
+        except RuntimeError:
+            # El intérprete de Tk ya no está disponible (cierre de la app)
+            pass
+
     def _on_container_resize(self, event):
         """Maneja el redimensionamiento del contenedor con debounce"""
         if self.zoom_mode == 'fit_width' and self.current_pdf:
@@ -128,72 +535,333 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
             return
             
         self.update_idletasks()
-        available_width = self.winfo_width() - 80
-        if available_width < 100: return
+        available_width = self.winfo_width()
+        if available_width - 80 < 100: return
 
-        # Obtener ancho real del PDF
-        try:
-            pdf_w, _ = pdf_tools.get_pdf_page_size(self.current_pdf, 1)
-        except:
-            pdf_w = 612.0
-            
-        # Usamos el mismo factor que en load_pdf (144 DPI = 2.0x 72 DPI)
-        base_pixel_width = pdf_w * 2.0
-        new_zoom = available_width / base_pixel_width
+        # Mismo cálculo que en load_pdf, con el ancho de página del índice de geometría
+        new_zoom = self._fit_width_zoom(available_width)
         
         # Si el zoom cambia significativamente, recargamos para calidad
         if abs(new_zoom - self.zoom_level) > 0.05:
             self.set_zoom(new_zoom, mode='fit_width')
     
-    def _add_page_to_ui(self, img, page_num, total_pages, pdf_w, pdf_h):
-        """Agrega una sola página a la interfaz de forma dinámica"""
-        if page_num == 1:
-            if hasattr(self, 'loading_label') and self.loading_label.winfo_exists():
-                self.loading_label.destroy()
-        
-        # El info_label ya no se actualiza aquí, se hará en el controlador de la App
-        
-        # Frame para cada página con sombra/borde sutil
-        page_frame = ctk.CTkFrame(self, fg_color="white", border_width=1, border_color="#cccccc")
-        page_frame.pack(pady=15, padx=20)
-        
-        # Canvas para la imagen (interactivo)
-        canvas = Canvas(page_frame, width=img.width, height=img.height, 
-                      highlightthickness=0, bg='white')
-        canvas.pack(padx=2, pady=2)
+    def _create_page_placeholders(self, scheduler, geometry):
+        """Crea un hueco vacío por página con el tamaño que tendrá una vez renderizada"""
+        if hasattr(self, 'loading_label') and self.loading_label.winfo_exists():
+            self.loading_label.destroy()
+        self.render_scheduler = scheduler
         
-        # Convertir PIL Image a PhotoImage
-        photo = ImageTk.PhotoImage(img)
-        canvas.create_image(0, 0, anchor='nw', image=photo)
-        canvas.image = photo  # Mantener referencia
+        with instrumentation.span('tk.create_placeholders', cat='tk', pages=geometry['page_count']):
+            self._pack_page_placeholders(geometry)
         
-        # Guardar datos de la página
-        page_data = {
-            'canvas': canvas,
+        self._update_render_priorities()
+
+    def _pack_page_placeholders(self, geometry):
+        for page_num in range(1, geometry['page_count'] + 1):
+            # Cada página con su propio tamaño (documentos con páginas mixtas)
+            pdf_w, pdf_h = pdf_tools.get_page_display_size(geometry, page_num)
+            # 144 DPI * zoom sobre 72 puntos por pulgada
+            width, height = self._target_size({'pdf_width': pdf_w, 'pdf_height': pdf_h})
+            
+            # Frame para cada página con sombra/borde sutil
+            page_frame = ctk.CTkFrame(self, fg_color="white", border_width=1, border_color="#cccccc")
+            page_frame.pack(pady=15, padx=20)
+            
+            # Canvas para la imagen (interactivo)
+            canvas = Canvas(page_frame, width=width, height=height, 
+                          highlightthickness=0, bg='white')
+            canvas.pack(padx=2, pady=2)
+            canvas.create_text(width // 2, height // 2, text=f"Página {page_num}", 
+                             fill='#999999', font=('Arial', 14), tags='placeholder')
+            
+            # Guardar datos de la página (image/photo llegan al renderizar)
+            page_data = {
+                'canvas': canvas,
+                'image': None,
+                'photo': None,
+                'page_num': page_num,
+                'width': width,
+                'height': height,
+                'pdf_width': pdf_w,
+                'pdf_height': pdf_h,
+                'pdf_box': pdf_tools.get_page_box(geometry, page_num),
+                'rotation': geometry['rotation'][page_num - 1],
+                'frame': page_frame,
+                'rendered': False,
+                'dpi': None,
+                'draft_image': None,
+                'needs_refresh': False,
+                'evicted': False,
+                'bytes': 0,
+                # Textos/imágenes pendientes compuestos sobre el bitmap: {'texts': [...], 'images': [...]}
+                'previews': None
+            }
+            self.pages_data.append(page_data)
+            
+            # Eventos de mouse
+            canvas.bind('<Button-1>', lambda e, pd=page_data: self._on_canvas_click(e, pd))
+            canvas.bind('<Motion>', lambda e, pd=page_data: self._on_canvas_motion(e, pd))
+            
+            # Si hay páginas seleccionadas, marcarlas
+            if page_num in self.selected_pages:
+                self._draw_selection_overlay(canvas, width, height)
+
+    def _add_draft_to_ui(self, img, page_num):
+        """Muestra un borrador escalado en el hueco de la página si aún no tiene la versión final"""
+        if not 1 <= page_num <= len(self.pages_data):
+            return
+        page_data = self.pages_data[page_num - 1]
+        if page_data['rendered']:
+            return
+        page_data['draft_image'] = img
+        self._refresh_page_bitmap(page_data)
+
+    def _add_page_to_ui(self, img, page_num, total_pages, pdf_w, pdf_h, dpi=None):
+        """Coloca la imagen renderizada de una página en su hueco"""
+        if not 1 <= page_num <= len(self.pages_data):
+            return
+        page_data = self.pages_data[page_num - 1]
+        page_data.update({
             'image': img,
-            'photo': photo,
-            'page_num': page_num,
-            'width': img.width,
-            'height': img.height,
+            'dpi': dpi,
             'pdf_width': pdf_w,
             'pdf_height': pdf_h,
-            'frame': page_frame
-        }
-        self.pages_data.append(page_data)
+            'rendered': True,
+            'draft_image': None,
+            'evicted': False
+        })
+        
+        # Si el zoom cambió mientras se renderizaba, se muestra reescalada
+        # hasta que llegue el re-render a la nueva resolución
+        width, height = self._target_size(page_data)
+        if abs(img.width - width) <= 2 and abs(img.height - height) <= 2:
+            width, height = img.width, img.height
+        with instrumentation.span('viewer.add_page', cat='tk', page=page_num):
+            self._resize_page(page_data, width, height, resample=True)
+        instrumentation.count('viewer.pages_rendered')
+
+    def _resize_page(self, page_data, width, height, resample):
+        """
+        Cambia el tamaño mostrado de una página y reescala sus overlays.
+        resample: si es True reescala el bitmap ya; si no, se hará al volverse visible.
+        """
+        canvas = page_data['canvas']
+        old_width, old_height = page_data['width'], page_data['height']
+        if (width, height) != (old_width, old_height):
+            canvas.configure(width=width, height=height)
+            # Los overlays están en píxeles de imagen: se escalan con la página
+            scale_x, scale_y = width / old_width, height / old_height
+            for tag in ('overlay', 'search_highlight'):
+                canvas.scale(tag, 0, 0, scale_x, scale_y)
+            page_data['width'], page_data['height'] = width, height
+            
+            if canvas.find_withtag('placeholder'):
+                canvas.coords('placeholder', width // 2, height // 2)
+            if page_data['page_num'] in self.selected_pages:
+                canvas.delete('selection')
+                self._draw_selection_overlay(canvas, width, height)
+        
+        if resample:
+            self._refresh_page_bitmap(page_data)
+        elif page_data['rendered'] and page_data['image'] is None:
+            # Sin copia PIL (liberada por el presupuesto) no se puede reescalar después:
+            # se vuelve a renderizar cuando la página sea visible
+            self._evict_page(page_data)
+        else:
+            # Liberar el bitmap con tamaño obsoleto; se regenera al hacerse visible
+            canvas.delete('page_image')
+            canvas.image = None
+            page_data['photo'] = None
+            page_data['needs_refresh'] = True
+        self._account_page(page_data)
+
+    def _refresh_page_bitmap(self, page_data):
+        """Dibuja el mejor bitmap disponible (final o borrador) al tamaño actual de la página"""
+        source = page_data['image'] or page_data['draft_image']
+        page_data['needs_refresh'] = False
+        if source is None and page_data['photo'] is not None:
+            # La copia PIL se liberó por el presupuesto de memoria: se re-deriva del PhotoImage
+            source = ImageTk.getimage(page_data['photo']).convert('RGB')
+        if source is None:
+            return
         
-        # Ordenar por número de página para evitar desorden por hilos
-        self.pages_data.sort(key=lambda x: x['page_num'])
+        size = (page_data['width'], page_data['height'])
+        if source.size != size:
+            # Reescalado rápido; la versión nítida llega con el re-render diferido
+            with instrumentation.span('pil.resize', cat='tk', page=page_data['page_num']):
+                source = source.resize(size, Image.BILINEAR)
+        
+        previews = page_data['previews']
+        if previews:
+            # Vista previa fiel de los cambios pendientes; el bitmap original no se toca
+            with instrumentation.span('pil.compose_preview', cat='tk', page=page_data['page_num']):
+                source = pdf_tools.compose_overlay_preview(
+                    source, page_data['pdf_box'], page_data['rotation'],
+                    texts=previews['texts'], images=previews['images'])
+        
+        canvas = page_data['canvas']
+        # Convertir PIL Image a PhotoImage
+        with instrumentation.span('tk.PhotoImage', cat='tk', page=page_data['page_num']):
+            photo = ImageTk.PhotoImage(source)
+        with instrumentation.span('tk.canvas_draw', cat='tk', page=page_data['page_num']):
+            canvas.delete('placeholder')
+            canvas.delete('page_image')
+            canvas.create_image(0, 0, anchor='nw', image=photo, tags='page_image')
+            # Los overlays dibujados antes del render deben quedar encima
+            canvas.tag_lower('page_image')
+        canvas.image = photo  # Mantener referencia
+        page_data['photo'] = photo
+        self._account_page(page_data)
+
+    @staticmethod
+    def _page_memory(page_data):
+        """Bytes que ocupan los bitmaps de una página (PhotoImage guarda 4 bytes por píxel)"""
+        total = 0
+        for key in ('image', 'draft_image'):
+            img = page_data[key]
+            if img is not None:
+                total += img.width * img.height * len(img.getbands())
+        photo = page_data['photo']
+        if photo is not None:
+            total += photo.width() * photo.height() * 4
+        return total
+
+    def _account_page(self, page_data):
+        """Actualiza la cuenta de memoria de una página y programa la revisión del presupuesto"""
+        size = self._page_memory(page_data)
+        self.memory_used += size - page_data['bytes']
+        page_data['bytes'] = size
+        if self.memory_timer is None:
+            # Una sola revisión por ráfaga de cambios (p.ej. varias páginas llegando a la vez)
+            self.memory_timer = self.after_idle(self._check_memory_budget)
+
+    def set_memory_budget(self, budget_bytes):
+        """Cambia el presupuesto de memoria de los bitmaps y lo aplica de inmediato"""
+        self.memory_budget = budget_bytes
+        self._check_memory_budget()
+
+    def _check_memory_budget(self):
+        """
+        Si los bitmaps superan el presupuesto, libera memoria empezando por las
+        páginas más alejadas de la vista:
+          1. se descarta la copia PIL de las páginas que ya tienen su PhotoImage
+             (si hace falta reescalarlas se re-deriva del PhotoImage);
+          2. si no basta, se liberan por completo las páginas no visibles, que
+             vuelven a renderizarse al aparecer en pantalla.
+        """
+        self.memory_timer = None
+        if self.memory_used > self.memory_budget and self.pages_data:
+            first, last = self._visible_page_range() or (1, 1)
+            
+            def distance(page_data):
+                page_num = page_data['page_num']
+                return first - page_num if page_num < first else max(0, page_num - last)
+            
+            candidates = sorted(self.pages_data, key=distance, reverse=True)
+            for page_data in candidates:
+                if self.memory_used <= self.memory_budget:
+                    break
+                # Las páginas con vista previa conservan su copia PIL limpia para recomponerla
+                if page_data['photo'] is not None and not page_data['needs_refresh'] and \
+                        not page_data['previews'] and \
+                        (page_data['image'] is not None or page_data['draft_image'] is not None):
+                    page_data['image'] = None
+                    page_data['draft_image'] = None
+                    self._account_page(page_data)
+            
+            for page_data in candidates:
+                if self.memory_used <= self.memory_budget or distance(page_data) == 0:
+                    break
+                if page_data['bytes']:
+                    self._evict_page(page_data)
+                    self._account_page(page_data)
+            
+            if self.memory_timer is not None:
+                # Las cuentas de arriba no necesitan otra revisión
+                self.after_cancel(self.memory_timer)
+                self.memory_timer = None
+        
+        if self.on_memory_callback:
+            self.on_memory_callback(self.memory_used, self.memory_budget)
+
+    def _evict_page(self, page_data):
+        """Libera todos los bitmaps de una página y vuelve a mostrar su hueco vacío"""
+        canvas = page_data['canvas']
+        canvas.delete('page_image')
+        canvas.image = None
+        if not canvas.find_withtag('placeholder'):
+            canvas.create_text(page_data['width'] // 2, page_data['height'] // 2,
+                               text=f"Página {page_data['page_num']}",
+                               fill='#999999', font=('Arial', 14), tags='placeholder')
+            canvas.tag_lower('placeholder')
+        was_rendered = page_data['rendered']
+        page_data.update({
+            'image': None,
+            'photo': None,
+            'draft_image': None,
+            'rendered': False,
+            'dpi': None,
+            'needs_refresh': False,
+            'evicted': was_rendered or page_data['evicted']
+        })
+
+    def _refresh_visible_pages(self, first, last):
+        """Reescala las páginas visibles pendientes y programa su re-render si su DPI quedó viejo"""
+        dpi = self._target_dpi()
+        stale_dpi = False
+        for page_data in self.pages_data[first - 1:last]:
+            if page_data['needs_refresh']:
+                self._refresh_page_bitmap(page_data)
+            if page_data['evicted'] or (page_data['rendered'] and page_data['dpi'] != dpi):
+                stale_dpi = True
+        if stale_dpi:
+            self._schedule_rerender()
+
+    def _schedule_rerender(self, delay=400):
+        """Programa (con debounce) el re-render de las páginas visibles a la resolución actual"""
+        if self.rerender_timer:
+            self.after_cancel(self.rerender_timer)
+        self.rerender_timer = self.after(delay, self._rerender_visible)
+
+    def _rerender_visible(self):
+        """
+        Re-renderiza en segundo plano solo las páginas visibles cuyo bitmap es de otro zoom
+        o que fueron liberadas por el presupuesto de memoria
+        """
+        self.rerender_timer = None
+        visible = self._visible_page_range()
+        if not visible or not self.current_pdf:
+            return
         
-        # Ordenar por número de página si es necesario (Threading podría desordenarlas, 
-        # aunque aquí las cargamos secuencialmente en el hilo)
+        dpi = self._target_dpi()
+        first, last = visible
+        stale = [pd for pd in self.pages_data[first - 1:last]
+                 if pd['evicted'] or (pd['rendered'] and pd['dpi'] != dpi)]
+        if not stale:
+            return
         
-        # Eventos de mouse
-        canvas.bind('<Button-1>', lambda e, pd=page_data: self._on_canvas_click(e, pd))
-        canvas.bind('<Motion>', lambda e, pd=page_data: self._on_canvas_motion(e, pd))
+        # Un nuevo zoom invalida cualquier re-render anterior todavía en curso
+        self.zoom_generation += 1
+        token = self.zoom_generation
+        gen = self.render_generation
+        file_path = self.current_pdf
+        jobs = [(pd['page_num'], pd['pdf_width'], pd['pdf_height']) for pd in stale]
         
-        # Si hay páginas seleccionadas, marcarlas
-        if page_num in self.selected_pages:
-            self._draw_selection_overlay(canvas, img.width, img.height)
+        def rerender():
+            try:
+                for page_num, pdf_w, pdf_h in jobs:
+                    if gen != self.render_generation or token != self.zoom_generation:
+                        return
+                    img = pdf_tools.pdf_page_to_image(
+                        file_path, page_num, dpi=dpi,
+                        on_process=lambda proc: self._register_render_proc(gen, proc))
+                    self._prune_render_procs()
+                    if img:
+                        self._post_to_ui(gen, self._add_page_to_ui, img, page_num, None, pdf_w, pdf_h, dpi)
+            except Exception as e:
+                print(f"Error al re-renderizar páginas: {e}")
+        
+        threading.Thread(target=rerender, daemon=True).start()
 
     def _finalize_loading(self):
         """Limpieza al finalizar la carga"""
@@ -216,19 +884,47 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
         pass
     
     def _image_to_pdf_coords(self, img_x, img_y, page_data):
-        """Convierte coordenadas de imagen a coordenadas PDF"""
+        """Convierte coordenadas de imagen a coordenadas PDF (respeta mediabox y /Rotate)"""
         # Calcular escala
         scale_x = page_data['pdf_width'] / page_data['width']
         scale_y = page_data['pdf_height'] / page_data['height']
         
-        # Convertir X (igual dirección)
-        pdf_x = img_x * scale_x
-        
-        # Convertir Y (invertir porque PDF usa origen en esquina inferior izquierda)
-        pdf_y = page_data['pdf_height'] - (img_y * scale_y)
-        
-        return pdf_x, pdf_y
+        # Posición en puntos dentro de la página tal como se ve (origen arriba a la izquierda)
+        u = img_x * scale_x
+        v = img_y * scale_y
+        
+        # Deshacer la rotación de visualización; PDF usa origen en esquina inferior izquierda
+        x0, y0, x1, y1 = page_data.get('pdf_box', (0, 0, page_data['pdf_width'], page_data['pdf_height']))
+        rotation = page_data.get('rotation', 0)
+        if rotation == 90:
+            return x0 + v, y0 + u
+        if rotation == 180:
+            return x1 - u, y0 + v
+        if rotation == 270:
+            return x1 - v, y1 - u
+        return x0 + u, y1 - v
     
+    def set_page_previews(self, page_num, texts=(), images=()):
+        """
+        Muestra textos e imágenes pendientes de una página compuestos sobre su bitmap
+        con la misma apariencia que tendrán en el PDF. Solo se recompone esa página.
+        """
+        if not 1 <= page_num <= len(self.pages_data):
+            return
+        page_data = self.pages_data[page_num - 1]
+        page_data['previews'] = {'texts': list(texts), 'images': list(images)} if texts or images else None
+        if page_data['image'] is not None or page_data['draft_image'] is not None:
+            self._refresh_page_bitmap(page_data)
+        elif page_data['rendered']:
+            # El presupuesto de memoria liberó la copia PIL: volver a renderizar la página
+            self._evict_page(page_data)
+            self._account_page(page_data)
+            self._schedule_rerender(delay=0)
+
+    def preview_pages(self):
+        """Páginas que muestran ahora una vista previa de cambios pendientes"""
+        return {pd['page_num'] for pd in self.pages_data if pd['previews']}
+
     def draw_text_overlay(self, page_num, x, y, text, font_size=12):
         """Dibuja un overlay de texto en la posición especificada"""
         if page_num <= len(self.pages_data):
@@ -269,14 +965,22 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
                                   outline='green', width=2, dash=(5, 5), tags='overlay')
     
     def _pdf_to_image_coords(self, pdf_x, pdf_y, page_data):
-        """Convierte coordenadas PDF a coordenadas de imagen"""
+        """Convierte coordenadas PDF a coordenadas de imagen (respeta mediabox y /Rotate)"""
         scale_x = page_data['width'] / page_data['pdf_width']
         scale_y = page_data['height'] / page_data['pdf_height']
         
-        img_x = pdf_x * scale_x
-        img_y = (page_data['pdf_height'] - pdf_y) * scale_y
+        x0, y0, x1, y1 = page_data.get('pdf_box', (0, 0, page_data['pdf_width'], page_data['pdf_height']))
+        rotation = page_data.get('rotation', 0)
+        if rotation == 90:
+            u, v = pdf_y - y0, pdf_x - x0
+        elif rotation == 180:
+            u, v = x1 - pdf_x, pdf_y - y0
+        elif rotation == 270:
+            u, v = y1 - pdf_y, x1 - pdf_x
+        else:
+            u, v = pdf_x - x0, y1 - pdf_y
         
-        return img_x, img_y
+        return u * scale_x, v * scale_y
     
     def clear_overlays(self):
         """Limpia todos los overlays"""
@@ -284,26 +988,44 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
             page_data['canvas'].delete('overlay')
             page_data['canvas'].delete('search_highlight')
 
+    def rename_file(self, file_path):
+        """El documento mostrado se guardó como file_path con las mismas páginas: se sigue leyendo de ahí"""
+        self.current_pdf = file_path
+
+    def clear_search_highlights(self):
+        for page_data in self.pages_data:
+            page_data['canvas'].delete('search_highlight')
+
+    def _search_rect_to_canvas(self, page_data, rect):
+        """Rectángulo de búsqueda [x, y, w, h] en puntos PDF a coordenadas del canvas"""
+        x, y, w, h = rect
+        # En PDF (x,y) es esquina inferior izquierda. Para el canvas necesitamos esquina superior izquierda.
+        img_x, img_y = self._pdf_to_image_coords(x, y + h, page_data)
+        scale_x = page_data['width'] / page_data['pdf_width']
+        scale_y = page_data['height'] / page_data['pdf_height']
+        return img_x, img_y, img_x + w * scale_x, img_y + h * scale_y
+
+    def scroll_to_page(self, page_num):
+        if 1 <= page_num <= len(self.pages_data):
+            self.see(self.pages_data[page_num - 1]['frame'])
+
     def highlight_search_result(self, page_num, rect):
         """Resalta un área de búsqueda en el visor"""
         if page_num <= len(self.pages_data):
             page_data = self.pages_data[page_num - 1]
-            canvas = page_data['canvas']
-            
-            x, y, w, h = rect
-            # Convertir coordenadas PDF a coordenadas de imagen
-            # En PDF (x,y) es esquina inferior izquierda. Para el canvas necesitamos esquina superior izquierda.
-            img_x, img_y = self._pdf_to_image_coords(x, y + h, page_data)
-            
-            # Convertir dimensiones
-            scale_x = page_data['width'] / page_data['pdf_width']
-            scale_y = page_data['height'] / page_data['pdf_height']
-            img_w = w * scale_x
-            img_h = h * scale_y
-            
             # Dibujar rectángulo amarillo semi-transparente
-            canvas.create_rectangle(img_x, img_y, img_x + img_w, img_y + img_h,
-                                  fill='#ffff00', outline='#cc9900', stipple='gray50', width=1, tags='search_highlight')
+            page_data['canvas'].create_rectangle(*self._search_rect_to_canvas(page_data, rect),
+                                                 fill='#ffff00', outline='#cc9900', stipple='gray50', width=1, tags='search_highlight')
+
+    def mark_current_search_result(self, page_num, rect):
+        """Destaca la coincidencia actual de la navegación siguiente/anterior"""
+        for page_data in self.pages_data:
+            page_data['canvas'].delete('search_current')
+        if page_num <= len(self.pages_data):
+            page_data = self.pages_data[page_num - 1]
+            # También lleva la etiqueta search_highlight: se escala y se borra con los demás resaltados
+            page_data['canvas'].create_rectangle(*self._search_rect_to_canvas(page_data, rect),
+                                                 outline='#ff6600', width=2, tags=('search_highlight', 'search_current'))
     
     def toggle_page_selection(self, page_num):
         """Marca/desmarca una página para eliminación"""
@@ -320,12 +1042,16 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
             
             if page_num in self.selected_pages:
                 self._draw_selection_overlay(canvas, page_data['width'], page_data['height'])
+        
+        if self.on_selection_callback:
+            self.on_selection_callback()
     
     def _draw_selection_overlay(self, canvas, width, height):
         """Dibuja overlay de selección"""
+        label = "ELIMINAR" if self.interaction_mode == 'select_pages' else "SELECCIONADA"
         canvas.create_rectangle(0, 0, width, height, 
                               fill='red', stipple='gray50', tags='selection')
-        canvas.create_text(width//2, height//2, text="ELIMINAR", 
+        canvas.create_text(width//2, height//2, text=label, 
                          fill='white', font=('Arial', 24, 'bold'), tags='selection')
     
     def _show_error(self, error_msg):
@@ -337,19 +1063,44 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
     
     def clear(self):
         """Limpia el visor y detiene cargas activas"""
-        self.loading_active = False
+        self._cancel_render()
         for widget in self.winfo_children():
             if widget != self.info_frame:
                 widget.destroy()
         self.pages_data = []
+        self.page_geometry = None
         self.selected_pages = set()
+        self.memory_used = 0
+        if self.on_memory_callback:
+            self.on_memory_callback(self.memory_used, self.memory_budget)
     
     def set_zoom(self, zoom, mode='fixed'):
-        """Ajusta el nivel de zoom y recarga el PDF"""
-        self.zoom_level = zoom
+        """
+        Ajusta el nivel de zoom reescalando al instante los bitmaps ya cargados.
+        Las páginas visibles se re-renderizan a la nueva resolución con debounce.
+        """
         self.zoom_mode = mode
-        if self.current_pdf:
+        if not self.current_pdf:
+            self.zoom_level = zoom
+            return
+        if mode == 'fit_width':
+            zoom = self._fit_width_zoom(self._available_width())
+        self.zoom_level = zoom
+        
+        if not self.pages_data:
+            # Aún no hay huecos de página: cargar directamente al nuevo zoom
             self.load_pdf(self.current_pdf)
+            return
+        
+        # Calcular lo visible antes de cambiar el layout para mantener la posición
+        first, last = self._visible_page_range() or (1, 1)
+        for page_data in self.pages_data:
+            width, height = self._target_size(page_data)
+            on_screen = first <= page_data['page_num'] <= last
+            self._resize_page(page_data, width, height, resample=on_screen)
+        
+        self.see(self.pages_data[first - 1]['frame'])
+        self._schedule_rerender()
     
     def set_interaction_mode(self, mode):
         """Cambia el modo de interacción"""
@@ -373,6 +1124,13 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
             if total_height > 0:
                 fraction = widget_y / total_height
                 canvas.yview_moveto(fraction)
+            
+            # Renderizar primero la página de destino, sin esperar al debounce del scroll
+            if self.render_scheduler:
+                for page_data in self.pages_data:
+                    if page_data['frame'] == widget:
+                        self.render_scheduler.set_visible(page_data['page_num'], page_data['page_num'])
+                        break
         except Exception as e:
             print(f"Error en viewer.see: {e}")
 
@@ -381,6 +1139,176 @@ class InteractivePDFViewer(ctk.CTkScrollableFrame):
         return self._container.winfo_height()
 
 
+class ThumbnailStrip(ctk.CTkScrollableFrame):
+    """
+    Barra lateral de miniaturas del documento abierto en el visor.
+    Clic: salta a la página. Ctrl+clic (o clic en modo selección): marca/desmarca
+    la página en viewer.selected_pages, que usan eliminar, dividir y reordenar.
+    Las miniaturas se guardan en el cache de disco de pdf_tools por hash de archivo.
+    """
+    THUMB_DPI = 14
+    THUMB_BATCH = 25
+
+    def __init__(self, master, viewer, **kwargs):
+        super().__init__(master, **kwargs)
+        self.viewer = viewer
+        self.current_pdf = None
+        self.file_key = None
+        self.thumbs = []  # Lista de {label, photo, page_num}
+        self.generation = 0
+        self._proc = None
+        self._proc_lock = threading.Lock()
+        self.on_jump_callback = None
+
+    def load(self, file_path):
+        """Carga las miniaturas de un PDF (no hace nada si el archivo no cambió)"""
+        try:
+            stat = os.stat(file_path)
+            file_key = (file_path, stat.st_mtime, stat.st_size)
+        except OSError:
+            return
+        if file_key == self.file_key:
+            self.refresh_selection()
+            return
+        
+        self.clear()
+        self.current_pdf = file_path
+        self.file_key = file_key
+        gen = self.generation
+        threading.Thread(target=self._load_thumbnails, args=(gen, file_path), daemon=True).start()
+
+    def update_pages(self, file_path, pages):
+        """Pasa a otra versión del documento renderizando de nuevo solo las miniaturas de pages"""
+        if not self.thumbs or len(self.thumbs) != len(self.viewer.pages_data):
+            self.load(file_path)
+            return
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        self.current_pdf = file_path
+        self.file_key = (file_path, stat.st_mtime, stat.st_size)
+        gen = self.generation
+        
+        def render():
+            try:
+                for page_num in pages:
+                    images = pdf_tools.render_pages(file_path, page_num, page_num, dpi=self.THUMB_DPI,
+                                                    on_process=lambda proc: self._set_proc(gen, proc))
+                    if gen != self.generation:
+                        return
+                    if images:
+                        self._post_to_ui(gen, self._set_thumbnail, page_num, images[0])
+            except Exception as e:
+                print(f"Error al actualizar miniaturas: {e}")
+        
+        threading.Thread(target=render, daemon=True).start()
+
+    def clear(self):
+        """Cancela la carga en curso y elimina las miniaturas"""
+        self.generation += 1
+        with self._proc_lock:
+            proc, self._proc = self._proc, None
+        if proc:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        for widget in self.winfo_children():
+            widget.destroy()
+        self.thumbs = []
+        self.current_pdf = None
+        self.file_key = None
+
+    def _set_proc(self, gen, proc):
+        with self._proc_lock:
+            if gen == self.generation:
+                self._proc = proc
+                return
+        proc.kill()
+
+    def _post_to_ui(self, gen, func, *args):
+        """Encola func en el hilo de Tk; se descarta si la carga quedó obsoleta"""
+        def dispatch():
+            if gen == self.generation:
+                func(*args)
+        try:
+            self.after(0, dispatch)
+        except RuntimeError:
+            pass
+
+    def _load_thumbnails(self, gen, file_path):
+        """Lee del cache las miniaturas disponibles y renderiza el resto por lotes"""
+        try:
+            file_hash = pdf_tools.get_file_hash(file_path)
+            total_pages = pdf_tools.get_pdf_page_count(file_path)
+            self._post_to_ui(gen, self._create_slots, total_pages)
+            
+            missing = []
+            for page_num in range(1, total_pages + 1):
+                if gen != self.generation:
+                    return
+                img = pdf_tools.load_cached_thumbnail(file_hash, page_num)
+                if img:
+                    self._post_to_ui(gen, self._set_thumbnail, page_num, img)
+                else:
+                    missing.append(page_num)
+            
+            # Agrupar las páginas sin cache en tramos consecutivos para renderizarlas
+            # con una sola llamada a poppler por tramo
+            runs = []
+            for page_num in missing:
+                if runs and runs[-1][1] == page_num - 1 and page_num - runs[-1][0] < self.THUMB_BATCH:
+                    runs[-1][1] = page_num
+                else:
+                    runs.append([page_num, page_num])
+            
+            for first, last in runs:
+                if gen != self.generation:
+                    return
+                images = pdf_tools.render_pages(file_path, first, last, dpi=self.THUMB_DPI,
+                                                on_process=lambda proc: self._set_proc(gen, proc))
+                for offset, img in enumerate(images):
+                    pdf_tools.save_cached_thumbnail(file_hash, first + offset, img)
+                    self._post_to_ui(gen, self._set_thumbnail, first + offset, img)
+        except Exception as e:
+            print(f"Error al generar miniaturas: {e}")
+
+    def _create_slots(self, total_pages):
+        """Crea una etiqueta por página a la espera de su miniatura"""
+        for page_num in range(1, total_pages + 1):
+            label = Label(self, text=str(page_num), compound='top', bg='white',
+                          font=('Arial', 9), highlightthickness=3, highlightbackground='white',
+                          cursor='hand2')
+            label.pack(pady=4)
+            label.bind('<Button-1>', lambda e, n=page_num: self._on_thumb_click(e, n))
+            self.thumbs.append({'label': label, 'photo': None, 'page_num': page_num})
+        self.refresh_selection()
+
+    def _set_thumbnail(self, page_num, img):
+        if not 1 <= page_num <= len(self.thumbs):
+            return
+        thumb = self.thumbs[page_num - 1]
+        with instrumentation.span('tk.PhotoImage', cat='tk', page=page_num, thumbnail=True):
+            photo = ImageTk.PhotoImage(img)
+        thumb['label'].configure(image=photo)
+        thumb['photo'] = photo  # Mantener referencia
+
+    def _on_thumb_click(self, event, page_num):
+        """Ctrl+clic o modo selección: marcar página. Clic normal: saltar a la página"""
+        ctrl_pressed = bool(event.state & 0x0004)
+        if ctrl_pressed or self.viewer.interaction_mode == 'select_pages':
+            self.viewer.toggle_page_selection(page_num)
+        elif self.on_jump_callback:
+            self.on_jump_callback(page_num)
+
+    def refresh_selection(self):
+        """Sincroniza el borde de las miniaturas con viewer.selected_pages"""
+        for thumb in self.thumbs:
+            selected = thumb['page_num'] in self.viewer.selected_pages
+            thumb['label'].configure(highlightbackground='#cc0000' if selected else 'white')
+
+
 class PDFEditorApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -395,7 +1323,26 @@ class PDFEditorApp(ctk.CTk):
         # Variables para cambios pendientes
         self.pending_texts = []
         self.pending_images = []
+        self.pending_links = []
         self.merge_files = []
+        # Deshacer/rehacer de las operaciones que reescriben el PDF
+        self.history = EditHistory()
+        # Búsqueda en el documento: la generación invalida el hilo de una búsqueda anterior
+        self.search_generation = 0
+        self.search_key = None
+        self.search_matches = []
+        self.search_index = -1
+        self.search_running = False
+        self.search_page = 0
+        # Índice de búsqueda en carpetas (se crea la primera vez que se usa)
+        self.corpus_index = None
+        self.corpus_folder = None
+        # Diario de los cambios pendientes para recuperarlos tras un cierre inesperado
+        try:
+            self.journal = journal.EditJournal()
+        except OSError as e:
+            print(f"No se pudo crear el diario de ediciones: {e}")
+            self.journal = None
 
         # El estado de los diálogos se cargará dinámicamente según la herramienta seleccionada
 
@@ -403,6 +1350,9 @@ class PDFEditorApp(ctk.CTk):
         # 1. Header (Top Bar)
         self.setup_header()
 
+        # Barra de estado inferior (se empaqueta antes del área central para reservar su sitio)
+        self.setup_status_bar()
+
         # 2. Área Central (Sidebar + Viewer)
         self.main_container = ctk.CTkFrame(self, fg_color="transparent")
         self.main_container.pack(fill="both", expand=True)
@@ -417,12 +1367,31 @@ class PDFEditorApp(ctk.CTk):
         # Habilitar copiar y pegar estándar ( shortcuts )
         self._enable_standard_shortcuts()
 
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after_idle(self.offer_session_recovery)
+
     def _enable_standard_shortcuts(self):
         """Habilita Ctrl+C, Ctrl+V, etc. en widgets de entrada"""
         self.bind_all("<Control-c>", self._on_copy)
         self.bind_all("<Control-v>", self._on_paste)
         self.bind_all("<Control-x>", self._on_cut)
         self.bind_all("<Control-a>", self._on_select_all)
+        self.bind_all("<Control-z>", self._on_undo_shortcut)
+        self.bind_all("<Control-y>", self._on_redo_shortcut)
+        self.bind_all("<Control-Z>", self._on_redo_shortcut)
+
+    def _focus_is_text(self):
+        import tkinter as tk
+        return isinstance(self.focus_get(), (tk.Entry, tk.Text))
+
+    def _on_undo_shortcut(self, event):
+        # En campos de texto Ctrl+Z sigue siendo el deshacer del propio campo
+        if not self._focus_is_text():
+            self.undo_edit()
+
+    def _on_redo_shortcut(self, event):
+        if not self._focus_is_text():
+            self.redo_edit()
 
     def _on_copy(self, event):
         widget = self.focus_get()
@@ -501,16 +1470,199 @@ class PDFEditorApp(ctk.CTk):
         utils_frame.pack(side="right", padx=20)
 
         self.search_entry = ctk.CTkEntry(utils_frame, placeholder_text="Buscar texto...", 
-                                   width=250, height=30, font=("Arial", 12))
-        self.search_entry.pack(side="left", padx=10)
+                                   width=220, height=30, font=("Arial", 12))
+        self.search_entry.pack(side="left", padx=(10, 2))
         self.search_entry.bind("<Return>", lambda e: self.perform_search())
+        self.search_entry.bind("<Shift-Return>", lambda e: self.perform_search(backwards=True))
+        self.search_entry.bind("<Escape>", lambda e: self.stop_or_clear_search())
+        
+        # Navegación entre coincidencias, opciones y cancelación
+        search_buttons = {'fg_color': "transparent", 'text_color': "black", 'width': 24, 'height': 30, 'font': ("Arial", 12)}
+        ctk.CTkButton(utils_frame, text="▲", command=lambda: self.step_search(-1), **search_buttons).pack(side="left")
+        ctk.CTkButton(utils_frame, text="▼", command=lambda: self.step_search(1), **search_buttons).pack(side="left")
+        self.btn_search_options = ctk.CTkButton(utils_frame, text="⚙", command=self.show_search_options, **search_buttons)
+        self.btn_search_options.pack(side="left")
+        ctk.CTkButton(utils_frame, text="✕", command=self.stop_or_clear_search, **search_buttons).pack(side="left")
+        self.search_status_label = ctk.CTkLabel(utils_frame, text="", width=110, font=("Arial", 10), text_color="#555555")
+        self.search_status_label.pack(side="left", padx=(2, 10))
+        
+        self.search_regex_var = ctk.BooleanVar(value=False)
+        self.search_whole_word_var = ctk.BooleanVar(value=False)
+        self.search_ignore_accents_var = ctk.BooleanVar(value=True)
+        self.search_options_menu = Menu(self, tearoff=0)
+        self.search_options_menu.add_checkbutton(label="Expresión regular", variable=self.search_regex_var)
+        self.search_options_menu.add_checkbutton(label="Palabra completa", variable=self.search_whole_word_var)
+        self.search_options_menu.add_checkbutton(label="Ignorar tildes", variable=self.search_ignore_accents_var)
 
         # Iconos (Guardar, Compartir, etc)
+        self.btn_undo = ctk.CTkButton(utils_frame, text="↶", width=30, height=30, fg_color="transparent", text_color="black", font=("Arial", 16), command=self.undo_edit, state="disabled")
+        self.btn_undo.pack(side="left", padx=5)
+        self.btn_redo = ctk.CTkButton(utils_frame, text="↷", width=30, height=30, fg_color="transparent", text_color="black", font=("Arial", 16), command=self.redo_edit, state="disabled")
+        self.btn_redo.pack(side="left", padx=5)
+        
         btn_save = ctk.CTkButton(utils_frame, text="💾", width=30, height=30, fg_color="transparent", text_color="black", font=("Arial", 16), command=self.save_current_pdf)
         btn_save.pack(side="left", padx=5)
         
         btn_share = ctk.CTkButton(utils_frame, text="🔗", width=30, height=30, fg_color="transparent", text_color="black", font=("Arial", 16))
         btn_share.pack(side="left", padx=5)
+        
+        btn_perf = ctk.CTkButton(utils_frame, text="⏱", width=30, height=30, fg_color="transparent", text_color="black", font=("Arial", 16), command=self.show_performance_window)
+        btn_perf.pack(side="left", padx=5)
+
+    def commit_edit(self, label, new_path):
+        """
+        Adopta new_path como versión actual tras una operación: la registra para deshacer
+        y actualiza en el visor solo las páginas que cambiaron.
+        """
+        previous = self.current_pdf_path
+        self.current_pdf_path = new_path
+        self.cancel_search(clear=True)
+        try:
+            changed = self.history.record(label, previous, new_path) if previous else None
+        except Exception as e:
+            # Sin diferencia no hay deshacer para esta operación, pero el resultado es válido
+            print(f"No se pudo registrar la operación para deshacer: {e}")
+            changed = None
+        if changed is None:
+            self.pdf_viewer.load_pdf(new_path)
+        else:
+            self.pdf_viewer.update_pages(new_path, changed)
+        self.update_history_buttons()
+        self.journal_snapshot()
+
+    def undo_edit(self):
+        self._step_history(self.history.undo, self.history.can_undo())
+
+    def redo_edit(self):
+        self._step_history(self.history.redo, self.history.can_redo())
+
+    def _step_history(self, step, available):
+        if not available or not self.current_pdf_path:
+            return
+        try:
+            output, changed, label = step(self.current_pdf_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo deshacer/rehacer: {e}")
+            return
+        self.current_pdf_path = output
+        self.cancel_search(clear=True)
+        self.pdf_viewer.update_pages(output, changed)
+        self.update_history_buttons()
+        self.journal_snapshot()
+
+    def update_history_buttons(self):
+        self.btn_undo.configure(state="normal" if self.history.can_undo() else "disabled")
+        self.btn_redo.configure(state="normal" if self.history.can_redo() else "disabled")
+
+    def journal_add(self, kind, item):
+        """Registra en el diario un cambio pendiente nuevo (kind: 'texts', 'images' o 'links')"""
+        if self.journal:
+            self.journal.append('add', kind=kind, item=item)
+
+    def journal_clear(self, kind):
+        if self.journal:
+            self.journal.append('clear', kind=kind)
+
+    def journal_snapshot(self):
+        """Compacta el diario al estado actual; se llama cuando cambia el PDF base"""
+        if self.journal:
+            self.journal.snapshot({
+                'pdf_path': self.current_pdf_path,
+                'texts': self.pending_texts,
+                'images': self.pending_images,
+                'links': self.pending_links
+            })
+
+    def offer_session_recovery(self):
+        """Si una sesión anterior terminó sin cerrarse con cambios pendientes, ofrece recuperarlos"""
+        try:
+            orphans = journal.find_orphaned_journals()
+        except OSError:
+            return
+        for path in orphans:
+            try:
+                state = journal.replay(path)
+            except (OSError, KeyError, TypeError) as e:
+                print(f"No se pudo leer el diario {path}: {e}")
+                journal.discard(path)
+                continue
+            pending = journal.pending_count(state)
+            pdf_path = state['pdf_path']
+            if pending and not (pdf_path and os.path.exists(pdf_path)):
+                # El PDF base se movió o borró: sin él las ediciones no se pueden aplicar
+                name = os.path.basename(pdf_path) if pdf_path else "el documento"
+                choose = messagebox.askyesno(
+                    "Recuperar cambios",
+                    f"La sesión anterior se cerró inesperadamente con {pending} cambio(s) sin aplicar "
+                    f"sobre {name}, pero ese archivo ya no existe.\n\n"
+                    "¿Quieres elegir el PDF sobre el que recuperarlos? Si no, se descartarán.")
+                if choose:
+                    pdf_path = filedialog.askopenfilename(title="PDF base de los cambios",
+                                                          filetypes=[("PDF files", "*.pdf")],
+                                                          initialfile=name)
+                if not pdf_path or not os.path.exists(pdf_path):
+                    journal.discard(path)
+                    continue
+                state['pdf_path'] = pdf_path
+                self.restore_session(state)
+                journal.discard(path)
+                return
+            if pending:
+                restore = messagebox.askyesno(
+                    "Recuperar cambios",
+                    f"La sesión anterior se cerró inesperadamente con {pending} cambio(s) sin aplicar "
+                    f"sobre {os.path.basename(pdf_path)}.\n\n¿Quieres recuperarlos?")
+                if restore:
+                    self.restore_session(state)
+                    journal.discard(path)
+                    # Los diarios más antiguos quedan para el próximo arranque
+                    return
+            journal.discard(path)
+
+    def restore_session(self, state):
+        """Abre el PDF de una sesión recuperada y repone sus cambios pendientes"""
+        # JSON no distingue tuplas: el color vuelve a ser (r, g, b)
+        self.pending_texts = [{**t, 'color': tuple(t['color'])} for t in state['texts']]
+        self.pending_images = list(state['images'])
+        self.pending_links = list(state['links'])
+        self.open_pdf(state['pdf_path'])
+
+        # Las listas solo existen si su panel está abierto
+        if hasattr(self, 'pending_texts_list') and self.pending_texts_list.winfo_exists():
+            self.update_pending_texts_list()
+        if hasattr(self, 'pending_links_list') and self.pending_links_list.winfo_exists():
+            self.update_pending_links_list()
+        self.update_pending_images_lists()
+        self.after_pages_ready(state['pdf_path'], self._show_restored_previews)
+
+    def _show_restored_previews(self):
+        self.refresh_pending_previews()
+        for link in self.pending_links:
+            self.pdf_viewer.draw_text_overlay(link['page_num'], link['x'], link['y'],
+                                              f"Link: {link['url']}", font_size=8)
+
+    def after_pages_ready(self, file_path, callback, on_dropped=None):
+        """
+        Llama a callback en cuanto el visor haya creado los huecos de las páginas de file_path.
+        Si el visor muestra (o pasa a mostrar) otro archivo, callback no se llama: se llama a
+        on_dropped, o se avisa en la consola si no se indicó.
+        """
+        if self.pdf_viewer.current_pdf != file_path:
+            if on_dropped:
+                on_dropped()
+            else:
+                print(f"Acción descartada: el visor ya no muestra {os.path.basename(file_path)}")
+            return
+        if not self.pdf_viewer.pages_data:
+            self.after(100, self.after_pages_ready, file_path, callback, on_dropped)
+            return
+        callback()
+
+    def on_close(self):
+        """Cierre normal: el diario de la sesión ya no hace falta"""
+        if self.journal:
+            self.journal.close(discard=True)
+        self.destroy()
 
     def save_current_pdf(self):
         """Guarda los cambios en el PDF actual a una nueva ubicación"""
@@ -520,58 +1672,226 @@ class PDFEditorApp(ctk.CTk):
                                                  initialfile=os.path.basename(self.current_pdf_path))
             if output:
                 try:
-                    import shutil
-                    shutil.copy2(self.current_pdf_path, output)
+                    if self.linearize_output_var.get():
+                        pdf_tools.linearize_pdf(self.current_pdf_path, output)
+                    else:
+                        import shutil
+                        shutil.copy2(self.current_pdf_path, output)
                     messagebox.showinfo("Éxito", f"PDF guardado correctamente en: {output}")
                     self.current_pdf_path = output
+                    self.pdf_viewer.rename_file(output)
                     self.title(f"Editor PDF Pro - {os.path.basename(output)}")
+                    self.journal_snapshot()
                 except Exception as e:
                     messagebox.showerror("Error", f"No se pudo guardar: {str(e)}")
         else:
             messagebox.showwarning("Aviso", "No hay ningún PDF abierto.")
 
-    def perform_search(self):
-        """Busca texto en el PDF actual y resalta todas las posiciones en el visor"""
+    def show_performance_window(self):
+        """Ventana con los totales por etapa y las operaciones recientes de la instrumentación"""
+        window = getattr(self, 'perf_window', None)
+        if window is not None and window.winfo_exists():
+            window.lift()
+            self._refresh_performance_window()
+            return
+        
+        self.perf_window = ctk.CTkToplevel(self)
+        self.perf_window.title("Rendimiento")
+        self.perf_window.geometry("720x520")
+        
+        controls = ctk.CTkFrame(self.perf_window, fg_color="transparent")
+        controls.pack(fill="x", padx=10, pady=(10, 0))
+        self.perf_enabled_var = ctk.BooleanVar(value=instrumentation.is_enabled())
+        ctk.CTkSwitch(controls, text="Instrumentación activa", variable=self.perf_enabled_var,
+                      command=lambda: instrumentation.set_enabled(self.perf_enabled_var.get())).pack(side="left")
+        ctk.CTkButton(controls, text="Exportar trace...", width=120,
+                      command=self._export_performance_trace).pack(side="right", padx=5)
+        ctk.CTkButton(controls, text="Limpiar", width=80,
+                      command=lambda: (instrumentation.reset(), self._refresh_performance_window())).pack(side="right", padx=5)
+        ctk.CTkButton(controls, text="Actualizar", width=90,
+                      command=self._refresh_performance_window).pack(side="right", padx=5)
+        
+        self.perf_textbox = ctk.CTkTextbox(self.perf_window, font=("Courier", 11))
+        self.perf_textbox.pack(fill="both", expand=True, padx=10, pady=10)
+        self._refresh_performance_window()
+
+    def _refresh_performance_window(self):
+        lines = []
+        if not instrumentation.is_enabled():
+            lines.append("Instrumentación desactivada: actívala arriba o inicia con PDF_EDITOR_TRACE=1.\n")
+        
+        lines.append(f"{'Etapa':28} {'Veces':>7} {'Total ms':>11} {'Máx ms':>10}")
+        for name, entry in instrumentation.summary().items():
+            lines.append(f"{name:28} {entry['count']:7} {entry['total_ms']:11.1f} {entry['max_ms']:10.1f}")
+        
+        totals = instrumentation.counters()
+        if totals:
+            lines.append("\nContadores:")
+            for name, value in sorted(totals.items()):
+                lines.append(f"  {name}: {value}")
+        
+        lines.append("\nOperaciones recientes:")
+        for event in instrumentation.recent(200):
+            args = ", ".join(f"{k}={v}" for k, v in event['args'].items())
+            lines.append(f"{event['start_ms']:10.1f}  {event['duration_ms']:9.2f} ms  {event['name']}  {args}")
+        
+        self.perf_textbox.delete("1.0", "end")
+        self.perf_textbox.insert("1.0", "\n".join(lines))
+
+    def _export_performance_trace(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", initialfile="trace.json",
+                                            filetypes=[("Chrome trace", "*.json")])
+        if not path:
+            return
+        try:
+            count = instrumentation.export_chrome_trace(path)
+            messagebox.showinfo("Rendimiento", f"{count} eventos exportados.\nÁbrelo en chrome://tracing o ui.perfetto.dev", parent=self.perf_window)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar el trace: {str(e)}", parent=self.perf_window)
+
+    def perform_search(self, backwards=False):
+        """
+        Busca en el PDF actual y resalta las coincidencias página a página según se encuentran,
+        saltando a la primera. Repetir la misma búsqueda (Enter) pasa a la siguiente coincidencia.
+        """
         query = self.search_entry.get().strip()
         if not query:
+            self.cancel_search(clear=True)
             return
         
         if not self.current_pdf_path:
-            messagebox.showwarning("Aviso", "Abre un PDF primero.")
+            self._set_search_status("Abre un PDF primero")
             return
 
+        options = {
+            'regex': self.search_regex_var.get(),
+            'whole_word': self.search_whole_word_var.get(),
+            'ignore_accents': self.search_ignore_accents_var.get()
+        }
+        key = (self.current_pdf_path, query, tuple(sorted(options.items())))
+        if key == self.search_key:
+            self.step_search(-1 if backwards else 1)
+            return
+        
         try:
-            # Limpiar resaltados anteriores en todo el visor
-            self.pdf_viewer.clear_overlays()
-            
-            # Usar la nueva función que devuelve todos los matches
-            matches = pdf_tools.find_text_coordinates(self.current_pdf_path, query)
-            
-            if matches:
-                # Agrupar matches por página para optimizar (aunque highlight_search_result es rápido)
-                from collections import defaultdict
-                page_groups = defaultdict(list)
-                for m in matches:
-                    page_groups[m['page']].append(m['rect'])
-                
-                # Aplicar resaltados
-                for page_num, rects in page_groups.items():
-                    # El visor ya tiene la lógica para dibujar en el canvas de la página
-                    for rect in rects:
-                        self.pdf_viewer.highlight_search_result(page_num, rect)
-                
-                # Desplazar la vista al primer match encontrado
-                first_match_page = matches[0]['page']
-                for data in self.pdf_viewer.pages_data:
-                    if data['page_num'] == first_match_page:
-                        self.pdf_viewer.see(data['frame'])
-                        break
-                
-                messagebox.showinfo("Búsqueda", f"Se han encontrado {len(matches)} coincidencias en el documento.")
-            else:
-                messagebox.showinfo("Búsqueda", "No se encontró el término.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error en la búsqueda: {str(e)}")
+            pattern = pdf_tools.compile_search_pattern(query, **options)
+        except re.error:
+            self._set_search_status("Expresión no válida")
+            return
+        
+        self.cancel_search(clear=True)
+        self.search_key = key
+        self.search_running = True
+        self._set_search_status("Buscando...")
+        file_path = self.current_pdf_path
+        gen = self.search_generation
+        # Los resaltados se dibujan sobre los huecos de las páginas: esperar a que existan
+        self.after_pages_ready(file_path,
+                               lambda: self._start_search(gen, file_path, pattern, options['ignore_accents']),
+                               on_dropped=lambda: self._on_search_dropped(gen))
+
+    def _start_search(self, gen, file_path, pattern, ignore_accents):
+        if gen != self.search_generation:
+            return
+        
+        def run():
+            try:
+                for page_num, rects in pdf_tools.search_text(file_path, pattern, ignore_accents=ignore_accents):
+                    # Frontera de página: una búsqueda cancelada o sustituida se detiene aquí
+                    if gen != self.search_generation:
+                        return
+                    self._post_search(gen, self._on_search_page, page_num, rects)
+                self._post_search(gen, self._on_search_done)
+            except Exception as e:
+                self._post_search(gen, self._on_search_error, str(e))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _post_search(self, gen, func, *args):
+        """Encola func en el hilo de Tk; se descarta si la búsqueda quedó obsoleta"""
+        def dispatch():
+            if gen == self.search_generation:
+                func(*args)
+        try:
+            self.after(0, dispatch)
+        except RuntimeError:
+            pass
+
+    def _on_search_page(self, page_num, rects):
+        self.search_page = page_num
+        for rect in rects:
+            self.pdf_viewer.highlight_search_result(page_num, rect)
+            self.search_matches.append((page_num, rect))
+        if rects and self.search_index < 0:
+            self._go_to_search_match(0)
+        else:
+            self._update_search_status()
+
+    def _on_search_done(self):
+        self.search_running = False
+        self._update_search_status()
+
+    def _on_search_dropped(self, gen):
+        """El visor cambió de documento antes de empezar: la búsqueda no llegó a lanzarse"""
+        if gen != self.search_generation:
+            return
+        self.search_running = False
+        self.search_key = None
+        self._set_search_status("Búsqueda cancelada")
+
+    def _on_search_error(self, message):
+        self.search_running = False
+        self._set_search_status("Error en la búsqueda")
+        print(f"Error en la búsqueda: {message}")
+
+    def step_search(self, direction):
+        """Pasa a la coincidencia siguiente (direction=1) o anterior (-1), dando la vuelta al final"""
+        if not self.search_matches:
+            return
+        self._go_to_search_match((self.search_index + direction) % len(self.search_matches))
+
+    def _go_to_search_match(self, index):
+        self.search_index = index
+        page_num, rect = self.search_matches[index]
+        self.pdf_viewer.mark_current_search_result(page_num, rect)
+        self.pdf_viewer.scroll_to_page(page_num)
+        self._update_search_status()
+
+    def _update_search_status(self):
+        total = len(self.search_matches)
+        text = f"{self.search_index + 1} de {total}" if total else ""
+        if self.search_running:
+            text = f"{text} (pág {self.search_page}/{len(self.pdf_viewer.pages_data)})".strip()
+        elif not total:
+            text = "Sin resultados"
+        self._set_search_status(text)
+
+    def _set_search_status(self, text):
+        self.search_status_label.configure(text=text)
+
+    def cancel_search(self, clear=False):
+        """Detiene la búsqueda en curso; con clear también olvida y borra sus resultados"""
+        self.search_generation += 1
+        self.search_running = False
+        if clear:
+            self.search_key = None
+            self.search_matches = []
+            self.search_index = -1
+            self.pdf_viewer.clear_search_highlights()
+            self._set_search_status("")
+
+    def stop_or_clear_search(self):
+        """Escape / ✕: detiene una búsqueda en curso (conservando lo encontrado) o, si ya terminó, la borra"""
+        if self.search_running:
+            self.cancel_search()
+            total = len(self.search_matches)
+            self._set_search_status(f"{self.search_index + 1} de {total} · detenida" if total else "Detenida")
+        else:
+            self.cancel_search(clear=True)
+
+    def show_search_options(self):
+        button = self.btn_search_options
+        self.search_options_menu.tk_popup(button.winfo_rootx(), button.winfo_rooty() + button.winfo_height())
 
     def switch_tab(self, tab_name):
         """Cambia la vista según el tab de navegación superior"""
@@ -582,18 +1902,33 @@ class PDFEditorApp(ctk.CTk):
             else:
                 btn.configure(text_color="#555555", font=("Arial", 12), border_width=0)
         
-        # Limpiar sidebar y cargar nuevo contenido
-        for widget in self.sidebar.winfo_children():
-            widget.destroy()
-            
-        if tab_name == "Todas las herramientas":
-            self.setup_all_tools_sidebar()
-        elif tab_name == "Editar":
-            self.setup_edit_sidebar()
-        elif tab_name == "Convertir":
-            self.setup_convert_sidebar()
-        elif tab_name == "Firma electrónica":
-            self.setup_sign_sidebar()
+        # Ocultar el panel actual; cada panel se construye la primera vez que se abre
+        for panel in self.sidebar_panels.values():
+            panel['frame'].pack_forget()
+        
+        panel = self.sidebar_panels.get(tab_name)
+        if panel is None:
+            self.sidebar_panel = ctk.CTkFrame(self.sidebar, fg_color="transparent")
+            if tab_name == "Todas las herramientas":
+                self.setup_all_tools_sidebar()
+            elif tab_name == "Editar":
+                self.setup_edit_sidebar()
+            elif tab_name == "Convertir":
+                self.setup_convert_sidebar()
+            elif tab_name == "Firma electrónica":
+                self.setup_sign_sidebar()
+            panel = {'frame': self.sidebar_panel, 'context_frame': self.context_frame}
+            self.sidebar_panels[tab_name] = panel
+        else:
+            # Panel ya construido: dejar su contexto como recién abierto
+            self.context_frame = panel['context_frame']
+            for widget in self.context_frame.winfo_children():
+                widget.destroy()
+            self.context_label = ctk.CTkLabel(self.context_frame, text="Selecciona una herramienta", font=("Arial", 12, "italic"))
+            self.context_label.pack(pady=20)
+        
+        self.sidebar_panel = panel['frame']
+        self.sidebar_panel.pack(fill="both", expand=True)
 
     def setup_header_utils(self, utils_frame):
         # ... (se mantiene igual pero movido si es necesario)
@@ -604,6 +1939,9 @@ class PDFEditorApp(ctk.CTk):
         self.sidebar = ctk.CTkScrollableFrame(self.main_container, width=280, corner_radius=0, 
                                              fg_color="white", border_width=0)
         self.sidebar.pack(side="left", fill="y", padx=0, pady=0)
+        self.sidebar_panels = {}
+        self.sidebar_panel = None
+        self.context_frame = None
         # Borde separador sutil
         line = ctk.CTkFrame(self.main_container, width=1, fg_color="#e0e0e0")
         line.pack(side="left", fill="y")
@@ -611,7 +1949,7 @@ class PDFEditorApp(ctk.CTk):
     def setup_edit_sidebar(self):
         """Carga las herramientas de edición en la barra lateral"""
         # Header
-        sidebar_header = ctk.CTkFrame(self.sidebar, fg_color="transparent")
+        sidebar_header = ctk.CTkFrame(self.sidebar_panel, fg_color="transparent")
         sidebar_header.pack(fill="x", padx=15, pady=(15, 20))
         ctk.CTkLabel(sidebar_header, text="Editar", font=("Arial", 18, "bold"), text_color="black").pack(side="left")
 
@@ -621,27 +1959,29 @@ class PDFEditorApp(ctk.CTk):
             ("🗑️", "Eliminar páginas", self.select_tab_delete),
             ("📑", "Organizar páginas", self.select_tab_reorder),
             ("✂️", "Dividir PDF", self.select_tab_split),
-            ("➕", "Unir PDFs", self.select_tab_merge)
+            ("➕", "Unir PDFs", self.select_tab_merge),
+            ("🗜️", "Optimizar tamaño", self.select_tab_optimize)
         ])
         
         self.create_sidebar_group("AGREGAR CONTENIDO", [
             ("T+", "Texto", self.select_tab_add_text),
             ("🖼️", "Imagen", self.select_tab_add_image),
             ("🔗", "Enlace", self.select_tab_link),
+            ("💧", "Marca de agua / Bates", self.select_tab_watermark),
         ])
 
         self.setup_context_frame()
 
     def setup_context_frame(self):
         """Crea el frame para las opciones de herramientas"""
-        self.context_frame = ctk.CTkFrame(self.sidebar, fg_color="#f0f0f0", corner_radius=10)
+        self.context_frame = ctk.CTkFrame(self.sidebar_panel, fg_color="#f0f0f0", corner_radius=10)
         self.context_frame.pack(fill="x", padx=15, pady=20)
         self.context_label = ctk.CTkLabel(self.context_frame, text="Selecciona una herramienta", font=("Arial", 12, "italic"))
         self.context_label.pack(pady=20)
 
     def setup_all_tools_sidebar(self):
         """Muestra todas las herramientas disponibles en una sola lista"""
-        sidebar_header = ctk.CTkFrame(self.sidebar, fg_color="transparent")
+        sidebar_header = ctk.CTkFrame(self.sidebar_panel, fg_color="transparent")
         sidebar_header.pack(fill="x", padx=15, pady=(15, 10))
         ctk.CTkLabel(sidebar_header, text="Todas las herramientas", font=("Arial", 18, "bold"), text_color="black").pack(side="left")
 
@@ -652,12 +1992,14 @@ class PDFEditorApp(ctk.CTk):
                 ("🗑️", "Eliminar páginas", self.select_tab_delete),
                 ("📑", "Organizar páginas", self.select_tab_reorder),
                 ("✂️", "Dividir PDF", self.select_tab_split),
-                ("➕", "Unir PDFs", self.select_tab_merge)
+                ("➕", "Unir PDFs", self.select_tab_merge),
+                ("🗜️", "Optimizar tamaño", self.select_tab_optimize)
             ]),
             ("AGREGAR", [
                 ("T+", "Texto", self.select_tab_add_text),
                 ("🖼️", "Imagen", self.select_tab_add_image),
                 ("🔗", "Enlace", self.select_tab_link),
+                ("💧", "Marca de agua / Bates", self.select_tab_watermark),
             ]),
             ("CONVERTIR", [
                 ("📄", "A Word / ODT", self.convert_to_word),
@@ -667,14 +2009,19 @@ class PDFEditorApp(ctk.CTk):
             ("FIRMA", [
                 ("🖋️", "Firma Digital", self.select_tab_sign),
                 ("📧", "Solicitar firmas", self.select_tab_request_sign),
+            ]),
+            ("BUSCAR", [
+                ("🔎", "Buscar en carpeta", self.select_tab_corpus_search),
             ])
         ]
 
         for category, items in tools_list:
             self.create_sidebar_group(category, items)
 
+        self.setup_context_frame()
+
     def setup_convert_sidebar(self):
-        ctk.CTkLabel(self.sidebar, text="Convertir", font=("Arial", 16, "bold"), text_color="black").pack(pady=20)
+        ctk.CTkLabel(self.sidebar_panel, text="Convertir", font=("Arial", 16, "bold"), text_color="black").pack(pady=20)
         self.create_sidebar_group("FORMATOS", [
             ("📄", "A Word / ODT", self.convert_to_word),
             ("📊", "A Excel / ODS", self.convert_to_excel),
@@ -683,7 +2030,7 @@ class PDFEditorApp(ctk.CTk):
         self.setup_context_frame()
 
     def setup_sign_sidebar(self):
-        ctk.CTkLabel(self.sidebar, text="Firma electrónica", font=("Arial", 16, "bold"), text_color="black").pack(pady=20)
+        ctk.CTkLabel(self.sidebar_panel, text="Firma electrónica", font=("Arial", 16, "bold"), text_color="black").pack(pady=20)
         self.create_sidebar_group("ACCIONES", [
             ("🖋️", "Firma Digital", self.select_tab_sign),
             ("📧", "Solicitar firmas", self.select_tab_request_sign),
@@ -692,13 +2039,13 @@ class PDFEditorApp(ctk.CTk):
 
     def create_sidebar_group(self, title, items):
         """Crea un grupo de herramientas en la barra lateral"""
-        group_frame = ctk.CTkFrame(self.sidebar, fg_color="transparent")
+        group_frame = ctk.CTkFrame(self.sidebar_panel, fg_color="transparent")
         group_frame.pack(fill="x", padx=15, pady=(20, 10))
         
         ctk.CTkLabel(group_frame, text=title, font=("Arial", 11, "bold"), text_color="#666666").pack(anchor="w")
         
         for icon, label, command in items:
-            btn = ctk.CTkButton(self.sidebar, text=f"  {icon}   {label}", anchor="w",
+            btn = ctk.CTkButton(self.sidebar_panel, text=f"  {icon}   {label}", anchor="w",
                                 font=("Arial", 13), fg_color="transparent", text_color="black",
                                 hover_color="#f0f0f0", height=40, command=command)
             btn.pack(fill="x", padx=10, pady=2)
@@ -710,7 +2057,7 @@ class PDFEditorApp(ctk.CTk):
 
         # Barra de herramientas del visor (Flotante o fija)
         self.toolbar_overlay = ctk.CTkFrame(self.viewer_container, width=50, fg_color="white", corner_radius=8, border_width=1, border_color="#cccccc")
-        self.toolbar_overlay.place(relx=0.02, rely=0.1)
+        self.toolbar_overlay.place(relx=0.02, x=150, rely=0.1)
         
         tools = ["↖️", "💬", "🖋️", "〰️", "T", "📸"]
         for tool in tools:
@@ -732,8 +2079,100 @@ class PDFEditorApp(ctk.CTk):
 
         # El visor de PDF propiamente dicho
         self.pdf_viewer = InteractivePDFViewer(self.viewer_container)
+        
+        # Miniaturas a la izquierda del visor, sincronizadas con sus cargas y selección
+        self.thumbnail_strip = ThumbnailStrip(self.viewer_container, self.pdf_viewer, width=130,
+                                              fg_color="#d5d5d5", corner_radius=0)
+        self.thumbnail_strip.pack(side="left", fill="y", pady=(50, 10))
+        self.thumbnail_strip.on_jump_callback = self.jump_to_page
+        self.pdf_viewer.on_load_callback = self.thumbnail_strip.load
+        self.pdf_viewer.on_pages_changed_callback = self.thumbnail_strip.update_pages
+        self.pdf_viewer.on_selection_callback = self.thumbnail_strip.refresh_selection
+        self.pdf_viewer.on_memory_callback = self.update_memory_status
+        self.update_memory_status(0, self.pdf_viewer.memory_budget)
+        
         self.pdf_viewer.pack(fill="both", expand=True, padx=20, pady=(50, 10))
 
+    # Opciones del selector de presupuesto de memoria (MB)
+    MEMORY_BUDGET_OPTIONS = (256, 512, 1024, 2048, 4096)
+    # Etiquetas de los perfiles de pdf_tools.OUTPUT_PROFILES
+    OUTPUT_PROFILE_OPTIONS = {"Compatible": "compatible", "Compacto": "compacto", "Máximo": "maximo"}
+
+    def setup_status_bar(self):
+        """Barra de estado con el consumo de memoria del visor y su presupuesto"""
+        self.status_bar = ctk.CTkFrame(self, height=26, corner_radius=0, fg_color="white", border_width=1, border_color="#e0e0e0")
+        self.status_bar.pack(fill="x", side="bottom")
+        self.status_bar.pack_propagate(False)
+        
+        budget_mb = InteractivePDFViewer.MEMORY_BUDGET // (1024 * 1024)
+        options = sorted(set(self.MEMORY_BUDGET_OPTIONS) | {budget_mb})
+        self.memory_budget_menu = ctk.CTkOptionMenu(self.status_bar, values=[f"{mb} MB" for mb in options],
+                                                    width=90, height=20, font=("Arial", 10),
+                                                    command=self.change_memory_budget)
+        self.memory_budget_menu.set(f"{budget_mb} MB")
+        self.memory_budget_menu.pack(side="right", padx=10)
+        ctk.CTkLabel(self.status_bar, text="Presupuesto:", font=("Arial", 10)).pack(side="right")
+        
+        self.memory_status_label = ctk.CTkLabel(self.status_bar, text="", font=("Arial", 10), text_color="#555555")
+        self.memory_status_label.pack(side="right", padx=10)
+        
+        # Perfil con que pdf_tools escribe los PDFs (sin importar pdf_tools en el arranque)
+        ctk.CTkLabel(self.status_bar, text="PDFs de salida:", font=("Arial", 10)).pack(side="left", padx=(10, 0))
+        self.output_profile_menu = ctk.CTkOptionMenu(self.status_bar, values=list(self.OUTPUT_PROFILE_OPTIONS),
+                                                     width=110, height=20, font=("Arial", 10),
+                                                     command=self.change_output_profile)
+        current_profile = os.environ.get("PDF_EDITOR_OUTPUT_PROFILE", "compacto")
+        self.output_profile_menu.set(next((label for label, name in self.OUTPUT_PROFILE_OPTIONS.items()
+                                           if name == current_profile), "Compacto"))
+        self.output_profile_menu.pack(side="left", padx=5)
+        
+        # Linealizar (vista web rápida) al guardar, unir, dividir y extraer
+        self.linearize_output_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self.status_bar, text="Vista web rápida", variable=self.linearize_output_var,
+                        font=("Arial", 10), checkbox_width=16, checkbox_height=16).pack(side="left", padx=5)
+        ctk.CTkButton(self.status_bar, text="Comprobar...", width=80, height=20, font=("Arial", 10),
+                      command=self.check_pdf_linearization).pack(side="left", padx=5)
+
+    def update_memory_status(self, used, budget):
+        """Refresca el uso de memoria del visor en la barra de estado"""
+        mb = 1024 * 1024
+        color = "#cc0000" if used > budget else "#555555"
+        self.memory_status_label.configure(text=f"Memoria del visor: {used / mb:.1f} / {budget / mb:.0f} MB",
+                                           text_color=color)
+
+    def change_memory_budget(self, choice):
+        self.pdf_viewer.set_memory_budget(int(choice.split()[0]) * 1024 * 1024)
+
+    def change_output_profile(self, choice):
+        pdf_tools.set_output_profile(self.OUTPUT_PROFILE_OPTIONS[choice])
+
+    def check_pdf_linearization(self):
+        """Informa de si un PDF está linealizado y si la linealización sigue siendo válida"""
+        f = filedialog.askopenfilename(title="PDF a comprobar", filetypes=[("PDF files", "*.pdf")],
+                                       initialfile=os.path.basename(self.current_pdf_path or ""))
+        if not f:
+            return
+        try:
+            result = pdf_tools.check_linearization(f)
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
+        name = os.path.basename(f)
+        if not result['linearized']:
+            messagebox.showinfo("Vista web rápida", f"{name} no está linealizado.")
+        elif result['valid']:
+            messagebox.showinfo("Vista web rápida",
+                                f"{name} está linealizado correctamente ({result['page_count']} páginas; "
+                                f"la primera se muestra tras {result['first_page_end'] / 1024:.0f} KB).")
+        else:
+            messagebox.showwarning("Vista web rápida", f"{name} está linealizado pero con problemas:\n\n"
+                                   + "\n".join(result['problems'][:10]))
+
+    def jump_to_page(self, page_num):
+        """Desplaza el visor hasta la página indicada (1-indexed)"""
+        if 1 <= page_num <= len(self.pdf_viewer.pages_data):
+            self.pdf_viewer.see(self.pdf_viewer.pages_data[page_num - 1]['frame'])
+
     def adjust_zoom(self, delta):
         self.zoom_level += delta
         self.zoom_level = max(0.1, min(5.0, self.zoom_level))
@@ -796,6 +2235,21 @@ class PDFEditorApp(ctk.CTk):
             self.pdf_viewer.set_interaction_mode('add_image')
             self.show_tool_options("Agregar Imagen", self.setup_add_image_context)
 
+    def select_tab_watermark(self):
+        self.pdf_viewer.set_interaction_mode('view')
+        self.pdf_viewer.on_click_callback = None
+        self.show_tool_options("Marca de agua", self.setup_watermark_context)
+
+    def select_tab_optimize(self):
+        self.pdf_viewer.set_interaction_mode('view')
+        self.pdf_viewer.on_click_callback = None
+        self.show_tool_options("Optimizar tamaño", self.setup_optimize_context)
+
+    def select_tab_corpus_search(self):
+        self.pdf_viewer.set_interaction_mode('view')
+        self.pdf_viewer.on_click_callback = None
+        self.show_tool_options("Buscar en carpeta", self.setup_corpus_search_context)
+
     def select_tab_sign(self):
         if not self.current_pdf_path:
             self.open_pdf_dialog()
@@ -862,15 +2316,12 @@ class PDFEditorApp(ctk.CTk):
                 current_file = temp_output
             
             messagebox.showinfo("Aplicado", "Enlaces aplicados visualmente. Usa 'Guardar PDF' para permanencia.")
-            self.pending_links = []
-            self.update_pending_links_list()
-            self.pdf_viewer.clear_overlays()
-            self.current_pdf_path = temp_output
-            self.pdf_viewer.load_pdf(temp_output)
+            self.clear_pending_links()
+            self.commit_edit("Enlaces", temp_output)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
-    def on_pdf_click_add_link(self, page_num, x, y):
+    def on_pdf_click_add_link(self, page_num, x, y, img_x, img_y):
         url = self.entry_link_url.get()
         if not url:
             messagebox.showwarning("Aviso", "Ingresa una URL primero.")
@@ -885,6 +2336,7 @@ class PDFEditorApp(ctk.CTk):
             'url': url
         }
         self.pending_links.append(link_data)
+        self.journal_add('links', link_data)
         
         # Overlay visual
         self.pdf_viewer.draw_text_overlay(page_num, x, y, f"Link: {url}", font_size=8)
@@ -901,6 +2353,7 @@ class PDFEditorApp(ctk.CTk):
     def clear_pending_links(self):
         """Limpia todos los enlaces pendientes"""
         self.pending_links = []
+        self.journal_clear('links')
         self.update_pending_links_list()
         self.pdf_viewer.clear_overlays()
 
@@ -922,9 +2375,7 @@ class PDFEditorApp(ctk.CTk):
                     current_file = output
                 
                 messagebox.showinfo("Éxito", f"Enlaces aplicados correctamente en: {output}")
-                self.pending_links = []
-                self.update_pending_links_list()
-                self.pdf_viewer.clear_overlays()
+                self.clear_pending_links()
                 self.load_pdf_in_viewer(output)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
@@ -975,8 +2426,16 @@ class PDFEditorApp(ctk.CTk):
         self.cert_pass_entry = ctk.CTkEntry(tab_digital, show="*")
         self.cert_pass_entry.pack(fill="x", padx=10, pady=2)
         
+        ctk.CTkLabel(tab_digital, text="Campo de firma:").pack(pady=5)
+        self.sign_field_entry = ctk.CTkEntry(tab_digital)
+        self.sign_field_entry.insert(0, "Signature1")
+        self.sign_field_entry.pack(fill="x", padx=10, pady=2)
+        
         btn_sign_digital = ctk.CTkButton(tab_digital, text="Firmar con Certificado", command=self.process_digital_sign, fg_color="#007bff")
-        btn_sign_digital.pack(pady=15)
+        btn_sign_digital.pack(pady=(15, 5))
+        
+        btn_sign_batch = ctk.CTkButton(tab_digital, text="📂 Firmar Carpeta (lote)", command=self.process_batch_sign, fg_color="#6c757d")
+        btn_sign_batch.pack(pady=5)
 
     def setup_request_sign_context(self, parent):
         ctk.CTkLabel(parent, text="Email del destinatario:").pack(pady=5)
@@ -1099,11 +2558,53 @@ class PDFEditorApp(ctk.CTk):
         output = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
         if output:
             try:
-                pdf_tools.sign_pdf_digitally(self.current_pdf_path, output, cert_path, password)
+                field_name = self.sign_field_entry.get().strip() or "Signature1"
+                pdf_tools.sign_pdf_digitally(self.current_pdf_path, output, cert_path, password,
+                                             field_name=field_name)
                 messagebox.showinfo("Éxito", f"PDF firmado digitalmente en: {output}")
             except Exception as e:
                 messagebox.showerror("Error de Firma", f"No se pudo firmar el PDF: {str(e)}")
 
+    def process_batch_sign(self):
+        """Firma todos los PDFs de una carpeta con el certificado indicado, en segundo plano"""
+        cert_path = self.cert_entry.get()
+        password = self.cert_pass_entry.get()
+        field_name = self.sign_field_entry.get().strip() or "Signature1"
+        
+        if not cert_path or not os.path.exists(cert_path):
+            messagebox.showwarning("Aviso", "Selecciona un certificado válido.")
+            return
+        
+        input_dir = filedialog.askdirectory(title="Carpeta con los PDFs a firmar")
+        if not input_dir:
+            return
+        output_dir = filedialog.askdirectory(title="Carpeta de destino de los PDFs firmados")
+        if not output_dir:
+            return
+        
+        def run():
+            try:
+                results = pdf_tools.sign_pdfs_batch(input_dir, output_dir, cert_path, password,
+                                                    field_name=field_name)
+                self.after(0, lambda: self._show_batch_sign_results(results, output_dir))
+            except Exception as e:
+                self.after(0, lambda msg=str(e): messagebox.showerror("Error de Firma", f"No se pudo firmar el lote: {msg}"))
+        
+        threading.Thread(target=run, daemon=True).start()
+        messagebox.showinfo("Firma en lote", "Firmando en segundo plano. Se avisará al terminar.")
+
+    def _show_batch_sign_results(self, results, output_dir):
+        """Resume el resultado de una firma en lote"""
+        signed = [r for r in results if r['ok']]
+        failed = [r for r in results if not r['ok']]
+        total_time = sum(r['seconds'] for r in results)
+        msg = f"{len(signed)} de {len(results)} PDFs firmados en {output_dir} ({total_time:.1f} s de firma)."
+        if failed:
+            msg += "\n\nErrores:\n" + "\n".join(f"{os.path.basename(r['input'])}: {r['error']}" for r in failed[:10])
+            messagebox.showwarning("Firma en lote", msg)
+        else:
+            messagebox.showinfo("Firma en lote", msg)
+
     def select_certificate(self):
         f = filedialog.askopenfilename(filetypes=[("Certificates", "*.p12 *.pfx")])
         if f:
@@ -1173,8 +2674,7 @@ class PDFEditorApp(ctk.CTk):
             pdf_tools.rotate_pdf(self.current_pdf_path, angle, temp_output)
             
             # Actualizar visor con el nuevo temporal
-            self.current_pdf_path = temp_output
-            self.pdf_viewer.load_pdf(temp_output)
+            self.commit_edit("Rotar", temp_output)
             
             # Notificar al usuario que es temporal
             # ctk.messagebox no es estándar, usamos el de tkinter
@@ -1187,6 +2687,12 @@ class PDFEditorApp(ctk.CTk):
         ctk.CTkLabel(parent, text="Haz clic en las páginas del visor\npara marcarlas para borrar.", font=("Arial", 10, "italic")).pack(pady=5)
         btn_del = ctk.CTkButton(parent, text="🗑️ Eliminar Marcadas", command=self.process_delete_pages, fg_color="#cc0000", height=40)
         btn_del.pack(pady=20, fill="x", padx=20)
+        
+        self.pdf_viewer.on_click_callback = self.on_pdf_click_select_page
+
+    def on_pdf_click_select_page(self, page_num, pdf_x, pdf_y, img_x, img_y):
+        """Callback cuando se hace clic en el PDF para marcar/desmarcar una página"""
+        self.pdf_viewer.toggle_page_selection(page_num)
 
     def setup_add_image_context(self, parent):
         ctk.CTkLabel(parent, text="Agregar Imagen / Firma", font=("Arial", 11, "bold")).pack(pady=(10, 5))
@@ -1219,6 +2725,343 @@ class PDFEditorApp(ctk.CTk):
         
         self.pdf_viewer.on_click_callback = self.on_pdf_click_add_image
     
+    # Etiquetas de la UI para las selecciones y posiciones de pdf_tools.watermark_pdf
+    WATERMARK_PAGE_OPTIONS = {"Todas": "all", "Impares": "odd", "Pares": "even", "Rango": None}
+    WATERMARK_POSITION_OPTIONS = {
+        "Centro": "center", "Arriba izquierda": "top-left", "Arriba centro": "top-center",
+        "Arriba derecha": "top-right", "Abajo izquierda": "bottom-left",
+        "Abajo centro": "bottom-center", "Abajo derecha": "bottom-right"
+    }
+
+    def setup_watermark_context(self, parent):
+        ctk.CTkLabel(parent, text="Marca de agua / Numeración Bates", font=("Arial", 11, "bold")).pack(pady=(10, 5))
+        
+        self.entry_watermark_text = ctk.CTkEntry(parent, width=220, placeholder_text="Texto (ej: CONFIDENCIAL)")
+        self.entry_watermark_text.pack(pady=5)
+        
+        ctk.CTkButton(parent, text="🖼️ Imagen (opcional)", command=self.select_watermark_image).pack(pady=5)
+        self.watermark_image = None
+        self.lbl_watermark_image = ctk.CTkLabel(parent, text="Sin imagen", font=("Arial", 10, "italic"))
+        self.lbl_watermark_image.pack()
+        
+        ctk.CTkLabel(parent, text="Páginas:", font=("Arial", 10)).pack(pady=(10, 2))
+        self.watermark_pages_menu = ctk.CTkOptionMenu(parent, values=list(self.WATERMARK_PAGE_OPTIONS), width=220)
+        self.watermark_pages_menu.pack(pady=2)
+        self.entry_watermark_range = ctk.CTkEntry(parent, width=220, placeholder_text="Rango (ej: 1, 3, 5-10)")
+        self.entry_watermark_range.pack(pady=2)
+        
+        ctk.CTkLabel(parent, text="Posición:", font=("Arial", 10)).pack(pady=(10, 2))
+        self.watermark_position_menu = ctk.CTkOptionMenu(parent, values=list(self.WATERMARK_POSITION_OPTIONS), width=220)
+        self.watermark_position_menu.pack(pady=2)
+        
+        size_frame = ctk.CTkFrame(parent, fg_color="transparent")
+        size_frame.pack(pady=5)
+        ctk.CTkLabel(size_frame, text="Tamaño:").pack(side="left")
+        self.entry_watermark_size = ctk.CTkEntry(size_frame, width=50)
+        self.entry_watermark_size.insert(0, "48")
+        self.entry_watermark_size.pack(side="left", padx=2)
+        ctk.CTkLabel(size_frame, text="Opacidad:").pack(side="left", padx=(8, 0))
+        self.watermark_opacity = ctk.CTkSlider(size_frame, from_=0.1, to=1.0, width=80)
+        self.watermark_opacity.set(0.3)
+        self.watermark_opacity.pack(side="left", padx=2)
+        
+        self.watermark_bates_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(parent, text="Numeración Bates (en vez del texto)", variable=self.watermark_bates_var).pack(pady=(10, 2))
+        bates_frame = ctk.CTkFrame(parent, fg_color="transparent")
+        bates_frame.pack(pady=2)
+        self.entry_bates_prefix = ctk.CTkEntry(bates_frame, width=100, placeholder_text="Prefijo")
+        self.entry_bates_prefix.pack(side="left", padx=2)
+        self.entry_bates_start = ctk.CTkEntry(bates_frame, width=70, placeholder_text="Inicio")
+        self.entry_bates_start.pack(side="left", padx=2)
+        
+        ctk.CTkButton(parent, text="➕ Aplicar al PDF actual", command=self.apply_watermark_current,
+                      fg_color="#0066cc", height=35).pack(pady=(15, 5), fill="x", padx=20)
+        ctk.CTkButton(parent, text="📂 Aplicar a varios PDFs...", command=self.process_watermark_batch,
+                      height=35).pack(pady=5, fill="x", padx=20)
+        ctk.CTkButton(parent, text="💾 Guardar PDF", command=self.save_current_pdf, fg_color="#28a745", height=35).pack(pady=5, fill="x", padx=25)
+
+    def select_watermark_image(self):
+        f = filedialog.askopenfilename(filetypes=[("Image files", "*.png *.jpg *.jpeg *.gif *.bmp")])
+        if f:
+            self.watermark_image = f
+            self.lbl_watermark_image.configure(text=os.path.basename(f))
+
+    def _watermark_options(self):
+        """Opciones de pdf_tools.watermark_pdf leídas del panel (ValueError si son inválidas)"""
+        pages = self.WATERMARK_PAGE_OPTIONS[self.watermark_pages_menu.get()]
+        if pages is None:
+            pages = self.entry_watermark_range.get().strip()
+            if not pages:
+                raise ValueError("Indica el rango de páginas.")
+        position = self.WATERMARK_POSITION_OPTIONS[self.watermark_position_menu.get()]
+        font_size = float(self.entry_watermark_size.get())
+        options = {
+            'pages': pages,
+            'position': position,
+            'font_size': font_size,
+            'opacity': round(self.watermark_opacity.get(), 2),
+            'image_path': self.watermark_image,
+            'image_width': font_size * 4,
+            'image_height': font_size * 4,
+        }
+        if self.watermark_bates_var.get():
+            start = self.entry_bates_start.get().strip()
+            options.update({
+                'bates_prefix': self.entry_bates_prefix.get().strip(),
+                'bates_start': int(start) if start else 1,
+                'color': (0, 0, 0),
+                'opacity': 1.0
+            })
+        else:
+            text = self.entry_watermark_text.get().strip()
+            if not text and not self.watermark_image:
+                raise ValueError("Escribe un texto o selecciona una imagen.")
+            options['text'] = text or None
+        return options
+
+    def apply_watermark_current(self):
+        """Estampa la marca en el PDF abierto sobre un archivo temporal y lo recarga en el visor"""
+        if not self.current_pdf_path:
+            messagebox.showwarning("Aviso", "Abre un PDF primero.")
+            return
+        try:
+            options = self._watermark_options()
+            import tempfile
+            handle, temp_output = tempfile.mkstemp(suffix=".pdf")
+            os.close(handle)
+            
+            result = pdf_tools.watermark_pdf(self.current_pdf_path, temp_output, **options)
+            msg = f"Marca aplicada en {result['pages_stamped']} páginas."
+            if result['bates_first'] is not None:
+                msg += f"\nNúmeros Bates {result['bates_first']} a {result['bates_last']}."
+            messagebox.showinfo("Aplicado", msg + " Usa 'Guardar PDF' para permanencia.")
+            self.commit_edit("Marca de agua", temp_output)
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def process_watermark_batch(self):
+        """Estampa la marca en varios PDFs en paralelo, en segundo plano"""
+        try:
+            options = self._watermark_options()
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        files = filedialog.askopenfilenames(title="PDFs a marcar", filetypes=[("PDF files", "*.pdf")])
+        if not files:
+            return
+        output_dir = filedialog.askdirectory(title="Carpeta de destino")
+        if not output_dir:
+            return
+        
+        def run():
+            try:
+                results = pdf_tools.watermark_pdfs_batch(list(files), output_dir, **options)
+                self.after(0, lambda: self._show_watermark_batch_results(results, output_dir))
+            except Exception as e:
+                self.after(0, lambda msg=str(e): messagebox.showerror("Error", f"No se pudo procesar el lote: {msg}"))
+        
+        threading.Thread(target=run, daemon=True).start()
+        messagebox.showinfo("Marca de agua", f"Procesando {len(files)} PDFs en segundo plano. Se avisará al terminar.")
+
+    def _show_watermark_batch_results(self, results, output_dir):
+        done = [r for r in results if r['ok']]
+        failed = [r for r in results if not r['ok']]
+        msg = f"{len(done)} de {len(results)} PDFs marcados en {output_dir}."
+        numbered = [r for r in done if r.get('bates_first') is not None]
+        if numbered:
+            msg += f"\nNúmeros Bates {numbered[0]['bates_first']} a {numbered[-1]['bates_last']}."
+        if failed:
+            msg += "\n\nErrores:\n" + "\n".join(f"{os.path.basename(r['input'])}: {r['error']}" for r in failed[:10])
+            messagebox.showwarning("Marca de agua", msg)
+        else:
+            messagebox.showinfo("Marca de agua", msg)
+
+    # Resoluciones objetivo ofrecidas para pdf_tools.optimize_pdf
+    OPTIMIZE_DPI_OPTIONS = {"Pantalla (96 DPI)": 96, "Ebook (150 DPI)": 150,
+                            "Impresión (300 DPI)": 300}
+
+    def setup_optimize_context(self, parent):
+        ctk.CTkLabel(parent, text="Reducir tamaño del PDF", font=("Arial", 11, "bold")).pack(pady=(10, 5))
+        ctk.CTkLabel(parent, text="Reduce y recomprime las imágenes\nque superan la resolución elegida.",
+                     font=("Arial", 10)).pack(pady=2)
+        
+        ctk.CTkLabel(parent, text="Resolución:", font=("Arial", 10)).pack(pady=(10, 2))
+        self.optimize_dpi_menu = ctk.CTkOptionMenu(parent, values=list(self.OPTIMIZE_DPI_OPTIONS), width=220)
+        self.optimize_dpi_menu.set("Ebook (150 DPI)")
+        self.optimize_dpi_menu.pack(pady=2)
+        
+        quality_frame = ctk.CTkFrame(parent, fg_color="transparent")
+        quality_frame.pack(pady=5)
+        ctk.CTkLabel(quality_frame, text="Calidad JPEG:").pack(side="left")
+        self.optimize_quality = ctk.CTkSlider(quality_frame, from_=30, to=95, number_of_steps=13, width=120)
+        self.optimize_quality.set(75)
+        self.optimize_quality.pack(side="left", padx=2)
+        
+        ctk.CTkButton(parent, text="🗜️ Optimizar PDF actual...", command=self.optimize_current_pdf,
+                      fg_color="#0066cc", height=35).pack(pady=(15, 5), fill="x", padx=20)
+        ctk.CTkButton(parent, text="📂 Optimizar varios PDFs...", command=self.process_optimize_batch,
+                      height=35).pack(pady=5, fill="x", padx=20)
+
+    def _optimize_options(self):
+        return {
+            'target_dpi': self.OPTIMIZE_DPI_OPTIONS[self.optimize_dpi_menu.get()],
+            'jpeg_quality': int(self.optimize_quality.get())
+        }
+
+    def optimize_current_pdf(self):
+        """Guarda una copia optimizada del PDF abierto, en segundo plano"""
+        if not self.current_pdf_path:
+            messagebox.showwarning("Aviso", "Abre un PDF primero.")
+            return
+        base_name = os.path.splitext(os.path.basename(self.current_pdf_path))[0]
+        output_path = filedialog.asksaveasfilename(defaultextension=".pdf", initialfile=f"{base_name}_optimizado.pdf",
+                                                   filetypes=[("PDF files", "*.pdf")])
+        if not output_path:
+            return
+        options = self._optimize_options()
+        
+        def run():
+            try:
+                report = pdf_tools.optimize_pdf(self.current_pdf_path, output_path, **options)
+                self.after(0, lambda: self._show_optimize_results([report]))
+            except Exception as e:
+                self.after(0, lambda msg=str(e): messagebox.showerror("Error", f"No se pudo optimizar: {msg}"))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def process_optimize_batch(self):
+        files = filedialog.askopenfilenames(title="PDFs a optimizar", filetypes=[("PDF files", "*.pdf")])
+        if not files:
+            return
+        output_dir = filedialog.askdirectory(title="Carpeta de destino")
+        if not output_dir:
+            return
+        options = self._optimize_options()
+        
+        def run():
+            try:
+                results = pdf_tools.optimize_pdfs_batch(list(files), output_dir, **options)
+                self.after(0, lambda: self._show_optimize_results(results))
+            except Exception as e:
+                self.after(0, lambda msg=str(e): messagebox.showerror("Error", f"No se pudo procesar el lote: {msg}"))
+        
+        threading.Thread(target=run, daemon=True).start()
+        messagebox.showinfo("Optimizar", f"Optimizando {len(files)} PDFs en segundo plano. Se avisará al terminar.")
+
+    def _show_optimize_results(self, results):
+        lines = []
+        for r in results:
+            name = os.path.basename(r['input'])
+            if not r.get('ok', True):
+                lines.append(f"{name}: error - {r['error']}")
+                continue
+            ratio = r['saved_bytes'] / r['original_size'] if r['original_size'] else 0
+            lines.append(f"{name}: {r['original_size'] / 2**20:.1f} MB -> {r['optimized_size'] / 2**20:.1f} MB "
+                         f"(-{ratio:.0%}, {r['images_optimized']}/{r['images_total']} imágenes)")
+        messagebox.showinfo("Optimizar", "\n".join(lines[:20]))
+
+    def setup_corpus_search_context(self, parent):
+        ctk.CTkLabel(parent, text="Buscar en muchos PDFs", font=("Arial", 11, "bold")).pack(pady=(10, 5))
+        ctk.CTkLabel(parent, text="Indexa una carpeta una vez; al volver a\nindexarla solo se leen los PDFs nuevos\no modificados.",
+                     font=("Arial", 10)).pack(pady=2)
+        
+        ctk.CTkButton(parent, text="📂 Indexar carpeta...", command=self.index_corpus_folder,
+                      height=35).pack(pady=(10, 5), fill="x", padx=20)
+        self.corpus_status_label = ctk.CTkLabel(parent, text="", font=("Arial", 10, "italic"), wraplength=220)
+        self.corpus_status_label.pack(pady=2)
+        
+        self.entry_corpus_query = ctk.CTkEntry(parent, width=220, placeholder_text="Ej: fuerza mayor")
+        self.entry_corpus_query.pack(pady=(10, 5))
+        self.entry_corpus_query.bind("<Return>", lambda e: self.search_corpus())
+        ctk.CTkButton(parent, text="🔎 Buscar", command=self.search_corpus, fg_color="#0066cc",
+                      height=35).pack(pady=5, fill="x", padx=20)
+        
+        self.corpus_results_frame = ctk.CTkScrollableFrame(parent, height=260, width=220, fg_color="white")
+        self.corpus_results_frame.pack(pady=5, fill="x", padx=5)
+        
+        if self.corpus_folder:
+            self._set_corpus_status(f"Carpeta: {os.path.basename(self.corpus_folder)}")
+
+    def _get_corpus_index(self):
+        if self.corpus_index is None:
+            self.corpus_index = corpus_index.CorpusIndex()
+        return self.corpus_index
+
+    def _set_corpus_status(self, text):
+        # El panel puede haberse cerrado mientras se indexaba
+        if hasattr(self, 'corpus_status_label') and self.corpus_status_label.winfo_exists():
+            self.corpus_status_label.configure(text=text)
+
+    def index_corpus_folder(self):
+        """Indexa (o pone al día) una carpeta de PDFs en segundo plano"""
+        folder = filedialog.askdirectory(title="Carpeta de PDFs")
+        if not folder:
+            return
+        self.corpus_folder = folder
+        self._set_corpus_status("Buscando PDFs...")
+        
+        def progress(done, total):
+            self.after(0, self._set_corpus_status, f"Indexando... {done}/{total}")
+        
+        def run():
+            try:
+                report = self._get_corpus_index().update(folder, progress=progress)
+            except Exception as e:
+                self.after(0, lambda msg=str(e): messagebox.showerror("Error", f"No se pudo indexar: {msg}"))
+                self.after(0, self._set_corpus_status, "")
+                return
+            text = (f"{report['files']} PDFs: {report['added']} nuevos, {report['updated']} actualizados, "
+                    f"{report['unchanged']} sin cambios")
+            if report['removed']:
+                text += f", {report['removed']} quitados"
+            if report['failed']:
+                text += f", {report['failed']} ilegibles"
+            self.after(0, self._set_corpus_status, text)
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def search_corpus(self):
+        query = self.entry_corpus_query.get().strip()
+        if not query:
+            return
+        try:
+            hits = self._get_corpus_index().search(query, folder=self.corpus_folder)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error en la búsqueda: {str(e)}")
+            return
+        
+        for widget in self.corpus_results_frame.winfo_children():
+            widget.destroy()
+        if not hits:
+            ctk.CTkLabel(self.corpus_results_frame, text="Sin resultados", font=("Arial", 10, "italic")).pack(pady=5)
+            return
+        for hit in hits:
+            snippet = " ".join(hit['snippet'].split())
+            ctk.CTkButton(self.corpus_results_frame, text=f"{os.path.basename(hit['path'])} · pág {hit['page']}\n{snippet[:60]}",
+                          anchor="w", fg_color="transparent", text_color="black", hover_color="#e8f0fe",
+                          font=("Arial", 10), command=lambda h=hit: self.open_corpus_hit(h)).pack(fill="x", pady=1)
+
+    def open_corpus_hit(self, hit):
+        """Abre el PDF de un resultado, salta a su página y resalta las coincidencias"""
+        if not os.path.exists(hit['path']):
+            messagebox.showwarning("Aviso", "El archivo ya no existe. Vuelve a indexar la carpeta.")
+            return
+        # Se compara con lo que muestra el visor, no con current_pdf_path
+        if hit['path'] != self.pdf_viewer.current_pdf:
+            self.open_pdf(hit['path'])
+        
+        def show():
+            self.pdf_viewer.clear_search_highlights()
+            for rect in hit['rects']:
+                self.pdf_viewer.highlight_search_result(hit['page'], rect)
+            self.pdf_viewer.scroll_to_page(hit['page'])
+        
+        def dropped():
+            messagebox.showwarning("Aviso", "Se abrió otro documento antes de mostrar el resultado.")
+        
+        self.after_pages_ready(hit['path'], show, on_dropped=dropped)
+
     def select_tab_reorder(self):
         if not self.current_pdf_path:
             self.open_pdf_dialog()
@@ -1240,12 +3083,26 @@ class PDFEditorApp(ctk.CTk):
         self.entry_new_order = ctk.CTkEntry(parent, width=220, placeholder_text="Ej: 3, 1, 2")
         self.entry_new_order.pack(pady=5)
         
+        ctk.CTkLabel(parent, text="Ctrl+clic en las miniaturas para seleccionar", font=("Arial", 10, "italic")).pack(pady=2)
+        ctk.CTkButton(parent, text="📌 Selección al inicio", command=self.move_selection_to_front, fg_color="#6c757d").pack(pady=5)
+        
         btn_reorder = ctk.CTkButton(parent, text="🚀 Reordenar y Ver", command=self.process_reorder, fg_color="#0066cc", height=35)
         btn_reorder.pack(pady=20, fill="x", padx=25)
 
+    def move_selection_to_front(self):
+        """Rellena el nuevo orden con las páginas seleccionadas primero y el resto detrás"""
+        selected = sorted(self.pdf_viewer.selected_pages)
+        if not selected:
+            messagebox.showwarning("Aviso", "Selecciona páginas en las miniaturas (Ctrl+clic).")
+            return
+        total_pages = len(self.pdf_viewer.pages_data)
+        rest = [p for p in range(1, total_pages + 1) if p not in self.pdf_viewer.selected_pages]
+        self.entry_new_order.delete(0, 'end')
+        self.entry_new_order.insert(0, ", ".join(str(p) for p in selected + rest))
+
     def setup_split_context(self, parent):
         ctk.CTkLabel(parent, text="Dividir / Extraer Páginas", font=("Arial", 11, "bold")).pack(pady=(10, 2))
-        ctk.CTkLabel(parent, text="(ej: 1, 3, 5-10 o vacío para todas)", font=("Arial", 10, "italic")).pack(pady=(0, 10))
+        ctk.CTkLabel(parent, text="(ej: 1, 3, 5-10, vacío para la selección\nde miniaturas o para todas)", font=("Arial", 10, "italic")).pack(pady=(0, 10))
         
         self.entry_split_pages = ctk.CTkEntry(parent, width=220, placeholder_text="Ej: 1-5, 8, 10")
         self.entry_split_pages.pack(pady=5)
@@ -1287,20 +3144,28 @@ class PDFEditorApp(ctk.CTk):
         """Abre el selector de archivos y carga el PDF en el visor"""
         f = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
         if f:
-            self.current_pdf_path = f
-            # Actualizar todos los flags de archivos antiguos para compatibilidad
-            # These are now mostly redundant as tools will use current_pdf_path directly
-            # but kept for any potential legacy references in other parts of the code not shown.
-            self.add_text_file = f
-            self.add_image_file = f
-            self.rotate_file = f
-            self.split_file = f
-            self.delete_pages_file = f
-            self.reorder_file = f
-            self.extract_file = f
-            
-            self.pdf_viewer.load_pdf(f)
-            self.title(f"Editor PDF Pro - {os.path.basename(f)}")
+            self.open_pdf(f)
+
+    def open_pdf(self, f):
+        """Carga f como documento actual (sin historial de deshacer)"""
+        self.current_pdf_path = f
+        self.cancel_search(clear=True)
+        # Actualizar todos los flags de archivos antiguos para compatibilidad
+        # These are now mostly redundant as tools will use current_pdf_path directly
+        # but kept for any potential legacy references in other parts of the code not shown.
+        self.add_text_file = f
+        self.add_image_file = f
+        self.rotate_file = f
+        self.split_file = f
+        self.delete_pages_file = f
+        self.reorder_file = f
+        self.extract_file = f
+        
+        self.history.clear()
+        self.update_history_buttons()
+        self.pdf_viewer.load_pdf(f)
+        self.title(f"Editor PDF Pro - {os.path.basename(f)}")
+        self.journal_snapshot()
 
     # --- Logic Operations ---
 
@@ -1321,7 +3186,9 @@ class PDFEditorApp(ctk.CTk):
             selected_text = self.listbox_merge.get("sel.first", "sel.last").strip()
             if selected_text:
                 for f in self.merge_files:
-                    if os.path.basename(f) == selected_text:
+                    # Las líneas llevan el número de páginas detrás del nombre
+                    name = os.path.basename(f)
+                    if selected_text == name or selected_text.startswith(name + " ("):
                         self.merge_files.remove(f)
                         break
             else:
@@ -1343,8 +3210,19 @@ class PDFEditorApp(ctk.CTk):
     def update_merge_list(self):
         self.listbox_merge.configure(state="normal")
         self.listbox_merge.delete("0.0", "end")
+        total_pages = 0
         for f in self.merge_files:
-            self.listbox_merge.insert("end", f"{os.path.basename(f)}\n")
+            # probe_pdf solo lee xref/trailer y cachea por (ruta, mtime, tamaño)
+            try:
+                info = pdf_tools.probe_pdf(f)
+                pages = info['page_count']
+                detail = "🔒" if pages is None else f"{pages} págs"
+                total_pages += pages or 0
+            except Exception:
+                detail = "ilegible"
+            self.listbox_merge.insert("end", f"{os.path.basename(f)} ({detail})\n")
+        if self.merge_files:
+            self.listbox_merge.insert("end", f"Total: {total_pages} páginas\n")
         self.listbox_merge.configure(state="disabled")
 
     def process_merge(self):
@@ -1355,7 +3233,7 @@ class PDFEditorApp(ctk.CTk):
         output = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
         if output:
             try:
-                pdf_tools.merge_pdfs(self.merge_files, output)
+                pdf_tools.merge_pdfs(self.merge_files, output, linearize=self.linearize_output_var.get())
                 messagebox.showinfo("Éxito", "Archivos unidos correctamente.")
                 self.merge_files = []
                 self.update_merge_list()
@@ -1372,7 +3250,11 @@ class PDFEditorApp(ctk.CTk):
         
         try:
             max_p = pdf_tools.get_pdf_page_count(self.current_pdf_path)
-            pages = pdf_tools.parse_page_range(range_str, max_p)
+            if not range_str.strip() and self.pdf_viewer.selected_pages:
+                # Sin rango explícito: usar las páginas seleccionadas en las miniaturas
+                pages = [p - 1 for p in sorted(self.pdf_viewer.selected_pages) if 1 <= p <= max_p]
+            else:
+                pages = pdf_tools.parse_page_range(range_str, max_p)
             
             if not pages:
                 messagebox.showwarning("Aviso", "No se identificaron páginas válidas para extraer.")
@@ -1381,12 +3263,14 @@ class PDFEditorApp(ctk.CTk):
             if combine_single:
                 output = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
                 if output:
-                    pdf_tools.extract_pages_to_one_pdf(self.current_pdf_path, output, pages)
+                    pdf_tools.extract_pages_to_one_pdf(self.current_pdf_path, output, pages,
+                                                        linearize=self.linearize_output_var.get())
                     messagebox.showinfo("Éxito", f"Páginas extraídas en: {output}")
             else:
                 output_dir = filedialog.askdirectory()
                 if output_dir:
-                    pdf_tools.split_pdf(self.current_pdf_path, output_dir, pages_to_extract=pages)
+                    pdf_tools.split_pdf(self.current_pdf_path, output_dir, pages_to_extract=pages,
+                                        linearize=self.linearize_output_var.get())
                     messagebox.showinfo("Éxito", f"PDF dividido en {output_dir}")
         except Exception as e:
             messagebox.showerror("Error", str(e))
@@ -1497,9 +3381,10 @@ class PDFEditorApp(ctk.CTk):
                 'font_size': font_size,
                 'color': (r, g, b)
             })
+            self.journal_add('texts', self.pending_texts[-1])
             
-            # Dibujar overlay
-            self.pdf_viewer.draw_text_overlay(page_num, pdf_x, pdf_y, text, font_size)
+            # Vista previa con la apariencia final, solo de esta página
+            self.refresh_pending_preview(page_num)
             
             # Actualizar lista
             self.update_pending_texts_list()
@@ -1507,6 +3392,24 @@ class PDFEditorApp(ctk.CTk):
         except ValueError:
             messagebox.showerror("Error", "Verifica que el tamaño de fuente sea correcto.")
 
+    def refresh_pending_preview(self, page_num):
+        """Recompone en el visor la vista previa de los textos e imágenes pendientes de una página"""
+        try:
+            self.pdf_viewer.set_page_previews(
+                page_num,
+                texts=[t for t in self.pending_texts if t['page'] == page_num],
+                images=[i for i in self.pending_images if i['page'] == page_num])
+        except Exception as e:
+            print(f"Error al componer la vista previa: {e}")
+
+    def refresh_pending_previews(self):
+        """Recompone las páginas con cambios pendientes o que aún muestran una vista previa"""
+        pages = self.pdf_viewer.preview_pages()
+        pages.update(t['page'] for t in self.pending_texts)
+        pages.update(i['page'] for i in self.pending_images)
+        for page_num in sorted(pages):
+            self.refresh_pending_preview(page_num)
+
     def update_pending_texts_list(self):
         """Actualiza la lista de textos pendientes"""
         self.pending_texts_list.configure(state="normal")
@@ -1520,8 +3423,10 @@ class PDFEditorApp(ctk.CTk):
     def clear_pending_texts(self):
         """Limpia todos los textos pendientes"""
         self.pending_texts = []
+        self.journal_clear('texts')
         self.update_pending_texts_list()
         self.pdf_viewer.clear_overlays()
+        self.refresh_pending_previews()
 
     def apply_texts_temp(self):
         """Aplica los textos de forma temporal para previsualización"""
@@ -1538,17 +3443,12 @@ class PDFEditorApp(ctk.CTk):
             handle, temp_output = tempfile.mkstemp(suffix=".pdf")
             os.close(handle)
             
-            current_file = self.current_pdf_path
-            for i, item in enumerate(self.pending_texts):
-                pdf_tools.add_text_to_pdf(current_file, temp_output, item['text'], 
-                                         item['page'], item['x'], item['y'], 
-                                         item['font_size'], item['color'])
-                current_file = temp_output
+            # Todos los textos en una sola escritura; los repetidos comparten sello
+            pdf_tools.add_stamps_to_pdf(self.current_pdf_path, temp_output, texts=self.pending_texts)
             
             messagebox.showinfo("Aplicado", "Textos aplicados visualmente. Usa 'Guardar PDF' para permanencia.")
             self.clear_pending_texts()
-            self.current_pdf_path = temp_output
-            self.pdf_viewer.load_pdf(temp_output)
+            self.commit_edit("Textos", temp_output)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -1579,9 +3479,10 @@ class PDFEditorApp(ctk.CTk):
                 'width': width,
                 'height': height
             })
+            self.journal_add('images', self.pending_images[-1])
             
-            # Dibujar overlay
-            self.pdf_viewer.draw_image_overlay(page_num, pdf_x, pdf_y, width, height)
+            # Vista previa con la apariencia final, solo de esta página
+            self.refresh_pending_preview(page_num)
             
             # Actualizar listas (puede haber dos diferentes según la pestaña)
             self.update_pending_images_lists()
@@ -1612,8 +3513,10 @@ class PDFEditorApp(ctk.CTk):
     def clear_pending_images(self):
         """Limpia todas las imágenes pendientes"""
         self.pending_images = []
+        self.journal_clear('images')
         self.update_pending_images_lists()
         self.pdf_viewer.clear_overlays()
+        self.refresh_pending_previews()
 
     def apply_images_temp(self):
         """Aplica las imágenes de forma temporal para previsualización"""
@@ -1630,17 +3533,12 @@ class PDFEditorApp(ctk.CTk):
             handle, temp_output = tempfile.mkstemp(suffix=".pdf")
             os.close(handle)
             
-            current_file = self.current_pdf_path
-            for i, item in enumerate(self.pending_images):
-                pdf_tools.add_image_to_pdf(current_file, temp_output, item['path'], 
-                                          item['page'], item['x'], item['y'], 
-                                          item['width'], item['height'])
-                current_file = temp_output
+            # Todas las imágenes en una sola escritura; cada imagen se codifica una vez
+            pdf_tools.add_stamps_to_pdf(self.current_pdf_path, temp_output, images=self.pending_images)
             
             messagebox.showinfo("Aplicado", "Imágenes aplicadas visualmente. Usa 'Guardar PDF' para permanencia.")
             self.clear_pending_images()
-            self.current_pdf_path = temp_output
-            self.pdf_viewer.load_pdf(temp_output)
+            self.commit_edit("Imágenes", temp_output)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -1660,22 +3558,12 @@ class PDFEditorApp(ctk.CTk):
             handle, temp_output = tempfile.mkstemp(suffix=".pdf")
             os.close(handle)
             
-            current_file = self.current_pdf_path
-            for i, item in enumerate(self.pending_images):
-                # Si hay múltiples firmas, usamos una ruta intermedia excepto para la última
-                step_output = temp_output if i == len(self.pending_images) - 1 else f"{temp_output}_step_{i}.pdf"
-                pdf_tools.add_image_to_pdf(current_file, step_output, item['path'], 
-                                          item['page'], item['x'], item['y'], 
-                                          item['width'], item['height'])
-                current_file = step_output
-            
-            # Limpiar archivos de pasos intermedios si existen
-            # (Simplificado por ahora)
+            # Todas las firmas en una sola escritura, sin archivos intermedios
+            pdf_tools.add_stamps_to_pdf(self.current_pdf_path, temp_output, images=self.pending_images)
             
             messagebox.showinfo("Aplicado", "Firma(s) aplicada(s) visualmente. No olvides Guardar para mantener los cambios.")
             self.clear_pending_images()
-            self.current_pdf_path = temp_output
-            self.pdf_viewer.load_pdf(temp_output)
+            self.commit_edit("Firma", temp_output)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -1697,8 +3585,7 @@ class PDFEditorApp(ctk.CTk):
                 pdf_tools.delete_pages(self.current_pdf_path, output, pages_to_delete)
                 messagebox.showinfo("Éxito", f"{len(pages_to_delete)} página(s) eliminada(s).")
                 self.pdf_viewer.selected_pages.clear()
-                self.current_pdf_path = output
-                self.pdf_viewer.load_pdf(output)
+                self.commit_edit("Eliminar páginas", output)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
@@ -1720,8 +3607,7 @@ class PDFEditorApp(ctk.CTk):
             if output:
                 pdf_tools.reorder_pages(self.current_pdf_path, output, new_order)
                 messagebox.showinfo("Éxito", "Páginas reordenadas correctamente.")
-                self.current_pdf_path = output
-                self.pdf_viewer.load_pdf(output)
+                self.commit_edit("Reordenar páginas", output)
         except ValueError:
             messagebox.showerror("Error", "Formato inválido. Usa: 3,1,2")
         except Exception as e:
@@ -1730,4 +3616,6 @@ class PDFEditorApp(ctk.CTk):
 
 if __name__ == "__main__":
     app = PDFEditorApp()
+    _mark_startup("ventana construida")
+    app.after_idle(lambda: (_mark_startup("primer ciclo de eventos"), print_startup_report()))
     app.mainloop()
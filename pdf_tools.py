@@ -1,14 +1,329 @@
 import os
+import io
+import math
+import hashlib
+import functools
+import threading
+import unicodedata
 from pypdf import PdfWriter, PdfReader
+import instrumentation
+import byte_range
 
-def merge_pdfs(file_list, output_path):
+# --- Perfil de salida ---
+# Cómo se serializan todos los PDFs que escribe este módulo:
+#   compress_streams:  comprime con Flate los streams que estén sin filtro (contenido de páginas, formularios...)
+#   object_streams:    empaqueta los objetos que no son streams en object streams (PDF 1.5) y escribe
+#                      la tabla de referencias como cross-reference stream
+#   compression_level: nivel de zlib (0-9, -1 = el de zlib por defecto)
+OUTPUT_PROFILES = {
+    'compatible': {'compress_streams': False, 'object_streams': False, 'compression_level': -1},
+    'compacto': {'compress_streams': True, 'object_streams': True, 'compression_level': 6},
+    'maximo': {'compress_streams': True, 'object_streams': True, 'compression_level': 9},
+}
+DEFAULT_OUTPUT_PROFILE = os.environ.get("PDF_EDITOR_OUTPUT_PROFILE", "compacto")
+# Objetos por object stream: más objetos comprimen mejor pero obligan a descomprimir más para leer uno
+OBJECT_STREAM_SIZE = 200
+
+_output_profile = dict(OUTPUT_PROFILES.get(DEFAULT_OUTPUT_PROFILE, OUTPUT_PROFILES['compacto']))
+
+def set_output_profile(profile=None, **overrides):
+    """
+    Cambia el perfil de salida usado por todas las funciones que escriben PDFs.
+    profile: nombre de OUTPUT_PROFILES (o None para conservar el actual); overrides: claves sueltas.
+    """
+    global _output_profile
+    if profile is not None:
+        if profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Perfil de salida desconocido: {profile}")
+        new_profile = dict(OUTPUT_PROFILES[profile])
+    else:
+        new_profile = dict(_output_profile)
+    unknown = set(overrides) - set(new_profile)
+    if unknown:
+        raise ValueError(f"Opciones de salida desconocidas: {', '.join(sorted(unknown))}")
+    new_profile.update(overrides)
+    _output_profile = new_profile
+
+def get_output_profile():
+    return dict(_output_profile)
+
+def _compress_streams(writer, level):
+    """Comprime con Flate los streams sin filtro del writer (solo si el resultado es menor)"""
+    from pypdf.generic import StreamObject
+    
+    for obj in list(writer._objects):
+        if not isinstance(obj, StreamObject) or '/Filter' in obj or obj.get('/Type') in ('/Metadata', '/XRef'):
+            continue
+        if obj.indirect_reference is None or len(obj._data) < 64:
+            continue
+        encoded = obj.flate_encode(level=level)
+        if len(encoded._data) < len(obj._data):
+            writer._replace_object(obj.indirect_reference, encoded)
+
+def _write_object_streams(stream, packable, next_idnum, entries, level):
+    """
+    Escribe packable [(idnum, bytes del objeto)] en object streams de OBJECT_STREAM_SIZE objetos,
+    numerados a partir de next_idnum, y anota en entries dónde queda cada objeto.
+    Retorna el siguiente número de objeto libre.
+    """
+    from pypdf.generic import DecodedStreamObject, NameObject, NumberObject
+    
+    for start in range(0, len(packable), OBJECT_STREAM_SIZE):
+        chunk = packable[start:start + OBJECT_STREAM_SIZE]
+        stream_idnum = next_idnum
+        next_idnum += 1
+        offsets = []
+        body = io.BytesIO()
+        for index, (idnum, data) in enumerate(chunk):
+            offsets.append(f"{idnum} {body.tell()}")
+            body.write(data)
+            body.write(b"\n")
+            entries[idnum] = (2, stream_idnum, index)
+        index_bytes = (" ".join(offsets) + "\n").encode()
+        object_stream = DecodedStreamObject()
+        object_stream.set_data(index_bytes + body.getvalue())
+        object_stream.update({
+            NameObject('/Type'): NameObject('/ObjStm'),
+            NameObject('/N'): NumberObject(len(chunk)),
+            NameObject('/First'): NumberObject(len(index_bytes)),
+        })
+        entries[stream_idnum] = (1, stream.tell(), 0)
+        stream.write(f"{stream_idnum} 0 obj\n".encode())
+        object_stream.flate_encode(level=level).write_to_stream(stream)
+        stream.write(b"\nendobj\n")
+    return next_idnum
+
+def _write_xref_stream(stream, entries, xref_idnum, trailer, level):
+    """
+    Escribe la tabla de referencias como cross-reference stream (objeto xref_idnum, el último)
+    y el final del archivo.
+    entries[idnum] = (tipo, campo2, campo3) según la tabla 18 de ISO 32000-1
+    trailer: claves del trailer que se copian al stream (/Root, /Info, /ID)
+    """
+    import struct
+    from pypdf.generic import ArrayObject, DecodedStreamObject, NameObject, NumberObject
+    
+    size = xref_idnum + 1
+    xref_location = stream.tell()
+    entries = {0: (0, 0, 65535), **entries, xref_idnum: (1, xref_location, 0)}
+    offset_width = max(4, (max(field for _, field, _ in entries.values()).bit_length() + 7) // 8)
+    rows = []
+    for idnum in range(size):
+        kind, field2, field3 = entries.get(idnum, (0, 0, 0))
+        rows.append(struct.pack(">B", kind) + field2.to_bytes(offset_width, "big") + struct.pack(">H", field3))
+    
+    xref_stream = DecodedStreamObject()
+    xref_stream.set_data(b"".join(rows))
+    xref_stream.update({
+        NameObject('/Type'): NameObject('/XRef'),
+        NameObject('/Size'): NumberObject(size),
+        NameObject('/W'): ArrayObject([NumberObject(1), NumberObject(offset_width), NumberObject(2)]),
+    })
+    for key, value in trailer.items():
+        xref_stream[NameObject(key)] = value
+    stream.write(f"{xref_idnum} 0 obj\n".encode())
+    xref_stream.flate_encode(level=level).write_to_stream(stream)
+    stream.write(f"\nendobj\nstartxref\n{xref_location}\n%%EOF\n".encode())
+
+def _write_with_object_streams(writer, stream, level):
+    """
+    Serializa el writer con object streams y un cross-reference stream (PDF 1.5).
+    Los streams se escriben sueltos; el resto de objetos se agrupan de OBJECT_STREAM_SIZE en OBJECT_STREAM_SIZE.
+    """
+    from pypdf.generic import StreamObject
+    
+    writer._resolve_links()
+    header = writer.pdf_header
+    if header < "%PDF-1.5":
+        header = "%PDF-1.5"
+    stream.write(header.encode() + b"\n%\xE2\xE3\xCF\xD3\n")
+    
+    entries = {}
+    packable = []
+    for idnum, obj in enumerate(writer._objects, start=1):
+        if obj is None:
+            continue
+        if isinstance(obj, StreamObject):
+            # Un stream no puede ir dentro de un object stream
+            entries[idnum] = (1, stream.tell(), 0)
+            stream.write(f"{idnum} 0 obj\n".encode())
+            obj.write_to_stream(stream)
+            stream.write(b"\nendobj\n")
+        else:
+            body = io.BytesIO()
+            obj.write_to_stream(body)
+            packable.append((idnum, body.getvalue()))
+    
+    next_idnum = _write_object_streams(stream, packable, len(writer._objects) + 1, entries, level)
+    trailer = {'/Root': writer.root_object.indirect_reference}
+    if writer._info is not None:
+        trailer['/Info'] = writer._info.indirect_reference
+    if writer._ID is not None:
+        trailer['/ID'] = writer._ID
+    _write_xref_stream(stream, entries, next_idnum, trailer, level)
+
+def write_pdf(writer, output, profile=None, linearize=False):
+    """
+    Escribe un PdfWriter en output (ruta o archivo binario) aplicando el perfil de salida.
+    profile: nombre de OUTPUT_PROFILES o diccionario de opciones; None usa el perfil activo.
+    linearize: escribe el PDF linealizado ("vista web rápida", ver linearize_pdf)
+    """
+    if profile is None:
+        options = _output_profile
+    elif isinstance(profile, str):
+        options = OUTPUT_PROFILES[profile]
+    else:
+        options = {**_output_profile, **profile}
+    level = options['compression_level']
+    
+    if linearize:
+        buffer = io.BytesIO()
+        write_pdf(writer, buffer, profile=options)
+        buffer.seek(0)
+        _linearize(buffer, output, options)
+        return
+    
+    with instrumentation.span('pypdf.write', objects=len(writer._objects)):
+        if options['compress_streams']:
+            _compress_streams(writer, level)
+        # Los PDFs cifrados cifran cada objeto por separado: se escriben con la tabla clásica
+        if not options['object_streams'] or writer._encryption is not None:
+            writer.write(output)
+            return
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, 'wb') as output_file:
+                _write_with_object_streams(writer, output_file, level)
+        else:
+            _write_with_object_streams(writer, output, level)
+            output.flush()
+
+# --- Linealización (vista web rápida) ---
+
+def _linearize(source, output, options):
+    """
+    Reescribe source (ruta o archivo binario) linealizado en output usando qpdf (pikepdf):
+    diccionario de linealización y objetos de la primera página al principio, más la tabla
+    de pistas (hint stream) para que el visor pida el resto de páginas por rangos.
+    """
+    import pikepdf
+    
+    with instrumentation.span('pikepdf.linearize'):
+        with pikepdf.open(source) as pdf:
+            pdf.save(output, linearize=True, compress_streams=options['compress_streams'],
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate if options['object_streams']
+                     else pikepdf.ObjectStreamMode.disable)
+
+def linearize_pdf(input_path, output_path, profile=None):
+    """
+    Guarda una copia linealizada de un PDF existente (input_path y output_path pueden coincidir).
+    profile: perfil de salida (ver write_pdf); None usa el activo.
+    """
+    if profile is None:
+        options = _output_profile
+    elif isinstance(profile, str):
+        options = OUTPUT_PROFILES[profile]
+    else:
+        options = {**_output_profile, **profile}
+    # qpdf lee el original de forma perezosa: se escribe a un temporal y se renombra
+    tmp_path = f"{output_path}.tmp"
+    try:
+        _linearize(input_path, tmp_path, options)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def check_linearization(file_path):
+    """
+    Comprueba si un PDF está linealizado y si la linealización sigue siendo válida
+    (p.ej. una actualización incremental posterior la invalida).
+    Retorna: diccionario {linearized, valid, problems, first_page_object, first_page_end,
+             hint_offset, page_count, file_size}
+    """
+    import re
+    
+    file_size = os.path.getsize(file_path)
+    result = {
+        'linearized': False,
+        'valid': False,
+        'problems': [],
+        'first_page_object': None,
+        'first_page_end': None,
+        'hint_offset': None,
+        'page_count': None,
+        'file_size': file_size
+    }
+    with open(file_path, 'rb') as f:
+        head = f.read(2048)
+    
+    # El diccionario de linealización tiene que ser el primer objeto del archivo
+    match = re.search(rb'\d+\s+\d+\s+obj\s*<<(.*?)>>', head, re.S)
+    if not match or b'/Linearized' not in match.group(1):
+        return result
+    result['linearized'] = True
+    params = match.group(1)
+    
+    def number(key):
+        found = re.search(rb'/' + key + rb'\s+(\d+)', params)
+        return int(found.group(1)) if found else None
+    
+    length = number(b'L')
+    result['first_page_object'] = number(b'O')
+    result['first_page_end'] = number(b'E')
+    result['page_count'] = number(b'N')
+    hint = re.search(rb'/H\s*\[\s*(\d+)\s+(\d+)', params)
+    result['hint_offset'] = int(hint.group(1)) if hint else None
+    problems = result['problems']
+    
+    if None in (length, result['first_page_object'], result['first_page_end'], result['page_count'], hint):
+        problems.append("Faltan claves obligatorias en el diccionario de linealización")
+    if length is not None and length != file_size:
+        problems.append(f"/L ({length}) no coincide con el tamaño del archivo ({file_size}): "
+                        "se modificó después de linealizarlo")
+    if result['first_page_end'] is not None and result['first_page_end'] > file_size:
+        problems.append("/E apunta fuera del archivo")
+    if hint is not None:
+        with open(file_path, 'rb') as f:
+            f.seek(int(hint.group(1)))
+            if not re.match(rb'\s*\d+\s+\d+\s+obj', f.read(32)):
+                problems.append("/H no apunta al hint stream")
+    
+    try:
+        reader = PdfReader(file_path)
+        if result['page_count'] is not None and result['page_count'] != len(reader.pages):
+            problems.append(f"/N ({result['page_count']}) no coincide con el número de páginas ({len(reader.pages)})")
+        first_page = reader.pages[0].indirect_reference
+        if first_page is not None and first_page.idnum != result['first_page_object']:
+            problems.append("/O no es el objeto de la primera página")
+    except Exception as e:
+        problems.append(f"No se pudo leer el PDF: {e}")
+    
+    try:
+        # qpdf valida además las tablas de pistas, si está disponible
+        import pikepdf
+        report = io.StringIO()
+        with pikepdf.open(file_path) as pdf:
+            if not pdf.check_linearization(report):
+                issues = [line for line in report.getvalue().splitlines() if line.strip()]
+                problems.extend(issues or ["qpdf: linealización inválida"])
+    except ImportError:
+        pass
+    except Exception as e:
+        problems.append(str(e))
+    
+    result['valid'] = not problems
+    return result
+
+@instrumentation.traced('pdf_tools.merge_pdfs')
+def merge_pdfs(file_list, output_path, linearize=False):
     """
     Une una lista de archivos PDF en uno solo.
+    linearize: guarda el resultado linealizado (vista web rápida)
     """
     merger = PdfWriter()
     for pdf in file_list:
         merger.append(pdf)
-    merger.write(output_path)
+    write_pdf(merger, output_path, linearize=linearize)
     merger.close()
 
 def parse_page_range(range_str, max_pages):
@@ -42,10 +357,12 @@ def parse_page_range(range_str, max_pages):
                 
     return sorted(list(pages))
 
-def split_pdf(file_path, output_dir, pages_to_extract=None):
+@instrumentation.traced('pdf_tools.split_pdf')
+def split_pdf(file_path, output_dir, pages_to_extract=None, linearize=False):
     """
     Divide un PDF en archivos individuales. 
     pages_to_extract: lista de índices 0-indexed. Si es None, divide todo.
+    linearize: guarda cada archivo linealizado (vista web rápida)
     """
     reader = PdfReader(file_path)
     base_name = os.path.splitext(os.path.basename(file_path))[0]
@@ -60,16 +377,17 @@ def split_pdf(file_path, output_dir, pages_to_extract=None):
             writer = PdfWriter()
             writer.add_page(reader.pages[i])
             output_filename = os.path.join(output_dir, f"{base_name}_page_{i+1}.pdf")
-            writer.write(output_filename)
+            write_pdf(writer, output_filename, linearize=linearize)
             writer.close()
             generated_files.append(output_filename)
         
     return generated_files
 
-def extract_pages_to_one_pdf(input_path, output_path, pages):
+def extract_pages_to_one_pdf(input_path, output_path, pages, linearize=False):
     """
     Extrae páginas específicas a un nuevo archivo PDF único.
     pages: lista de índices 0-indexed.
+    linearize: guarda el resultado linealizado (vista web rápida)
     """
     reader = PdfReader(input_path)
     writer = PdfWriter()
@@ -79,7 +397,7 @@ def extract_pages_to_one_pdf(input_path, output_path, pages):
             writer.add_page(reader.pages[i])
             
     with open(output_path, 'wb') as f:
-        writer.write(f)
+        write_pdf(writer, f, linearize=linearize)
     writer.close()
 
 def rotate_pdf(file_path, degrees, output_path):
@@ -93,19 +411,164 @@ def rotate_pdf(file_path, degrees, output_path):
         page.rotate(degrees)
         writer.add_page(page)
         
-    writer.write(output_path)
+    write_pdf(writer, output_path)
     writer.close()
 
-def extract_text(file_path):
+# Archivos locales a partir de este tamaño se leen por rangos en vez de cargarse enteros
+LAZY_READ_THRESHOLD = int(os.environ.get("PDF_EDITOR_LAZY_READ_MB", "64")) * 1024 * 1024
+
+def _lazy_reader(stream):
     """
-    Extrae el texto de un archivo PDF.
+    PdfReader que solo lee lo que se le pide. En modo no estricto pypdf salta a la cabecera
+    de cada objeto de la xref al construirse (lo que equivale a leer el archivo entero), así
+    que se construye en modo estricto y después se relaja para el resto de la lectura.
+    Si la xref está dañada hace falta la reparación de pypdf, que sí recorre todo el archivo.
     """
-    reader = PdfReader(file_path)
+    from pypdf.errors import PdfReadError
+    
+    try:
+        reader = PdfReader(stream, strict=True)
+    except (PdfReadError, ValueError):
+        instrumentation.count('pypdf.lazy_read_fallback')
+        stream.seek(0)
+        return PdfReader(stream)
+    reader.strict = False
+    return reader
+
+def open_reader(source):
+    """
+    PdfReader sobre una ruta local, una URL http(s) o un byte_range.RangeFile.
+    Las URLs y los archivos locales de más de LAZY_READ_THRESHOLD se leen por rangos: solo
+    se traen la xref, el trailer y los objetos que se usan. Los archivos menores se cargan
+    enteros en memoria (más rápido que leerlos por bloques).
+    """
+    if byte_range.is_url(source):
+        source = byte_range.open_source(source)
+    elif isinstance(source, (str, os.PathLike)) and os.path.getsize(source) >= LAZY_READ_THRESHOLD:
+        source = byte_range.open_source(os.fspath(source))
+    if isinstance(source, byte_range.RangeFile):
+        return _lazy_reader(source)
+    return PdfReader(source)
+
+def count_page_tree(pages_node):
+    """
+    Cuenta las hojas del árbol de páginas siguiendo solo /Kids, para cuando /Count falta o no
+    es fiable: no se construyen objetos de página ni se leen sus recursos.
+    """
+    count = 0
+    seen = set()
+    stack = [pages_node]
+    while stack:
+        node = stack.pop()
+        ref = node.indirect_reference
+        if ref is not None:
+            # Un árbol con ciclos no debe colgar el recuento
+            if ref.idnum in seen:
+                continue
+            seen.add(ref.idnum)
+        kids = node.get('/Kids')
+        if kids is None or node.get('/Type') == '/Page':
+            count += 1
+        else:
+            stack.extend(kid.get_object() for kid in kids)
+    return count
+
+# Atributos de página que se heredan de los nodos /Pages
+INHERITABLE_PAGE_ATTRIBUTES = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+def page_attribute(page, key):
+    """
+    Valor de key en la página o, si es uno de INHERITABLE_PAGE_ATTRIBUTES, en el primer nodo
+    /Pages antecesor que lo defina. None si no está en ninguno.
+    """
+    node = page
+    # Profundidad acotada por si el árbol tiene ciclos en /Parent
+    for _ in range(64):
+        if key in node:
+            return node[key]
+        if key not in INHERITABLE_PAGE_ATTRIBUTES or '/Parent' not in node:
+            return None
+        node = node['/Parent'].get_object()
+    return None
+
+def page_count(reader):
+    """Número de páginas según /Count, sin aplanar el árbol como len(reader.pages)"""
+    pages_node = reader.trailer['/Root']['/Pages'].get_object()
+    try:
+        return int(pages_node['/Count'])
+    except (KeyError, TypeError, ValueError):
+        return count_page_tree(pages_node)
+
+def get_page(reader, index):
+    """
+    Página index (0-indexed) bajando por el árbol de páginas con los /Count de los nodos
+    intermedios. reader.pages aplana el árbol entero, lo que obliga a leer todos los objetos
+    de página: en un archivo leído por rangos eso es descargarlo casi entero. Los atributos
+    heredados de los nodos /Pages se copian a la página igual que hace pypdf. Si el árbol no
+    es coherente se recurre a reader.pages.
+    """
+    from pypdf import PageObject
+    from pypdf.generic import NameObject
+    
+    if reader.flattened_pages is not None:
+        return reader.pages[index]
+    try:
+        node = reader.trailer['/Root']['/Pages'].get_object()
+        inherit = {}
+        # Profundidad acotada: un árbol con ciclos cae en reader.pages
+        for _ in range(64):
+            for key in INHERITABLE_PAGE_ATTRIBUTES:
+                if key in node:
+                    inherit[key] = node[key]
+            kids = node['/Kids']
+            if int(node['/Count']) == len(kids):
+                # Todas las hijas son hojas: se salta directamente a la que toca
+                kid_ref = kids[index]
+                kid = kid_ref.get_object()
+                index = 0
+            else:
+                for kid_ref in kids:
+                    kid = kid_ref.get_object()
+                    size = int(kid['/Count']) if kid.get('/Type') == '/Pages' else 1
+                    if index < size:
+                        break
+                    index -= size
+                else:
+                    raise IndexError(index)
+            if kid.get('/Type') == '/Pages':
+                node = kid
+                continue
+            if index != 0 or kid.get('/Type', '/Page') != '/Page':
+                raise ValueError("Árbol de páginas incoherente")
+            page = PageObject(reader, kid_ref)
+            page.update(kid)
+            for key, value in inherit.items():
+                if key not in page:
+                    page[NameObject(key)] = value
+            return page
+        raise ValueError("Árbol de páginas demasiado profundo")
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        return reader.pages[index]
+
+def extract_text(file_path, pages=None):
+    """
+    Extrae el texto de un archivo PDF (ruta local o URL, ver open_reader).
+    pages: lista de índices 0-indexed; None extrae todas las páginas.
+    """
+    with instrumentation.span('pypdf.PdfReader'):
+        reader = open_reader(file_path)
+    total = page_count(reader)
+    if pages is None:
+        pages = range(total)
+    pages = [i for i in pages if 0 <= i < total]
     text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
+    with instrumentation.span('pypdf.extract_text', pages=len(pages)):
+        for i in pages:
+            text += get_page(reader, i).extract_text() + "\n"
+    instrumentation.count('pypdf.text_pages', len(pages))
     return text
 
+@instrumentation.traced('pdf_tools.add_text_to_pdf')
 def add_text_to_pdf(input_path, output_path, text, page_num, x, y, font_size=12, color=(0, 0, 0)):
     """
     Agrega texto a una página específica del PDF.
@@ -113,93 +576,504 @@ def add_text_to_pdf(input_path, output_path, text, page_num, x, y, font_size=12,
     x, y: coordenadas en puntos (0,0 es esquina inferior izquierda)
     color: tupla RGB con valores 0-1
     """
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    import io
+    add_stamps_to_pdf(input_path, output_path, texts=[{
+        'page': page_num, 'text': text, 'x': x, 'y': y, 'font_size': font_size, 'color': color
+    }])
+
+@instrumentation.traced('pdf_tools.add_image_to_pdf')
+def add_image_to_pdf(input_path, output_path, image_path, page_num, x, y, width, height):
+    """
+    Agrega una imagen a una página específica del PDF.
+    page_num: número de página (1-indexed)
+    x, y: coordenadas en puntos (0,0 es esquina inferior izquierda)
+    width, height: dimensiones de la imagen en puntos
+    """
+    add_stamps_to_pdf(input_path, output_path, images=[{
+        'page': page_num, 'path': image_path, 'x': x, 'y': y, 'width': width, 'height': height
+    }])
+
+@instrumentation.traced('pdf_tools.add_stamps_to_pdf')
+def add_stamps_to_pdf(input_path, output_path, texts=(), images=()):
+    """
+    Agrega varios textos e imágenes en una sola lectura y escritura del PDF.
+    texts: diccionarios {page, text, x, y, font_size, color} (como pending_texts)
+    images: diccionarios {page, path, x, y, width, height} (como pending_images)
+    Cada sello distinto se codifica una sola vez como form XObject y todas sus
+    apariciones lo referencian (ver get_text_stamp / get_image_stamp).
+    """
+    placements = {}
+    for item in images:
+        stamp = get_image_stamp(item['path'], item['width'], item['height'])
+        placements.setdefault(item['page'], []).append((stamp, item['x'], item['y']))
+    for item in texts:
+        stamp = get_text_stamp(item['text'], item.get('font_size', 12), item.get('color', (0, 0, 0)))
+        placements.setdefault(item['page'], []).append((stamp, item['x'], item['y']))
     
-    # Leer el PDF original
     reader = PdfReader(input_path)
     writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
     
-    # Normalizar color a valores 0-1
-    if all(isinstance(c, int) for c in color):
-        color = tuple(c / 255.0 for c in color)
+    state = {}
+    for page_num, page_placements in placements.items():
+        if 1 <= page_num <= len(writer.pages):
+            stamp_page(writer, writer.pages[page_num - 1], page_placements, state)
     
-    # Crear un PDF temporal con el texto
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", font_size)
-    can.setFillColorRGB(*color)
-    can.drawString(x, y, text)
-    can.save()
+    with open(output_path, 'wb') as output_file:
+        write_pdf(writer, output_file)
+
+# --- Cache de sellos ---
+# Cada texto o imagen se dibuja una vez con reportlab en un PDF del tamaño justo.
+# stamp_page() lo convierte en un form XObject por escritor y cada colocación
+# solo añade "q cm /Nombre Do Q" al contenido de la página.
+STAMP_CACHE_SIZE = 128
+_stamp_cache = {}
+_stamp_cache_lock = threading.Lock()
+
+def _cached_stamp(key, build):
+    with _stamp_cache_lock:
+        stamp = _stamp_cache.get(key)
+        if stamp is not None:
+            # Reinsertar para mantener el orden LRU
+            _stamp_cache[key] = _stamp_cache.pop(key)
+            instrumentation.count('stamps.cache_hits')
+            return stamp
     
-    # Mover al inicio del buffer
-    packet.seek(0)
-    overlay_pdf = PdfReader(packet)
+    with instrumentation.span('stamps.build', kind=key[0]):
+        stamp = build()
+    stamp['key'] = key
+    stamp['name'] = '/PdfToolsStamp' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    with _stamp_cache_lock:
+        _stamp_cache[key] = stamp
+        while len(_stamp_cache) > STAMP_CACHE_SIZE:
+            _stamp_cache.pop(next(iter(_stamp_cache)))
+    return stamp
+
+def clear_stamp_cache():
+    with _stamp_cache_lock:
+        _stamp_cache.clear()
+
+@functools.lru_cache(maxsize=256)
+def _image_digest(image_path, mtime_ns, file_size):
+    # mtime_ns y file_size solo forman parte de la clave de cache
+    return get_file_hash(image_path)
+
+def get_image_stamp(image_path, width, height, opacity=1.0):
+    """
+    Sello de imagen ajustada (conservando aspecto, centrada) a una caja width x height
+    en puntos, como drawImage(preserveAspectRatio=True). Se cachea por contenido del
+    archivo y tamaño, así que la misma firma o logo se codifica una sola vez.
+    opacity: 0-1 (1 = opaca)
+    """
+    stat = os.stat(image_path)
+    digest = _image_digest(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
     
-    # Agregar páginas
-    for i, page in enumerate(reader.pages):
-        if i == page_num - 1:  # Convertir a 0-indexed
-            page.merge_page(overlay_pdf.pages[0])
-        writer.add_page(page)
+    def build():
+        from reportlab.pdfgen import canvas
+        packet = io.BytesIO()
+        can = canvas.Canvas(packet, pagesize=(width, height))
+        if opacity < 1:
+            can.setFillAlpha(opacity)
+        can.drawImage(image_path, 0, 0, width=width, height=height, preserveAspectRatio=True, mask='auto')
+        can.save()
+        return {'page': PdfReader(packet).pages[0], 'bbox': (0, 0, width, height), 'offset': (0, 0)}
     
-    # Guardar el resultado
-    with open(output_path, 'wb') as output_file:
-        writer.write(output_file)
+    return _cached_stamp(('image', digest, float(width), float(height), float(opacity)), build)
 
-def add_image_to_pdf(input_path, output_path, image_path, page_num, x, y, width, height):
+def get_text_stamp(text, font_size=12, color=(0, 0, 0), font_name="Helvetica", opacity=1.0):
     """
-    Agrega una imagen a una página específica del PDF.
-    page_num: número de página (1-indexed)
-    x, y: coordenadas en puntos (0,0 es esquina inferior izquierda)
-    width, height: dimensiones de la imagen en puntos
+    Sello de texto de una línea. El punto de colocación (x, y) es el inicio de la
+    línea base, igual que drawString.
     """
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    import io
+    color = _normalize_color(color)
     
-    # Leer el PDF original
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
+    def build():
+        from reportlab.pdfgen import canvas
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        # Margen bajo la línea base para los descendentes
+        descent = font_size * 0.3
+        width = max(stringWidth(text, font_name, font_size), 1)
+        height = font_size * 1.3
+        packet = io.BytesIO()
+        can = canvas.Canvas(packet, pagesize=(width, height))
+        can.setFont(font_name, font_size)
+        can.setFillColorRGB(*color)
+        if opacity < 1:
+            can.setFillAlpha(opacity)
+        can.drawString(0, descent, text)
+        can.save()
+        return {'page': PdfReader(packet).pages[0], 'bbox': (0, 0, width, height), 'offset': (0, -descent)}
+    
+    return _cached_stamp(('text', text, float(font_size), color, font_name, float(opacity)), build)
+
+def _stamp_form(writer, stamp, state):
+    """Form XObject del sello dentro de writer (se crea una vez por escritor)"""
+    from pypdf.generic import ArrayObject, DecodedStreamObject, FloatObject, NameObject
     
-    # Crear un PDF temporal con la imagen
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.drawImage(image_path, x, y, width=width, height=height, preserveAspectRatio=True, mask='auto')
-    can.save()
+    forms = state.get('forms')
+    if forms is None:
+        # Sellos de escrituras anteriores del mismo documento (p.ej. al aplicar cambios
+        # en varias pasadas): el nombre depende del contenido, así que se reutilizan
+        forms = state['forms'] = {}
+        for page in writer.pages:
+            resources = page.get('/Resources')
+            xobjects = resources.get_object().get('/XObject') if resources is not None else None
+            if xobjects is None:
+                continue
+            for name, existing in xobjects.get_object().items():
+                if name.startswith('/PdfToolsStamp'):
+                    forms[name] = existing
+    ref = forms.get(stamp['name'])
+    if ref is None:
+        page = stamp['page']
+        form = DecodedStreamObject()
+        form.set_data(page.get_contents().get_data())
+        form.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): ArrayObject(FloatObject(v) for v in stamp['bbox']),
+            NameObject('/Resources'): page['/Resources'].get_object().clone(writer),
+        })
+        ref = writer._add_object(form.flate_encode())
+        forms[stamp['name']] = ref
+    return ref
+
+def stamp_page(writer, page, placements, state):
+    """
+    Coloca sellos en una página de writer.
+    placements: lista de (sello, x, y) con sellos de get_text_stamp / get_image_stamp, o
+                (sello, x, y, grados) para girar el sello en sentido antihorario sobre (x, y)
+    state: diccionario compartido por todas las llamadas sobre el mismo writer
+    """
+    from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject
     
-    # Mover al inicio del buffer
-    packet.seek(0)
-    overlay_pdf = PdfReader(packet)
+    resources = page.get('/Resources')
+    if resources is None:
+        resources = page[NameObject('/Resources')] = DictionaryObject()
+    resources = resources.get_object()
+    xobjects = resources.get('/XObject')
+    if xobjects is None:
+        xobjects = resources[NameObject('/XObject')] = DictionaryObject()
+    xobjects = xobjects.get_object()
     
-    # Agregar páginas
-    for i, page in enumerate(reader.pages):
-        if i == page_num - 1:  # Convertir a 0-indexed
-            page.merge_page(overlay_pdf.pages[0])
+    ops = [b"Q"]
+    for stamp, x, y, *rotation in placements:
+        xobjects[NameObject(stamp['name'])] = _stamp_form(writer, stamp, state)
+        dx, dy = stamp['offset']
+        angle = rotation[0] % 360 if rotation else 0
+        if angle:
+            # El desplazamiento del sello se aplica en su propio sistema, ya girado
+            cos, sin = round(math.cos(math.radians(angle))), round(math.sin(math.radians(angle)))
+            matrix = f"{cos} {sin} {-sin} {cos} {x + cos * dx - sin * dy:.4f} {y + sin * dx + cos * dy:.4f}"
+        else:
+            matrix = f"1 0 0 1 {x + dx:.4f} {y + dy:.4f}"
+        ops.append(f"q {matrix} cm {stamp['name']} Do Q".encode('ascii'))
+    stamp_stream = DecodedStreamObject()
+    stamp_stream.set_data(b"\n".join(ops) + b"\n")
+    
+    # El contenido original va entre q/Q para que su estado gráfico no afecte a los sellos
+    push = state.get('push')
+    if push is None:
+        push_stream = DecodedStreamObject()
+        push_stream.set_data(b"q\n")
+        push = state['push'] = writer._add_object(push_stream)
+    
+    contents = page.get('/Contents')
+    parts = []
+    if contents is not None:
+        obj = contents.get_object()
+        if isinstance(obj, ArrayObject):
+            parts = list(obj)
+        elif isinstance(contents, IndirectObject):
+            parts = [contents]
+        else:
+            parts = [writer._add_object(obj)]
+    page[NameObject('/Contents')] = ArrayObject([push, *parts, writer._add_object(stamp_stream)])
+
+# --- Marcas de agua y numeración Bates en lote ---
+WATERMARK_POSITIONS = ('center', 'top-left', 'top-center', 'top-right',
+                       'bottom-left', 'bottom-center', 'bottom-right')
+
+def select_pages(spec, total_pages):
+    """
+    Convierte una selección de páginas en una lista de índices (0-indexed).
+    spec: 'all' / 'todas', 'odd' / 'impares', 'even' / 'pares' o un rango
+          de parse_page_range (ej: '1,3,5-8')
+    """
+    key = (spec or 'all').strip().lower()
+    if key in ('all', 'todas'):
+        return list(range(total_pages))
+    if key in ('odd', 'impares'):
+        return list(range(0, total_pages, 2))
+    if key in ('even', 'pares'):
+        return list(range(1, total_pages, 2))
+    return parse_page_range(spec, total_pages)
+
+def format_bates_number(number, prefix='', digits=6, suffix=''):
+    """Texto Bates de una página: prefijo + número con ceros a la izquierda + sufijo"""
+    return f"{prefix}{number:0{digits}d}{suffix}"
+
+def _stamp_origin(page, stamp, position, margin):
+    """
+    Colocación (x, y, grados) del sello para una posición predefinida dentro del cropbox
+    tal como se ve la página: con /Rotate 90 o 270 las esquinas se toman sobre la página
+    girada y el sello se gira en sentido contrario para que se lea derecho.
+    """
+    box = page.cropbox
+    left, bottom = float(box.left), float(box.bottom)
+    box_width, box_height = float(box.right) - left, float(box.top) - bottom
+    rotation = page.rotation % 360
+    # Tamaño de la página en pantalla
+    view_width, view_height = (box_height, box_width) if rotation in (90, 270) else (box_width, box_height)
+    bx0, by0, bx1, by1 = stamp['bbox']
+    width, height = bx1 - bx0, by1 - by0
+    
+    vertical, _, horizontal = position.partition('-')
+    if position == 'center':
+        vertical, horizontal = 'center', 'center'
+    if horizontal == 'left':
+        x = margin
+    elif horizontal == 'right':
+        x = view_width - margin - width
+    else:
+        x = (view_width - width) / 2
+    if vertical == 'top':
+        y = view_height - margin - height
+    elif vertical == 'bottom':
+        y = margin
+    else:
+        y = (view_height - height) / 2
+    
+    # Esquina inferior izquierda del sello en pantalla, llevada al espacio de la página
+    # (/Rotate gira la página en sentido horario al mostrarla)
+    if rotation == 90:
+        x, y = box_width - y, x
+    elif rotation == 180:
+        x, y = box_width - x, box_height - y
+    elif rotation == 270:
+        x, y = y, box_height - x
+    x, y = left + x, bottom + y
+    
+    # La colocación se expresa en el origen del sello, no en la esquina de su caja
+    # (el desplazamiento gira con el sello)
+    dx, dy = stamp['offset']
+    cos, sin = round(math.cos(math.radians(rotation))), round(math.sin(math.radians(rotation)))
+    return x - (cos * dx - sin * dy), y - (sin * dx + cos * dy), rotation
+
+@instrumentation.traced('pdf_tools.watermark_pdf')
+def watermark_pdf(input_path, output_path, text=None, image_path=None, pages='all',
+                  position='center', margin=36, font_size=48, color=(128, 128, 128),
+                  opacity=0.3, image_width=200, image_height=200,
+                  bates_prefix=None, bates_start=1, bates_digits=6, bates_suffix=''):
+    """
+    Estampa un texto y/o una imagen en varias páginas con una sola escritura del PDF.
+    pages: selección de select_pages ('all', 'odd', 'even' o '1,3,5-8')
+    position: una de WATERMARK_POSITIONS, con margin puntos de margen (sobre el
+              cropbox de la página tal como se ve, con /Rotate aplicado)
+    bates_prefix: si no es None, cada página seleccionada recibe un número Bates
+                  consecutivo (empezando en bates_start) en lugar de text
+    Retorna: diccionario {pages_stamped, bates_first, bates_last}
+    """
+    if position not in WATERMARK_POSITIONS:
+        raise ValueError(f"Posición no válida: {position}")
+    if text is None and image_path is None and bates_prefix is None:
+        raise ValueError("Indica un texto, una imagen o la numeración Bates.")
+    
+    reader = PdfReader(input_path)
+    writer = PdfWriter()
+    for page in reader.pages:
         writer.add_page(page)
     
-    # Guardar el resultado
+    selected = select_pages(pages, len(writer.pages))
+    image_stamp = get_image_stamp(image_path, image_width, image_height, opacity) if image_path else None
+    text_stamp = get_text_stamp(text, font_size, color, opacity=opacity) if text and bates_prefix is None else None
+    
+    state = {}
+    number = bates_start
+    for index in selected:
+        page = writer.pages[index]
+        placements = []
+        if image_stamp:
+            placements.append((image_stamp, *_stamp_origin(page, image_stamp, position, margin)))
+        if bates_prefix is not None:
+            stamp = get_text_stamp(format_bates_number(number, bates_prefix, bates_digits, bates_suffix),
+                                   font_size, color, opacity=opacity)
+            placements.append((stamp, *_stamp_origin(page, stamp, position, margin)))
+            number += 1
+        elif text_stamp:
+            placements.append((text_stamp, *_stamp_origin(page, text_stamp, position, margin)))
+        stamp_page(writer, page, placements, state)
+    
     with open(output_path, 'wb') as output_file:
-        writer.write(output_file)
+        write_pdf(writer, output_file)
+    
+    stamped = len(selected)
+    return {
+        'pages_stamped': stamped,
+        'bates_first': bates_start if bates_prefix is not None and stamped else None,
+        'bates_last': bates_start + stamped - 1 if bates_prefix is not None and stamped else None
+    }
+
+def _watermark_job(job):
+    """Procesa un archivo del lote (se ejecuta en un proceso del pool)"""
+    import time
+    input_path, output_path, options = job
+    start = time.perf_counter()
+    result = {'input': input_path, 'output': output_path, 'ok': True, 'error': None}
+    try:
+        result.update(watermark_pdf(input_path, output_path, **options))
+    except Exception as e:
+        result['ok'] = False
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def watermark_pdfs_batch(inputs, output_dir, suffix='_marca', max_workers=None, **options):
+    """
+    Aplica watermark_pdf a una lista de PDFs (o a todos los de una carpeta) en paralelo,
+    un proceso por archivo. Cada archivo se lee y se escribe una sola vez.
+    options: argumentos de watermark_pdf (text, image_path, pages, position, ...).
+    En modo Bates la numeración continúa de un archivo al siguiente, en el orden de inputs.
+    Retorna: lista de diccionarios {input, output, ok, error, seconds, pages_stamped,
+             bates_first, bates_last} en el orden de entrada.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    if isinstance(inputs, str) and os.path.isdir(inputs):
+        inputs = sorted(os.path.join(inputs, f) for f in os.listdir(inputs)
+                        if f.lower().endswith('.pdf'))
+    os.makedirs(output_dir, exist_ok=True)
+    
+    jobs = []
+    next_number = options.get('bates_start', 1)
+    for input_path in inputs:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        output_path = os.path.join(output_dir, f"{base_name}{suffix}.pdf")
+        job_options = dict(options)
+        if options.get('bates_prefix') is not None:
+            # Reservar el tramo de números del archivo antes de repartir el trabajo
+            job_options['bates_start'] = next_number
+            try:
+                total_pages = get_pdf_page_count(input_path)
+                next_number += len(select_pages(options.get('pages', 'all'), total_pages))
+            except Exception:
+                pass  # El error se reporta al procesar el archivo
+        jobs.append((input_path, output_path, job_options))
+    
+    if len(jobs) <= 1 or max_workers == 1:
+        return [_watermark_job(job) for job in jobs]
+    
+    # spawn: no se hereda el estado de Tk ni de los hilos del proceso principal
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(_watermark_job, jobs))
+
+def _normalize_color(color):
+    """Color RGB en 0-1: los enteros se interpretan como 0-255"""
+    if all(isinstance(c, int) for c in color):
+        return tuple(c / 255.0 for c in color)
+    return tuple(color)
+
+# --- Vista previa de textos e imágenes pendientes ---
+# Fuentes TrueType con las métricas de la Helvetica que usa add_text_to_pdf,
+# en orden de preferencia (DejaVu solo como último recurso)
+PREVIEW_FONT_CANDIDATES = ("LiberationSans-Regular.ttf", "Arial.ttf", "arial.ttf",
+                           "NimbusSans-Regular.otf", "DejaVuSans.ttf")
+
+@functools.lru_cache(maxsize=64)
+def _preview_font(size_px):
+    from PIL import ImageFont
+    for name in PREVIEW_FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size_px)
+        except OSError:
+            continue
+    return ImageFont.load_default(size_px)
+
+@functools.lru_cache(maxsize=32)
+def _load_stamp_image(image_path, mtime_ns):
+    # mtime_ns solo forma parte de la clave de cache
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return img.convert('RGBA')
 
+def compose_overlay_preview(base_image, pdf_box, rotation=0, texts=(), images=()):
+    """
+    Dibuja sobre una copia del bitmap de una página los textos e imágenes pendientes
+    tal como quedarán con add_text_to_pdf y add_image_to_pdf (misma fuente, color,
+    tamaño y ajuste de aspecto), sin escribir ningún PDF.
+    base_image: imagen PIL de la página tal como se muestra (con /Rotate aplicado)
+    pdf_box: mediabox (x0, y0, x1, y1) de la página
+    rotation: /Rotate de la página (0, 90, 180 o 270)
+    texts: diccionarios {text, x, y, font_size, color} (como pending_texts)
+    images: diccionarios {path, x, y, width, height} (como pending_images)
+    Retorna: nueva imagen PIL del mismo tamaño que base_image
+    """
+    from PIL import Image, ImageDraw
+
+    x0, y0, x1, y1 = pdf_box
+    width_pt, height_pt = abs(x1 - x0), abs(y1 - y0)
+    out_w, out_h = base_image.size
+    # Se dibuja en el espacio de la página sin rotar y luego se gira la capa
+    if rotation in (90, 270):
+        scale_x, scale_y = out_h / width_pt, out_w / height_pt
+    else:
+        scale_x, scale_y = out_w / width_pt, out_h / height_pt
+    layer = Image.new('RGBA', (max(1, round(width_pt * scale_x)), max(1, round(height_pt * scale_y))), (0, 0, 0, 0))
+
+    for item in images:
+        stamp = _load_stamp_image(item['path'], os.stat(item['path']).st_mtime_ns)
+        # drawImage(preserveAspectRatio=True) centra la imagen en la caja width x height
+        fit = min(item['width'] / stamp.width, item['height'] / stamp.height)
+        draw_w, draw_h = stamp.width * fit, stamp.height * fit
+        left = item['x'] + (item['width'] - draw_w) / 2
+        bottom = item['y'] + (item['height'] - draw_h) / 2
+        size = (max(1, round(draw_w * scale_x)), max(1, round(draw_h * scale_y)))
+        layer.alpha_composite(stamp.resize(size, Image.LANCZOS),
+                              (round((left - x0) * scale_x), round((y1 - bottom - draw_h) * scale_y)))
+
+    draw = ImageDraw.Draw(layer)
+    for item in texts:
+        font = _preview_font(max(1, round(item['font_size'] * scale_y)))
+        fill = tuple(round(c * 255) for c in _normalize_color(item['color'])) + (255,)
+        # drawString sitúa (x, y) en la línea base del texto
+        draw.text(((item['x'] - x0) * scale_x, (y1 - item['y']) * scale_y), item['text'],
+                  font=font, fill=fill, anchor='ls')
+
+    if rotation:
+        # /Rotate gira la página en sentido horario; PIL rota en sentido antihorario
+        layer = layer.rotate(-rotation, expand=True)
+    if layer.size != (out_w, out_h):
+        layer = layer.resize((out_w, out_h), Image.BILINEAR)
+
+    composed = base_image.convert('RGBA')
+    composed.alpha_composite(layer)
+    return composed.convert('RGB')
+
+@instrumentation.traced('pdf_tools.delete_pages')
 def delete_pages(input_path, output_path, pages_to_delete):
     """
     Elimina páginas específicas de un PDF.
     pages_to_delete: lista de números de página (1-indexed) a eliminar
     """
     reader = PdfReader(input_path)
-    writer = PdfWriter()
     
     total_pages = len(reader.pages)
     pages_to_delete_set = set(pages_to_delete)
+    kept = [i for i in range(total_pages) if (i + 1) not in pages_to_delete_set]  # Convertir a 1-indexed para comparar
     
-    for i in range(total_pages):
-        if (i + 1) not in pages_to_delete_set:  # Convertir a 1-indexed para comparar
-            writer.add_page(reader.pages[i])
+    if _rebuild_page_tree(reader, input_path, output_path, kept):
+        return
+    
+    writer = PdfWriter()
+    for i in kept:
+        writer.add_page(reader.pages[i])
     
     with open(output_path, 'wb') as output_file:
-        writer.write(output_file)
+        write_pdf(writer, output_file)
 
+@instrumentation.traced('pdf_tools.reorder_pages')
 def reorder_pages(input_path, output_path, new_order):
     """
     Reordena las páginas de un PDF según una lista de índices.
@@ -207,21 +1081,481 @@ def reorder_pages(input_path, output_path, new_order):
     Ejemplo: [3, 1, 2] moverá la página 3 al inicio
     """
     reader = PdfReader(input_path)
-    writer = PdfWriter()
+    pages = [page_num - 1 for page_num in new_order if 1 <= page_num <= len(reader.pages)]  # Convertir a 0-indexed
+    
+    if _rebuild_page_tree(reader, input_path, output_path, pages):
+        return
     
-    for page_num in new_order:
-        if 1 <= page_num <= len(reader.pages):
-            writer.add_page(reader.pages[page_num - 1])  # Convertir a 0-indexed
+    writer = PdfWriter()
+    for i in pages:
+        writer.add_page(reader.pages[i])
     
     with open(output_path, 'wb') as output_file:
-        writer.write(output_file)
+        write_pdf(writer, output_file)
+
+# --- Reescritura rápida del árbol de páginas ---
+# Borrar o reordenar no cambia nada dentro de las páginas: en vez de clonar cada página con
+# add_page (que carga en memoria y vuelve a serializar todos sus streams), se copian tal cual
+# los bytes de los objetos alcanzables desde las páginas conservadas, conservando su número,
+# y solo se escriben nuevos el diccionario de cada página (su /Parent cambia), un /Pages
+# plano y el catálogo. La salida sigue el perfil activo como write_pdf. Igual que add_page,
+# no se conservan marcadores ni formularios; los enlaces a páginas borradas quedan en null.
+
+_REFERENCE_RE = None
+
+def _object_references(data):
+    """Números de objeto referenciados ("N G R") en los bytes de un objeto"""
+    global _REFERENCE_RE
+    if _REFERENCE_RE is None:
+        import re
+        _REFERENCE_RE = re.compile(rb'(?<![\w.])(\d+)\s+\d+\s+R(?![\w])')
+    return {int(m.group(1)) for m in _REFERENCE_RE.finditer(data)}
+
+def _pypdf_references(obj, found):
+    """Referencias indirectas dentro de un objeto ya parseado por pypdf"""
+    from pypdf.generic import IndirectObject
+    
+    if isinstance(obj, IndirectObject):
+        found.add(obj.idnum)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _pypdf_references(value, found)
+    elif isinstance(obj, list):
+        for value in obj:
+            _pypdf_references(value, found)
+    return found
+
+def _raw_object_extent(f, offset, reader):
+    """
+    Localiza un objeto sin comprimir en el archivo sin leer los datos de su stream.
+    Retorna (longitud en bytes hasta endobj incluido, bytes del objeto hasta endobj o, en los
+    streams, hasta el diccionario, es_stream).
+    """
+    import re
+    
+    f.seek(offset)
+    head = f.read(4096)
+    while True:
+        stream_at = re.search(rb'(?<=>>)\s*stream(\r\n|\n|\r)', head)
+        endobj_at = head.find(b'endobj')
+        if stream_at and (endobj_at < 0 or stream_at.start() < endobj_at):
+            break
+        if endobj_at >= 0:
+            return endobj_at + len(b'endobj'), head[:endobj_at], False
+        more = f.read(65536)
+        if not more:
+            raise ValueError(f"Objeto sin endobj en el byte {offset}")
+        head += more
+    
+    header = head[:stream_at.start()]
+    length_match = re.search(rb'/Length\s+(\d+)(\s+\d+\s+R)?', header)
+    if not length_match:
+        raise ValueError(f"Stream sin /Length en el byte {offset}")
+    if length_match.group(2):
+        from pypdf.generic import IndirectObject
+        length = int(reader.get_object(IndirectObject(int(length_match.group(1)), 0, reader)))
+    else:
+        length = int(length_match.group(1))
+    data_end = offset + stream_at.end() + length
+    f.seek(data_end)
+    tail = f.read(256)
+    endobj_at = tail.find(b'endobj')
+    if endobj_at < 0 or b'endstream' not in tail[:endobj_at]:
+        raise ValueError(f"/Length incorrecto en el stream del byte {offset}")
+    return data_end - offset + endobj_at + len(b'endobj'), header, True
+
+def _copy_range(src, dst, offset, length):
+    """Copia length bytes de src (desde offset) al final de dst, sin pasar por Python si se puede"""
+    copy_range = getattr(os, 'copy_file_range', None)
+    if copy_range is not None:
+        try:
+            while length > 0:
+                copied = copy_range(src.fileno(), dst.fileno(), length, offset)
+                if copied == 0:
+                    break
+                offset += copied
+                length -= copied
+        except OSError:
+            pass
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(length, 1024 * 1024))
+        if not chunk:
+            raise ValueError("El PDF terminó antes de lo esperado")
+        dst.write(chunk)
+        length -= len(chunk)
+
+def _rebuild_page_tree(reader, input_path, output_path, page_indices):
+    """
+    Escribe output_path con las páginas page_indices (0-indexed, en ese orden) copiando
+    en bruto los objetos que no cambian. Retorna False si el archivo no admite la vía rápida
+    (cifrado, páginas repetidas o estructura dañada) para que se use la reescritura con pypdf.
+    Se aplica el perfil de salida: con object_streams los objetos que no son streams se
+    empaquetan (también los copiados en bruto) y con compress_streams se comprimen los
+    streams sin filtro.
+    """
+    import re
+    from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject,
+                               NumberObject, StreamObject)
+    
+    if reader.is_encrypted or len(set(page_indices)) != len(page_indices) or input_path == output_path:
+        return False
+    options = _output_profile
+    pack = options['object_streams']
+    level = options['compression_level']
+    try:
+        pages = [reader.pages[i] for i in page_indices]
+        if any(page.indirect_reference is None for page in pages):
+            return False
+        page_ids = {page.indirect_reference.idnum for page in pages}
+        
+        # Posición de cada objeto sin comprimir; los de object streams se vuelven a serializar
+        offsets = {}
+        for generation, entries in reader.xref.items():
+            for idnum, offset in entries.items():
+                offsets[idnum] = (offset, generation)
+        compressed = set(reader.xref_objStm)
+        
+        # Objetos que no se copian: el árbol de páginas viejo y las páginas descartadas
+        excluded = {page.indirect_reference.idnum for page in reader.pages if page.indirect_reference}
+        node = reader.trailer['/Root'].raw_get('/Pages')
+        stack = [node]
+        while stack:
+            ref = stack.pop()
+            if isinstance(ref, IndirectObject) and ref.idnum not in excluded:
+                excluded.add(ref.idnum)
+                kids = ref.get_object().get('/Kids', ())
+                stack.extend(k for k in kids if isinstance(k, IndirectObject)
+                             and k.get_object().get('/Type') != '/Page')
+        excluded -= page_ids
+        
+        next_id = max(max([*offsets, *compressed]) + 1, int(reader.trailer.get('/Size', 0)))
+        pages_id, catalog_id = next_id, next_id + 1
+        
+        with instrumentation.span('fast_pages.scan'), open(input_path, 'rb') as src:
+            # Recorrido de referencias a partir de las páginas (sin su /Parent)
+            raw = {}        # idnum -> (offset, longitud, cuerpo si se empaqueta) de lo que se copia en bruto
+            rewritten = {}  # idnum -> objeto pypdf que se vuelve a serializar
+            pending = []
+            for page in pages:
+                # reader.pages ya incorpora los atributos heredados del árbol viejo (/Resources, /MediaBox...)
+                page_dict = DictionaryObject({k: v for k, v in page.items() if k != '/Parent'})
+                pending.extend(_pypdf_references(page_dict, set()))
+                page_dict[NameObject('/Parent')] = IndirectObject(pages_id, 0, reader)
+                rewritten[page.indirect_reference.idnum] = page_dict
+            info = reader.trailer.raw_get('/Info') if '/Info' in reader.trailer else None
+            if isinstance(info, IndirectObject):
+                pending.append(info.idnum)
+            while pending:
+                idnum = pending.pop()
+                if idnum in raw or idnum in rewritten:
+                    continue
+                if idnum in excluded:
+                    # Enlaces o destinos que apuntan a una página borrada: el objeto pasa a
+                    # ser null (la referencia no queda colgando)
+                    rewritten[idnum] = NullObject()
+                    continue
+                if idnum in offsets and idnum not in compressed:
+                    offset, generation = offsets[idnum]
+                    length, header, is_stream = _raw_object_extent(src, offset, reader)
+                    pending.extend(_object_references(header))
+                    if is_stream and options['compress_streams'] and b'/Filter' not in header:
+                        obj = reader.get_object(IndirectObject(idnum, generation, reader))
+                        if obj.get('/Type') not in ('/Metadata', '/XRef') and len(obj._data) >= 64:
+                            encoded = obj.flate_encode(level=level)
+                            if len(encoded._data) < len(obj._data):
+                                rewritten[idnum] = encoded
+                                continue
+                    body = None
+                    if pack and not is_stream and generation == 0:
+                        # Solo el cuerpo: va dentro de un object stream
+                        body = re.sub(rb'^\s*\d+\s+\d+\s+obj', b'', header, count=1).strip()
+                    raw[idnum] = (offset, length, body)
+                elif idnum in compressed:
+                    obj = reader.get_object(IndirectObject(idnum, 0, reader))
+                    rewritten[idnum] = obj
+                    pending.extend(_pypdf_references(obj, set()))
+                # Referencia a un objeto inexistente: equivale a null y se deja igual
+        
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(pages_id, 0, reader),
+        })
+        pages_node = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Count'): NumberObject(len(pages)),
+            NameObject('/Kids'): ArrayObject(page.indirect_reference for page in pages),
+        })
+        rewritten[pages_id] = pages_node
+        rewritten[catalog_id] = catalog
+        trailer = {'/Root': IndirectObject(catalog_id, 0, reader)}
+        if isinstance(info, IndirectObject):
+            trailer['/Info'] = info
+        if '/ID' in reader.trailer:
+            trailer['/ID'] = reader.trailer['/ID']
+        
+        header = reader.pdf_header
+        if pack and header < "%PDF-1.5":
+            header = "%PDF-1.5"
+        entries = {}    # idnum -> (tipo, campo2, campo3) como en _write_xref_stream
+        packable = []
+        with instrumentation.span('fast_pages.write', objects=len(raw) + len(rewritten)), \
+                open(input_path, 'rb') as src, open(output_path, 'wb', buffering=0) as dst:
+            dst.write(header.encode() + b"\n%\xE2\xE3\xCF\xD3\n")
+            # En orden de archivo: lectura secuencial del original
+            for idnum, (offset, length, body) in sorted(raw.items(), key=lambda item: item[1][0]):
+                if body is not None:
+                    packable.append((idnum, body))
+                    continue
+                entries[idnum] = (1, dst.tell(), offsets[idnum][1])
+                _copy_range(src, dst, offset, length)
+                dst.write(b"\n")
+            for idnum, obj in sorted(rewritten.items()):
+                # Las páginas conservan su número y generación: las anotaciones las referencian así
+                generation = offsets.get(idnum, (0, 0))[1]
+                buffer = io.BytesIO()
+                obj.write_to_stream(buffer)
+                if pack and generation == 0 and not isinstance(obj, StreamObject):
+                    packable.append((idnum, buffer.getvalue()))
+                    continue
+                entries[idnum] = (1, dst.tell(), generation)
+                dst.write(f"{idnum} {generation} obj\n".encode() + buffer.getvalue() + b"\nendobj\n")
+            
+            if pack:
+                next_idnum = _write_object_streams(dst, packable, catalog_id + 1, entries, level)
+                _write_xref_stream(dst, entries, next_idnum, trailer, level)
+            else:
+                position = dst.tell()
+                size = max(entries) + 1
+                xref = [f"xref\n0 {size}\n0000000000 65535 f \n".encode()]
+                for idnum in range(1, size):
+                    if idnum in entries:
+                        _kind, offset, generation = entries[idnum]
+                        xref.append(f"{offset:010d} {generation:05d} n \n".encode())
+                    else:
+                        xref.append(b"0000000000 00000 f \n")
+                dst.write(b"".join(xref))
+                trailer_dict = DictionaryObject({
+                    NameObject('/Size'): NumberObject(size),
+                    **{NameObject(key): value for key, value in trailer.items()},
+                })
+                buffer = io.BytesIO()
+                trailer_dict.write_to_stream(buffer)
+                dst.write(b"trailer\n" + buffer.getvalue() + f"\nstartxref\n{position}\n%%EOF\n".encode())
+    except Exception:
+        # Estructura que la vía rápida no entiende: se recurre a pypdf
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    instrumentation.count('fast_pages.raw_objects', len(raw))
+    return True
+
+# --- Diferencias entre versiones (deshacer/rehacer) ---
+# Una edición casi nunca toca todas las páginas: en vez de guardar copias completas del PDF
+# se guarda, por operación, qué página de la versión base ocupa cada posición y un PDF
+# pequeño solo con las páginas que no existen en la base.
+
+def page_fingerprints(file_path):
+    """
+    Huella de cada página (bytes del contenido tal como están en el archivo, recursos, cajas,
+    rotación y anotaciones, con los atributos heredados del árbol de páginas). Las páginas
+    a las que apuntan enlaces y destinos cuentan por su posición, no por su contenido.
+    Dos páginas con la misma huella se dibujan igual. Cacheado por (ruta, mtime, tamaño).
+    """
+    stat = os.stat(file_path)
+    return list(_page_fingerprints_cached(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size))
+
+@functools.lru_cache(maxsize=16)
+def _page_fingerprints_cached(file_path, mtime_ns, file_size):
+    from pypdf.generic import IndirectObject
+    
+    with instrumentation.span('pypdf.page_fingerprints'):
+        reader = PdfReader(file_path)
+        pages = reader.pages
+        page_numbers = {(page.indirect_reference.idnum, page.indirect_reference.generation): index
+                        for index, page in enumerate(pages) if page.indirect_reference is not None}
+        # Huella de cada objeto indirecto ya descrito (None mientras se describe: ciclo)
+        digests = {}
+        
+        def describe(obj, digest, depth=0):
+            # Serializa los objetos directos y, de los streams, sus bytes tal cual (sin decodificar
+            # imágenes): una página recomprimida cuenta como cambiada, lo que solo agranda la diferencia
+            if isinstance(obj, IndirectObject):
+                key = (obj.idnum, obj.generation)
+                if key in page_numbers:
+                    # Una página referenciada (destino de un enlace) cuenta por su posición: su
+                    # contenido no cambia la huella de las páginas que la enlazan
+                    digest.update(f"<página {page_numbers[key]}>".encode())
+                    return
+                if key not in digests:
+                    digests[key] = None
+                    object_digest = hashlib.sha1()
+                    describe(obj.get_object(), object_digest)
+                    digests[key] = object_digest.digest()
+                digest.update(digests[key] or b"<ciclo>")
+                return
+            if depth > 16:
+                digest.update(b"<...>")
+                return
+            if hasattr(obj, 'get_data'):
+                digest.update(hashlib.sha1(obj._data).digest())
+                obj = {k: v for k, v in obj.items() if k != '/Length'}
+            if isinstance(obj, dict):
+                for key in sorted(obj):
+                    if key in ('/Parent', '/P'):
+                        continue
+                    digest.update(key.encode())
+                    describe(obj[key], digest, depth + 1)
+            elif isinstance(obj, list):
+                for value in obj:
+                    describe(value, digest, depth + 1)
+            else:
+                digest.update(repr(obj).encode())
+        
+        fingerprints = []
+        for page in pages:
+            digest = hashlib.sha1()
+            for key in ('/Contents', '/Resources', '/MediaBox', '/CropBox', '/Rotate', '/Annots'):
+                digest.update(key.encode())
+                value = page_attribute(page, key)
+                if value is not None:
+                    describe(value, digest)
+            fingerprints.append(digest.hexdigest())
+    return tuple(fingerprints)
+
+def diff_pdf_pages(base_path, target_path):
+    """
+    Calcula cómo reconstruir target_path a partir de base_path.
+    Retorna: diccionario {order, pages_pdf, changed, page_count, size}
+      order: por cada página de target, ('base', índice) o ('new', índice en pages_pdf), 0-indexed
+      pages_pdf: bytes de un PDF con las páginas de target que no están en base (o None)
+      changed: páginas de target (1-indexed) que difieren de la página de base en esa posición
+      size: bytes que ocupa la diferencia en memoria
+    """
+    base = page_fingerprints(base_path)
+    target = page_fingerprints(target_path)
+    available = {}
+    for index, fingerprint in enumerate(base):
+        available.setdefault(fingerprint, []).append(index)
+    
+    order = []
+    new_pages = []
+    for position, fingerprint in enumerate(target):
+        candidates = available.get(fingerprint)
+        if candidates:
+            # Preferir la misma posición para que un cambio local no "desplace" el resto
+            index = position if position in candidates else candidates[0]
+            order.append(('base', index))
+        else:
+            order.append(('new', len(new_pages)))
+            new_pages.append(position)
+    
+    pages_pdf = None
+    if new_pages:
+        reader = PdfReader(target_path)
+        writer = PdfWriter()
+        for position in new_pages:
+            writer.add_page(reader.pages[position])
+        buffer = io.BytesIO()
+        write_pdf(writer, buffer)
+        pages_pdf = buffer.getvalue()
+    
+    changed = [position + 1 for position, entry in enumerate(order)
+               if entry != ('base', position) or position >= len(base)]
+    return {
+        'order': order,
+        'pages_pdf': pages_pdf,
+        'changed': changed,
+        'page_count': len(target),
+        'size': len(pages_pdf or b"") + 16 * len(order)
+    }
+
+def apply_pdf_diff(base_path, diff, output_path):
+    """Reconstruye en output_path la versión descrita por diff (ver diff_pdf_pages) a partir de base_path"""
+    reader = PdfReader(base_path)
+    if all(kind == 'base' for kind, _index in diff['order']):
+        # Solo borra o reordena páginas: vía rápida sin reescribir el contenido
+        if _rebuild_page_tree(reader, base_path, output_path, [index for _kind, index in diff['order']]):
+            return
+    
+    new_reader = PdfReader(io.BytesIO(diff['pages_pdf'])) if diff['pages_pdf'] else None
+    writer = PdfWriter()
+    for kind, index in diff['order']:
+        writer.add_page(reader.pages[index] if kind == 'base' else new_reader.pages[index])
+    write_pdf(writer, output_path)
+
+def probe_pdf(file_path):
+    """
+    Obtiene metadatos básicos de un PDF sin recorrer todas sus páginas.
+    Solo se leen la tabla xref, el trailer y la raíz del árbol de páginas (/Count).
+    Los resultados se cachean por (ruta, mtime, tamaño); en URLs, por (URL, ETag, tamaño).
+    Retorna: diccionario con page_count, encrypted, version, title y file_size.
+    """
+    if byte_range.is_url(file_path):
+        source = byte_range.open_source(file_path)
+        source.close()
+        return dict(_probe_pdf_cached(file_path, source.validator, source.size))
+    stat = os.stat(file_path)
+    return dict(_probe_pdf_cached(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size))
+
+@functools.lru_cache(maxsize=1024)
+def _probe_pdf_cached(file_path, mtime_ns, file_size):
+    # mtime_ns y file_size solo forman parte de la clave de cache
+    if byte_range.is_url(file_path):
+        with instrumentation.span('pypdf.probe'):
+            reader = open_reader(file_path)
+        return _probe_reader(reader, file_size)
+    # PdfReader(ruta) cargaría el archivo entero en memoria y, en modo no estricto, visitaría
+    # la cabecera de cada objeto de la xref: sobre el archivo abierto y en modo estricto solo
+    # se leen la xref, el trailer y los objetos que se consultan
+    with open(file_path, 'rb') as f:
+        with instrumentation.span('pypdf.probe'):
+            reader = _lazy_reader(f)
+        return _probe_reader(reader, file_size)
+
+def _probe_reader(reader, file_size):
+    encrypted = '/Encrypt' in reader.trailer
+    info = {
+        'page_count': None,
+        'encrypted': encrypted,
+        'version': reader.pdf_header[5:] if reader.pdf_header.startswith('%PDF-') else None,
+        'title': None,
+        'file_size': file_size
+    }
+    
+    if encrypted:
+        # Muchos PDFs solo tienen contraseña de propietario y se abren con la vacía
+        try:
+            if not reader.decrypt(''):
+                return tuple(info.items())
+        except Exception:
+            return tuple(info.items())
+    
+    try:
+        count = reader.trailer['/Root']['/Pages'].get('/Count')
+        info['page_count'] = int(count)
+    except (KeyError, TypeError, ValueError):
+        # Árbol de páginas sin /Count fiable: recorrer solo sus nodos
+        info['page_count'] = count_page_tree(reader.trailer['/Root']['/Pages'].get_object())
+    
+    try:
+        title = reader.trailer['/Info'].get('/Title')
+        info['title'] = str(title) if title else None
+    except (KeyError, TypeError):
+        pass
+    
+    return tuple(info.items())
 
 def get_pdf_page_count(file_path):
     """
     Retorna el número total de páginas de un PDF.
     """
-    reader = PdfReader(file_path)
-    return len(reader.pages)
+    count = probe_pdf(file_path)['page_count']
+    if count is None:
+        # PDF cifrado con contraseña de usuario: se intenta la lectura completa
+        reader = open_reader(file_path)
+        return len(reader.pages)
+    return count
 
 def get_pdf_page_size(file_path, page_num=1):
     """
@@ -236,25 +1570,169 @@ def get_pdf_page_size(file_path, page_num=1):
         return width, height
     return 612.0, 792.0
 
-def pdf_page_to_image(file_path, page_num, dpi=150):
+def get_page_geometry(file_path):
+    """
+    Lee en una sola pasada la geometría de todas las páginas del PDF.
+    Retorna un diccionario con arrays compactos (módulo array):
+      'page_count': número de páginas
+      'mediabox': array('d') con 4 valores por página (x0, y0, x1, y1)
+      'cropbox': array('d') con 4 valores por página (x0, y0, x1, y1)
+      'rotation': array('h') con /Rotate normalizado a 0, 90, 180 o 270
+    """
+    from array import array
+    
+    with instrumentation.span('pypdf.PdfReader'):
+        reader = PdfReader(file_path)
+    mediabox = array('d')
+    cropbox = array('d')
+    rotation = array('h')
+    
+    with instrumentation.span('pypdf.page_geometry'):
+        for page in reader.pages:
+            # pypdf resuelve los atributos heredados del árbol de páginas
+            mb = page.mediabox
+            cb = page.cropbox
+            mediabox.extend((float(mb.left), float(mb.bottom), float(mb.right), float(mb.top)))
+            cropbox.extend((float(cb.left), float(cb.bottom), float(cb.right), float(cb.top)))
+            rotation.append(page.rotation % 360)
+    
+    return {
+        'page_count': len(rotation),
+        'mediabox': mediabox,
+        'cropbox': cropbox,
+        'rotation': rotation
+    }
+
+def get_page_box(geometry, page_num, box='mediabox'):
+    """
+    Retorna la caja (x0, y0, x1, y1) de una página del índice de geometría.
+    page_num: número de página (1-indexed)
+    """
+    i = (page_num - 1) * 4
+    values = geometry[box]
+    return values[i], values[i + 1], values[i + 2], values[i + 3]
+
+def get_page_display_size(geometry, page_num):
+    """
+    Retorna el tamaño (width, height) en puntos con el que se ve una página,
+    es decir, su mediabox con la rotación /Rotate aplicada (como la rasteriza poppler).
+    """
+    x0, y0, x1, y1 = get_page_box(geometry, page_num)
+    width, height = abs(x1 - x0), abs(y1 - y0)
+    if geometry['rotation'][page_num - 1] in (90, 270):
+        return height, width
+    return width, height
+
+def render_pages(file_path, first_page, last_page, dpi=150, grayscale=False, on_process=None):
+    """
+    Rasteriza un rango de páginas con una sola llamada a pdftoppm.
+    first_page, last_page: números de página (1-indexed, inclusivos)
+    on_process: callback opcional que recibe el subprocess.Popen lanzado, para que
+                el llamador pueda matarlo si cancela la carga.
+    Retorna: lista de imágenes PIL (vacía si el proceso fue terminado por una señal)
+    """
+    import subprocess
+    from pdf2image.parsers import parse_buffer_to_ppm, parse_buffer_to_pgm
+
+    args = ['pdftoppm', '-r', str(dpi), '-f', str(first_page), '-l', str(last_page)]
+    if grayscale:
+        args.append('-gray')
+    args.append(file_path)
+
+    with instrumentation.span('poppler.rasterize', first=first_page, last=last_page, dpi=dpi):
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if on_process:
+            on_process(proc)
+        data, err = proc.communicate()
+
+    if proc.returncode < 0:
+        # Proceso matado desde fuera (cancelación): no hay nada que devolver
+        return []
+    if proc.returncode != 0:
+        raise RuntimeError(f"Error al rasterizar el PDF: {err.decode(errors='ignore').strip()}")
+
+    parser = parse_buffer_to_pgm if grayscale else parse_buffer_to_ppm
+    with instrumentation.span('poppler.parse_output', bytes=len(data)):
+        images = parser(data)
+    instrumentation.count('poppler.pages', len(images))
+    instrumentation.count('poppler.bytes', len(data))
+    return images
+
+def pdf_page_to_image(file_path, page_num, dpi=150, on_process=None):
     """
     Convierte una página específica del PDF a imagen PIL.
     page_num: número de página (1-indexed)
     dpi: resolución de la imagen (default 150)
+    on_process: callback opcional que recibe el proceso de poppler (ver render_pages)
     Retorna: imagen PIL
     """
-    from pdf2image import convert_from_path
+    if byte_range.is_url(file_path):
+        # poppler necesita un archivo local: se copia solo esa página leyendo por rangos
+        import tempfile
+        reader = open_reader(file_path)
+        writer = PdfWriter()
+        writer.add_page(get_page(reader, page_num - 1))
+        handle, temp_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(handle)
+        try:
+            write_pdf(writer, temp_path, profile='compatible')
+            images = render_pages(temp_path, 1, 1, dpi=dpi, on_process=on_process)
+        finally:
+            os.remove(temp_path)
+        return images[0] if images else None
     
     # Convertir solo la página específica
-    images = convert_from_path(
-        file_path,
-        dpi=dpi,
-        first_page=page_num,
-        last_page=page_num
-    )
+    images = render_pages(file_path, page_num, page_num, dpi=dpi, on_process=on_process)
     
     return images[0] if images else None
 
+# Cache de miniaturas en disco: una carpeta por hash de contenido con un JPEG por página
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf_tools", "thumbnails")
+
+def get_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Retorna el hash SHA-1 del contenido de un archivo.
+    Se usa como clave de cache para que las copias temporales de un mismo
+    documento compartan miniaturas.
+    """
+    import hashlib
+    
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_cached_thumbnail(file_hash, page_num, cache_dir=None):
+    """
+    Retorna la miniatura cacheada de una página como imagen PIL, o None si no existe.
+    page_num: número de página (1-indexed)
+    """
+    from PIL import Image
+    
+    path = os.path.join(cache_dir or THUMBNAIL_CACHE_DIR, file_hash, f"{page_num}.jpg")
+    if not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            img.load()
+            return img.copy()
+    except OSError:
+        # Archivo corrupto o escrito a medias: se regenerará
+        return None
+
+def save_cached_thumbnail(file_hash, page_num, image, cache_dir=None, quality=70):
+    """
+    Guarda la miniatura de una página en el cache como JPEG compacto.
+    La escritura es atómica para que una lectura concurrente nunca vea un archivo a medias.
+    """
+    folder = os.path.join(cache_dir or THUMBNAIL_CACHE_DIR, file_hash)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{page_num}.jpg")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    image.convert('RGB').save(temp_path, "JPEG", quality=quality, optimize=True)
+    os.replace(temp_path, path)
+
 def pdf_to_images(file_path, dpi=150, max_pages=None):
     """
     Convierte todas las páginas del PDF a imágenes PIL.
@@ -293,6 +1771,244 @@ def export_pdf_to_images(file_path, output_dir, dpi=150):
         
     return generated_paths
 
+# --- Optimización de imágenes ---
+# Filtros de imágenes bitonales (fax, JBIG2): ya son compactos y no se tocan
+_BILEVEL_FILTERS = ('/CCITTFaxDecode', '/JBIG2Decode')
+
+def _matrix_multiply(m, n):
+    """Producto de matrices PDF [a b c d e f] (m aplicada antes que n)"""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + b * c2, a * b2 + b * d2,
+            c * a2 + d * c2, c * b2 + d * d2,
+            e * a2 + f * c2 + e2, e * b2 + f * d2 + f2)
+
+def _xobject_images(resources):
+    """Diccionario nombre -> (referencia, objeto) de los XObjects de unos recursos"""
+    if resources is None:
+        return {}
+    xobjects = resources.get_object().get('/XObject')
+    if xobjects is None:
+        return {}
+    return {name: (ref, ref.get_object()) for name, ref in xobjects.get_object().items()}
+
+def _has_images(resources, depth=0):
+    for _ref, obj in _xobject_images(resources).values():
+        subtype = obj.get('/Subtype')
+        if subtype == '/Image':
+            return True
+        if subtype == '/Form' and depth < 3 and _has_images(obj.get('/Resources'), depth + 1):
+            return True
+    return False
+
+def _collect_images(resources, images, depth=0):
+    """
+    Anota en images {número de objeto: (referencia, objeto)} las imágenes de unos recursos,
+    incluidas las que están dentro de Form XObjects (p.ej. los sellos de stamp_page).
+    """
+    for ref, obj in _xobject_images(resources).values():
+        if not hasattr(ref, 'idnum') or ref.idnum in images:
+            continue
+        subtype = obj.get('/Subtype')
+        if subtype == '/Image':
+            images[ref.idnum] = (ref, obj)
+        elif subtype == '/Form' and depth < 3:
+            _collect_images(obj.get('/Resources'), images, depth + 1)
+
+def _collect_image_placements(contents, resources, pdf, ctm, sizes, depth=0):
+    """
+    Recorre un content stream siguiendo la CTM y anota en sizes el mayor tamaño
+    (ancho, alto en puntos) con que se dibuja cada imagen, por número de objeto.
+    """
+    from pypdf.generic import ContentStream
+    
+    xobjects = _xobject_images(resources)
+    stack = []
+    for operands, operator in ContentStream(contents, pdf).operations:
+        if operator == b'q':
+            stack.append(ctm)
+        elif operator == b'Q':
+            if stack:
+                ctm = stack.pop()
+        elif operator == b'cm':
+            ctm = _matrix_multiply(tuple(float(v) for v in operands), ctm)
+        elif operator == b'Do':
+            entry = xobjects.get(operands[0])
+            if entry is None:
+                continue
+            ref, obj = entry
+            subtype = obj.get('/Subtype')
+            if subtype == '/Image' and hasattr(ref, 'idnum'):
+                a, b, c, d, _e, _f = ctm
+                width, height = (a * a + b * b) ** 0.5, (c * c + d * d) ** 0.5
+                old_w, old_h = sizes.get(ref.idnum, (0.0, 0.0))
+                sizes[ref.idnum] = (max(old_w, width), max(old_h, height))
+            elif subtype == '/Form' and depth < 3:
+                matrix = tuple(float(v) for v in obj.get('/Matrix', (1, 0, 0, 1, 0, 0)))
+                _collect_image_placements(obj, obj.get('/Resources', resources), pdf,
+                                          _matrix_multiply(matrix, ctm), sizes, depth + 1)
+
+def _recompress_image(xobj, display_size, target_dpi, jpeg_quality, image_format):
+    """
+    Reduce y recomprime una imagen. Retorna (stream nuevo, bytes antes, bytes después)
+    o None si la imagen se deja como está (no soportada o no sale más pequeña).
+    """
+    import zlib
+    from PIL import Image
+    from pypdf.generic import DecodedStreamObject, NameObject, NumberObject
+    
+    filters = xobj.get('/Filter')
+    filters = list(filters) if isinstance(filters, list) else [filters]
+    if xobj.get('/ImageMask') or xobj.get('/BitsPerComponent') == 1 or xobj.get('/Decode') is not None \
+            or any(f in _BILEVEL_FILTERS for f in filters):
+        return None
+    colorspace = xobj.get('/ColorSpace')
+    colorspace_obj = colorspace.get_object() if colorspace is not None else None
+    if isinstance(colorspace_obj, list):
+        # ICCBased e Indexed se convierten a RGB/gris; Separation, DeviceN, Lab... no se tocan
+        if colorspace_obj[0] not in ('/ICCBased', '/Indexed'):
+            return None
+    elif colorspace_obj not in ('/DeviceRGB', '/DeviceGray'):
+        return None
+    
+    original_size = len(xobj._data)
+    img = xobj.decode_as_image()
+    if img.mode in ('RGBA', 'P', 'PA'):
+        img = img.convert('RGB')
+    elif img.mode == 'LA':
+        img = img.convert('L')
+    if img.mode not in ('RGB', 'L'):
+        return None
+    
+    width_pt, height_pt = display_size
+    if width_pt > 0 and height_pt > 0:
+        dpi = max(img.width / (width_pt / 72.0), img.height / (height_pt / 72.0))
+        if dpi > target_dpi * 1.05:
+            scale = target_dpi / dpi
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                             Image.LANCZOS, reducing_gap=2.0)
+    
+    use_jpeg = image_format == 'jpeg'
+    if image_format == 'auto':
+        # Las imágenes con pocos colores (gráficos, texto escaneado limpio) quedan mejor sin pérdida
+        use_jpeg = img.width >= 32 and img.height >= 32 and img.getcolors(256) is None
+    
+    stream = DecodedStreamObject()
+    if use_jpeg:
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=jpeg_quality, optimize=True)
+        stream.set_data(buffer.getvalue())
+        stream[NameObject('/Filter')] = NameObject('/DCTDecode')
+    else:
+        stream.set_data(zlib.compress(img.tobytes(), 9))
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+    if len(stream._data) >= original_size:
+        return None
+    
+    # Se conserva el resto del diccionario (SMask, Intent, Interpolate...)
+    for key, value in xobj.items():
+        if key not in ('/Filter', '/DecodeParms', '/Length', '/Width', '/Height',
+                       '/ColorSpace', '/BitsPerComponent'):
+            stream[NameObject(key)] = value
+    keep_icc = isinstance(colorspace_obj, list) and colorspace_obj[0] == '/ICCBased' and \
+        colorspace_obj[1].get_object().get('/N') == (3 if img.mode == 'RGB' else 1)
+    stream.update({
+        NameObject('/Width'): NumberObject(img.width),
+        NameObject('/Height'): NumberObject(img.height),
+        NameObject('/ColorSpace'): colorspace if keep_icc else
+            NameObject('/DeviceRGB' if img.mode == 'RGB' else '/DeviceGray'),
+        NameObject('/BitsPerComponent'): NumberObject(8),
+    })
+    return stream, original_size, len(stream._data)
+
+@instrumentation.traced('pdf_tools.optimize_pdf')
+def optimize_pdf(input_path, output_path, target_dpi=150, jpeg_quality=75, image_format='auto',
+                 max_workers=None):
+    """
+    Reduce el tamaño de un PDF recomprimiendo sus imágenes:
+      - calcula la resolución efectiva de cada imagen según el tamaño con que se dibuja
+        y reduce las que superan target_dpi;
+      - las recomprime a JPEG (jpeg_quality) o Flate; image_format: 'auto', 'jpeg' o 'flate'
+        ('auto' usa Flate para imágenes con pocos colores);
+      - elimina objetos duplicados y los que ya no usa ninguna página.
+    Las imágenes se procesan en paralelo. Solo se sustituye una imagen si el resultado es menor.
+    Retorna: diccionario {input, output, original_size, optimized_size, saved_bytes,
+             images_total, images_optimized}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    reader = PdfReader(input_path)
+    writer = PdfWriter(clone_from=reader)
+    
+    # Mayor tamaño de dibujo de cada imagen (una imagen compartida se dibuja en varias páginas)
+    sizes = {}
+    images = {}
+    with instrumentation.span('optimize.scan_pages', pages=len(writer.pages)):
+        for page in writer.pages:
+            resources = page.get('/Resources')
+            if not _has_images(resources):
+                continue
+            contents = page.get_contents()
+            if contents is not None:
+                _collect_image_placements(contents, resources, writer, (1, 0, 0, 1, 0, 0), sizes)
+            _collect_images(resources, images)
+    
+    def process(item):
+        idnum, (ref, obj) = item
+        try:
+            return ref, _recompress_image(obj, sizes.get(idnum, (0, 0)), target_dpi, jpeg_quality, image_format)
+        except Exception:
+            # Imagen con un formato que PIL no decodifica: se conserva la original
+            return ref, None
+    
+    optimized = 0
+    with instrumentation.span('optimize.images', images=len(images)):
+        # PIL libera el GIL al decodificar, reescalar y codificar
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for ref, result in pool.map(process, images.items()):
+                if result is not None:
+                    writer._replace_object(ref, result[0])
+                    optimized += 1
+    
+    writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+    with open(output_path, 'wb') as output_file:
+        write_pdf(writer, output_file)
+    
+    original_size = os.path.getsize(input_path)
+    optimized_size = os.path.getsize(output_path)
+    return {
+        'input': input_path,
+        'output': output_path,
+        'original_size': original_size,
+        'optimized_size': optimized_size,
+        'saved_bytes': original_size - optimized_size,
+        'images_total': len(images),
+        'images_optimized': optimized
+    }
+
+def optimize_pdfs_batch(inputs, output_dir, suffix='_optimizado', **options):
+    """
+    Aplica optimize_pdf a una lista de PDFs (o a todos los de una carpeta).
+    options: argumentos de optimize_pdf (target_dpi, jpeg_quality, image_format, max_workers).
+    Retorna: lista de informes de optimize_pdf con las claves ok y error añadidas.
+    """
+    if isinstance(inputs, str) and os.path.isdir(inputs):
+        inputs = sorted(os.path.join(inputs, f) for f in os.listdir(inputs)
+                        if f.lower().endswith('.pdf'))
+    os.makedirs(output_dir, exist_ok=True)
+    
+    results = []
+    for input_path in inputs:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        output_path = os.path.join(output_dir, f"{base_name}{suffix}.pdf")
+        try:
+            report = optimize_pdf(input_path, output_path, **options)
+            report.update({'ok': True, 'error': None})
+        except Exception as e:
+            report = {'input': input_path, 'output': output_path, 'ok': False, 'error': str(e)}
+        results.append(report)
+    return results
+
 def convert_pdf_to_word(input_path, output_path):
     """
     Convierte un PDF a formato Word (.docx) usando pdf2docx.
@@ -377,27 +2093,156 @@ def convert_pdf_to_ods(input_path, output_path):
     """
     return convert_pdf_to_excel(input_path, output_path)
 
-def sign_pdf_digitally(input_path, output_path, certificate_path, password):
+# Firmantes cargados en esta sesión: el PKCS#12 se descifra una sola vez por certificado
+_signer_cache = {}
+_signer_cache_lock = threading.Lock()
+
+def load_signer(certificate_path, password):
+    """
+    Carga el firmante de un certificado .p12 o .pfx, reutilizándolo durante la sesión.
+    La clave de cache incluye mtime y tamaño del certificado y un hash de la contraseña
+    (la contraseña no se guarda en memoria).
+    """
+    import hashlib
+    from pyhanko.sign import signers
+    
+    stat = os.stat(certificate_path)
+    password_hash = hashlib.sha256((password or "").encode()).hexdigest()
+    key = (os.path.abspath(certificate_path), stat.st_mtime, stat.st_size, password_hash)
+    
+    with _signer_cache_lock:
+        signer = _signer_cache.get(key)
+        if signer is None:
+            signer = signers.SimpleSigner.load_pkcs12(
+                pfx_file=certificate_path,
+                passphrase=password.encode() if password else None
+            )
+            if signer is None:
+                raise ValueError("No se pudo cargar el certificado (¿contraseña incorrecta?).")
+            _signer_cache[key] = signer
+    return signer
+
+def clear_signer_cache():
+    """Olvida los firmantes cargados (p.ej. al cerrar sesión o cambiar de certificado)."""
+    with _signer_cache_lock:
+        _signer_cache.clear()
+
+def sign_pdf_digitally(input_path, output_path, certificate_path, password, field_name='Signature1', signer=None):
     """
     Firma digitalmente un PDF usando un certificado .p12 o .pfx y pyHanko.
+    field_name: nombre del campo de firma a crear/usar
+    signer: firmante ya cargado (si es None se obtiene con load_signer)
     """
     from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
     from pyhanko.sign import signers
-    from pyhanko.sign.fields import SigSeedValueSpec
     
-    signer = signers.SimpleSigner.load_pkcs12(
-        pfx_file=certificate_path,
-        passphrase=password.encode() if password else None
-    )
+    if signer is None:
+        signer = load_signer(certificate_path, password)
+    
+    if os.path.getsize(input_path) >= LARGE_SIGNING_THRESHOLD:
+        return sign_large_pdf(input_path, output_path, certificate_path, password,
+                              field_name=field_name, signer=signer)
     
     with open(input_path, 'rb') as inf:
         w = IncrementalPdfFileWriter(inf)
         with open(output_path, 'wb') as outf:
             signers.sign_pdf(
-                w, signers.PdfSignatureMetadata(field_name='Signature1'),
+                w, signers.PdfSignatureMetadata(field_name=field_name),
                 signer=signer, output=outf
             )
 
+# A partir de este tamaño la firma copia el original a nivel de kernel y añade
+# la firma in situ en lugar de reescribir el documento desde Python
+LARGE_SIGNING_THRESHOLD = 64 * 1024 * 1024
+
+def _copy_file_fast(src_path, dst_path):
+    """
+    Copia un archivo sin pasar los datos por espacio de usuario: copy_file_range
+    (que además permite reflinks en btrfs/xfs) y, si no está disponible, shutil.copyfile,
+    que en Linux usa sendfile.
+    """
+    import shutil
+    
+    copy_range = getattr(os, 'copy_file_range', None)
+    if copy_range is None:
+        shutil.copyfile(src_path, dst_path)
+        return
+    
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                copied = copy_range(src.fileno(), dst.fileno(), size - offset, offset, offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError:
+            # Sistema de archivos sin soporte (p.ej. entre dispositivos en kernels antiguos)
+            pass
+    if offset < size:
+        shutil.copyfile(src_path, dst_path)
+
+def sign_large_pdf(input_path, output_path, certificate_path, password, field_name='Signature1',
+                   signer=None, chunk_size=8 * 1024 * 1024):
+    """
+    Firma un PDF muy grande sin que Python copie sus bytes.
+    El prefijo sin cambios se copia con _copy_file_fast y pyHanko escribe la
+    actualización incremental (con el contenedor de firma) al final del archivo de
+    salida en modo in_place. El digest del /ByteRange se calcula en una única
+    pasada secuencial con bloques de chunk_size bytes, así que el coste queda
+    limitado por el disco.
+    """
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+    from pyhanko.sign import signers
+    
+    if signer is None:
+        signer = load_signer(certificate_path, password)
+    
+    if os.path.abspath(input_path) != os.path.abspath(output_path):
+        _copy_file_fast(input_path, output_path)
+    
+    with open(output_path, 'r+b') as outf:
+        w = IncrementalPdfFileWriter(outf)
+        pdf_signer = signers.PdfSigner(signers.PdfSignatureMetadata(field_name=field_name), signer=signer)
+        pdf_signer.sign_pdf(w, in_place=True, chunk_size=chunk_size)
+
+def sign_pdfs_batch(inputs, output_dir, certificate_path, password, field_name='Signature1',
+                    suffix='_firmado', max_workers=None):
+    """
+    Firma en lote una lista de PDFs (o todos los PDFs de una carpeta) con un único
+    certificado, cargado una sola vez, usando un pool de hilos.
+    inputs: lista de rutas o ruta de una carpeta
+    field_name: nombre del campo de firma en cada documento
+    Retorna: lista de diccionarios {input, output, ok, error, seconds} en el orden de entrada.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    if isinstance(inputs, str) and os.path.isdir(inputs):
+        inputs = sorted(os.path.join(inputs, f) for f in os.listdir(inputs)
+                        if f.lower().endswith('.pdf'))
+    
+    os.makedirs(output_dir, exist_ok=True)
+    signer = load_signer(certificate_path, password)
+    
+    def sign_one(input_path):
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        output_path = os.path.join(output_dir, f"{base_name}{suffix}.pdf")
+        start = time.perf_counter()
+        result = {'input': input_path, 'output': output_path, 'ok': True, 'error': None}
+        try:
+            sign_pdf_digitally(input_path, output_path, certificate_path, password,
+                               field_name=field_name, signer=signer)
+        except Exception as e:
+            result['ok'] = False
+            result['error'] = str(e)
+        result['seconds'] = time.perf_counter() - start
+        return result
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(sign_one, inputs))
+
 def add_link_to_pdf(input_path, output_path, page_num, x, y, width, height, url):
     """
     Agrega un enlace (Annotation) a una página específica del PDF.
@@ -419,54 +2264,88 @@ def add_link_to_pdf(input_path, output_path, page_num, x, y, width, height, url)
             writer.add_annotation(page_number=i, annotation=link_ann)
             
     with open(output_path, "wb") as f:
-        writer.write(f)
+        write_pdf(writer, f)
 
-def find_text_coordinates(file_path, query):
+def extract_page_text_chunks(page):
     """
-    Busca todas las coordenadas de un texto en el PDF.
-    Retorna una lista de diccionarios con la página y el rectángulo [x, y, w, h].
+    Texto de una página y sus fragmentos con posición, en una sola pasada de extract_text.
+    Retorna (texto, [[fragmento, x, y, tamaño de fuente], ...]); (x, y) es el origen del
+    fragmento según la matriz de texto.
     """
-    from pypdf import PdfReader
-    import re
+    chunks = []
     
-    reader = PdfReader(file_path)
-    all_matches = []
+    def visitor_body(text, cm, tm, font_dict, font_size):
+        if text.strip():
+            chunks.append([text, tm[4], tm[5], font_size])
+    
+    text = page.extract_text(visitor_text=visitor_body)
+    return text, chunks
+
+@functools.lru_cache(maxsize=4096)
+def _fold_char(char):
+    return unicodedata.normalize('NFD', char)[0]
+
+def fold_accents(text):
+    """Quita tildes y diéresis carácter a carácter: el resultado tiene la misma longitud"""
+    if text.isascii():
+        return text
+    return "".join(map(_fold_char, text))
+
+def chunk_match_rects(chunks, pattern, ignore_accents=False):
+    """
+    Rectángulos [x, y, w, h] de las coincidencias de pattern (expresión regular compilada)
+    en los fragmentos de extract_page_text_chunks.
+    """
+    rects = []
+    for text, base_x, base_y, font_size in chunks:
+        if ignore_accents:
+            text = fold_accents(text)
+        for m in pattern.finditer(text):
+            if m.end() == m.start():
+                continue
+            # Estimación del ancho: una media de 0.5 * font_size por carácter
+            # (aproximación para fuentes proporcionales)
+            rects.append([base_x + m.start() * font_size * 0.5, base_y,
+                          (m.end() - m.start()) * font_size * 0.5, font_size])
+    return rects
+
+def compile_search_pattern(query, regex=False, whole_word=False, ignore_accents=False):
+    """
+    Expresión regular (insensible a mayúsculas) para search_text.
+    regex: query es una expresión regular; si no, se busca literalmente
+    whole_word: solo coincidencias que empiezan y terminan en límite de palabra
+    ignore_accents: el texto se compara sin tildes (fold_accents), así que también se pliega query
+    Lanza re.error si la expresión regular no es válida.
+    """
+    import re
     
+    if ignore_accents:
+        query = fold_accents(query)
+    pattern = query if regex else re.escape(query)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    return re.compile(pattern, re.IGNORECASE)
+
+def search_text(file_path, pattern, ignore_accents=False):
+    """
+    Recorre el PDF (ruta local o URL) página a página y entrega (page_num, rects) de cada
+    página en cuanto se procesa, con rects vacío si no hay coincidencias: el llamador puede
+    mostrar las primeras enseguida y dejar de iterar para cancelar la búsqueda.
+    pattern: expresión regular compilada (ver compile_search_pattern)
+    """
+    with instrumentation.span('pypdf.PdfReader'):
+        reader = open_reader(file_path)
     for page_index, page in enumerate(reader.pages):
         page_num = page_index + 1
-        
-        def visitor_body(text, cm, tm, font_dict, font_size):
-            if not text.strip():
-                return
-                
-            # Buscar el query dentro del texto del chunk (insensible a mayúsculas)
-            lower_text = text.lower()
-            lower_query = query.lower()
-            
-            if lower_query in lower_text:
-                # El "tm" (Text Matrix) nos da la posición base del chunk [a, b, c, d, e, f]
-                # e = tm[4], f = tm[5]
-                base_x = tm[4]
-                base_y = tm[5]
-                
-                # Encontrar todas las ocurrencias en este chunk
-                for m in re.finditer(re.escape(lower_query), lower_text):
-                    start_idx = m.start()
-                    
-                    # Estimación de desplazamiento horizontal:
-                    # El ancho aproximado de los caracteres antes de la coincidencia
-                    # Usamos una media de 0.5 * font_size por caracter (esto es una aproximación para fuentes proporcionales)
-                    offset_x = start_idx * font_size * 0.5
-                    
-                    # Ancho de la palabra buscada
-                    w = len(query) * font_size * 0.5
-                    h = font_size
-                    
-                    all_matches.append({
-                        "page": page_num,
-                        "rect": [base_x + offset_x, base_y, w, h]
-                    })
-        
-        page.extract_text(visitor_text=visitor_body)
-            
-    return all_matches
+        with instrumentation.span('pypdf.search_page', page=page_num):
+            _, chunks = extract_page_text_chunks(page)
+        yield page_num, chunk_match_rects(chunks, pattern, ignore_accents=ignore_accents)
+
+def find_text_coordinates(file_path, query):
+    """
+    Busca todas las coordenadas de un texto en el PDF (insensible a mayúsculas).
+    Retorna una lista de diccionarios con la página y el rectángulo [x, y, w, h].
+    """
+    pattern = compile_search_pattern(query)
+    return [{"page": page_num, "rect": rect}
+            for page_num, rects in search_text(file_path, pattern) for rect in rects]
@@ -0,0 +1,84 @@
+"""
+Lectura por rangos: abrir un PDF con muchos objetos no debe traer el archivo entero.
+"""
+import functools
+import http.server
+import os
+import re
+import threading
+
+import pytest
+
+import byte_range
+import pdf_tools
+
+PAGES = 3000
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """Servidor mínimo con soporte de Range que cuenta los bytes servidos"""
+    served = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        size = os.path.getsize(path)
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        with open(path, 'rb') as f:
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2) or size - 1), size - 1)
+                f.seek(start)
+                data = f.read(end - start + 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                data = f.read()
+                self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        RangeHandler.served += len(data)
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope='module')
+def many_pages_pdf(tmp_path_factory):
+    from reportlab.pdfgen import canvas
+
+    path = tmp_path_factory.mktemp('range') / 'many.pdf'
+    can = canvas.Canvas(str(path))
+    for page in range(PAGES):
+        can.drawString(100, 700, f"Página {page + 1}")
+        can.showPage()
+    can.save()
+    return path
+
+@pytest.fixture(scope='module')
+def pdf_url(many_pages_pdf):
+    handler = functools.partial(RangeHandler, directory=str(many_pages_pdf.parent))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/{many_pages_pdf.name}"
+    server.shutdown()
+
+
+def test_page_count_over_http_fetches_a_fraction(many_pages_pdf, pdf_url):
+    RangeHandler.served = 0
+    assert pdf_tools.get_pdf_page_count(pdf_url) == PAGES
+    assert RangeHandler.served < os.path.getsize(many_pages_pdf) * 0.3
+
+def test_extract_one_page_over_http_fetches_a_fraction(many_pages_pdf, pdf_url):
+    RangeHandler.served = 0
+    text = pdf_tools.extract_text(pdf_url, pages=[PAGES * 2 // 3])
+    assert f"Página {PAGES * 2 // 3 + 1}" in text
+    assert RangeHandler.served < os.path.getsize(many_pages_pdf) * 0.5
+
+def test_large_local_files_are_read_by_ranges(many_pages_pdf, monkeypatch):
+    monkeypatch.setattr(pdf_tools, 'LAZY_READ_THRESHOLD', 0)
+    reader = pdf_tools.open_reader(str(many_pages_pdf))
+    assert isinstance(reader.stream, byte_range.RangeFile)
+    assert pdf_tools.page_count(reader) == PAGES
+    assert reader.stream.bytes_fetched < os.path.getsize(many_pages_pdf) * 0.3
@@ -0,0 +1,165 @@
+"""
+Vía rápida de delete_pages / reorder_pages (_rebuild_page_tree): copia en bruto los objetos
+de las páginas conservadas, respeta el perfil de salida y el resultado se abre en pypdf.
+"""
+import os
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import Link
+from pypdf.generic import DecodedStreamObject, NameObject, NullObject
+
+import pdf_tools
+
+
+@pytest.fixture(params=['compacto', 'compatible'])
+def profile(request):
+    previous = pdf_tools.get_output_profile()
+    pdf_tools.set_output_profile(request.param)
+    yield request.param
+    pdf_tools.set_output_profile(**previous)
+
+
+def _reportlab_pdf(path, pages=4):
+    from reportlab.pdfgen import canvas
+
+    can = canvas.Canvas(str(path))
+    for number in range(1, pages + 1):
+        can.drawString(100, 700, f"Hoja {number}")
+        can.showPage()
+    can.save()
+    return path
+
+
+def _handmade_pdf(path, texts):
+    """PDF escrito a mano con el /Length de cada contenido en un objeto aparte"""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    next_id = 4
+    for text in texts:
+        page_id, contents_id, length_id = next_id, next_id + 1, next_id + 2
+        next_id += 3
+        content = f"BT /F1 12 Tf 100 700 Td ({text}) Tj ET".encode()
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {contents_id} 0 R >>").encode()
+        objects[contents_id] = (f"<< /Length {length_id} 0 R >>\nstream\n".encode() + content + b"\nendstream")
+        objects[length_id] = str(len(content)).encode()
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(texts)} >>".encode()
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for idnum in sorted(objects):
+        offsets[idnum] = len(data)
+        data += f"{idnum} 0 obj\n".encode() + objects[idnum] + b"\nendobj\n"
+    xref_at = len(data)
+    data += f"xref\n0 {next_id}\n0000000000 65535 f \n".encode()
+    for idnum in range(1, next_id):
+        data += f"{offsets[idnum]:010d} 00000 n \n".encode()
+    data += f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    path.write_bytes(bytes(data))
+    return path
+
+
+def _rebuild(source, output, indices):
+    """Ejecuta la vía rápida y comprueba que no se recurrió a pypdf"""
+    assert pdf_tools._rebuild_page_tree(PdfReader(str(source)), str(source), str(output), indices)
+    return PdfReader(str(output), strict=True)
+
+
+def _texts(reader):
+    return [page.extract_text().strip() for page in reader.pages]
+
+
+def _check_profile(output, profile):
+    data = output.read_bytes()
+    if profile == 'compacto':
+        assert b"/ObjStm" in data and b"/Type /XRef" in data
+    else:
+        assert b"/ObjStm" not in data and b"\nxref\n" in data
+
+
+def test_classic_input(tmp_path, profile):
+    source = _reportlab_pdf(tmp_path / 'origen.pdf')
+    output = tmp_path / 'salida.pdf'
+    reader = _rebuild(source, output, [3, 0, 2])
+    assert _texts(reader) == ["Hoja 4", "Hoja 1", "Hoja 3"]
+    _check_profile(output, profile)
+
+
+def test_object_stream_input_stays_compact(tmp_path, profile):
+    plain = _reportlab_pdf(tmp_path / 'origen.pdf')
+    source = tmp_path / 'compacto.pdf'
+    pdf_tools.write_pdf(PdfWriter(clone_from=str(plain)), str(source), profile='compacto')
+    assert b"/ObjStm" in source.read_bytes()
+
+    output = tmp_path / 'salida.pdf'
+    reader = _rebuild(source, output, [0, 2, 3])
+    assert _texts(reader) == ["Hoja 1", "Hoja 3", "Hoja 4"]
+    _check_profile(output, profile)
+    if profile == 'compacto':
+        # Borrar una página no puede agrandar un archivo que ya estaba empaquetado
+        assert os.path.getsize(output) <= os.path.getsize(source)
+
+
+def test_incrementally_updated_input(tmp_path, profile):
+    source = _reportlab_pdf(tmp_path / 'origen.pdf')
+    # Actualización incremental: el contenido nuevo de la página 2 va en una sección añadida
+    writer = PdfWriter(str(source), incremental=True)
+    contents = DecodedStreamObject()
+    contents.set_data(b"BT /F1 12 Tf 100 700 Td (Revisada) Tj ET")
+    writer.pages[1][NameObject('/Contents')] = writer._add_object(contents)
+    updated = tmp_path / 'actualizado.pdf'
+    writer.write(str(updated))
+    assert updated.read_bytes().startswith(source.read_bytes())
+    assert updated.read_bytes().count(b"%%EOF") == 2
+
+    output = tmp_path / 'salida.pdf'
+    reader = _rebuild(updated, output, [1, 3])
+    assert _texts(reader) == ["Revisada", "Hoja 4"]
+    _check_profile(output, profile)
+
+
+def test_indirect_length(tmp_path, profile):
+    source = _handmade_pdf(tmp_path / 'a_mano.pdf', ["Uno", "Dos", "Tres"])
+    output = tmp_path / 'salida.pdf'
+    reader = _rebuild(source, output, [2, 1])
+    assert _texts(reader) == ["Tres", "Dos"]
+    _check_profile(output, profile)
+
+
+def test_links_to_deleted_pages(tmp_path, profile):
+    plain = _reportlab_pdf(tmp_path / 'origen.pdf')
+    source = tmp_path / 'enlaces.pdf'
+    writer = PdfWriter(clone_from=str(plain))
+    writer.add_annotation(0, Link(rect=(10, 10, 50, 50), target_page_index=2))
+    writer.add_annotation(0, Link(rect=(60, 10, 100, 50), target_page_index=3))
+    writer.write(str(source))
+
+    output = tmp_path / 'salida.pdf'
+    reader = _rebuild(source, output, [0, 1, 3])
+    assert _texts(reader) == ["Hoja 1", "Hoja 2", "Hoja 4"]
+    to_deleted, to_kept = (annot.get_object()['/Dest'] for annot in reader.pages[0]['/Annots'])
+    # El destino de la página borrada queda en null; el de la conservada sigue apuntándola
+    assert isinstance(to_deleted[0].get_object(), NullObject)
+    assert to_kept[0].idnum == reader.pages[2].indirect_reference.idnum
+    _check_profile(output, profile)
+
+
+def test_delete_and_reorder_use_the_profile(tmp_path, profile):
+    plain = _reportlab_pdf(tmp_path / 'origen.pdf', pages=6)
+    source = tmp_path / 'compacto.pdf'
+    pdf_tools.write_pdf(PdfWriter(clone_from=str(plain)), str(source), profile='compacto')
+
+    deleted = tmp_path / 'borrada.pdf'
+    pdf_tools.delete_pages(str(source), str(deleted), [2])
+    reordered = tmp_path / 'reordenada.pdf'
+    pdf_tools.reorder_pages(str(source), str(reordered), [6, 5, 4, 3, 2, 1])
+
+    assert _texts(PdfReader(str(deleted), strict=True)) == ["Hoja 1", "Hoja 3", "Hoja 4", "Hoja 5", "Hoja 6"]
+    assert _texts(PdfReader(str(reordered), strict=True)) == [f"Hoja {n}" for n in range(6, 0, -1)]
+    _check_profile(deleted, profile)
+    _check_profile(reordered, profile)
+    if profile == 'compacto':
+        assert os.path.getsize(deleted) <= os.path.getsize(source)
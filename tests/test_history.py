@@ -0,0 +1,140 @@
+"""
+Diferencias por páginas (pdf_tools.diff_pdf_pages / apply_pdf_diff) y el historial de
+deshacer de main.EditHistory.
+"""
+import io
+import time
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import Link
+
+import pdf_tools
+from main import EditHistory
+
+
+def _make_pdf(path, pages, links=False):
+    from reportlab.pdfgen import canvas
+
+    plain = path.with_suffix('.base.pdf')
+    can = canvas.Canvas(str(plain))
+    for number in range(1, pages + 1):
+        can.drawString(100, 700, f"Página {number}")
+        can.showPage()
+    can.save()
+    writer = PdfWriter(clone_from=str(plain))
+    if links:
+        # Cada página enlaza con todas las demás
+        for source in range(pages):
+            for target in range(pages):
+                writer.add_annotation(source, Link(rect=(10, 10 + 6 * target, 50, 15 + 6 * target),
+                                                   target_page_index=target))
+    writer.write(str(path))
+    return path
+
+
+def _texts(path):
+    return [page.extract_text() for page in PdfReader(str(path)).pages]
+
+
+def _stamp(source, output, page):
+    pdf_tools.add_stamps_to_pdf(str(source), str(output), texts=[
+        {'page': page, 'text': "Sello", 'x': 300, 'y': 300, 'font_size': 12, 'color': (0, 0, 0)}])
+    return output
+
+
+def test_diff_of_edited_page(tmp_path):
+    base = _make_pdf(tmp_path / 'base.pdf', 5)
+    edited = _stamp(base, tmp_path / 'editado.pdf', 3)
+
+    diff = pdf_tools.diff_pdf_pages(base, edited)
+    assert diff['changed'] == [3]
+    assert diff['order'] == [('base', 0), ('base', 1), ('new', 0), ('base', 3), ('base', 4)]
+    assert len(PdfReader(io.BytesIO(diff['pages_pdf'])).pages) == 1
+
+    restored = tmp_path / 'reconstruido.pdf'
+    pdf_tools.apply_pdf_diff(str(base), diff, str(restored))
+    assert _texts(restored) == _texts(edited)
+
+
+def test_diff_of_deleted_page_needs_no_new_pages(tmp_path):
+    base = _make_pdf(tmp_path / 'base.pdf', 5)
+    deleted = tmp_path / 'borrada.pdf'
+    pdf_tools.delete_pages(str(base), str(deleted), [2])
+
+    diff = pdf_tools.diff_pdf_pages(base, deleted)
+    assert diff['pages_pdf'] is None
+    assert diff['order'] == [('base', 0), ('base', 2), ('base', 3), ('base', 4)]
+
+    # Y la inversa: volver a la versión con la página
+    backward = pdf_tools.diff_pdf_pages(deleted, base)
+    restored = tmp_path / 'reconstruido.pdf'
+    pdf_tools.apply_pdf_diff(str(deleted), backward, str(restored))
+    assert _texts(restored) == _texts(base)
+
+
+def test_linked_pages_do_not_change_with_their_targets(tmp_path):
+    base = _make_pdf(tmp_path / 'base.pdf', 6, links=True)
+    edited = _stamp(base, tmp_path / 'editado.pdf', 4)
+
+    # Todas las páginas enlazan con la 4, pero solo la 4 cambió
+    assert pdf_tools.diff_pdf_pages(base, edited)['changed'] == [4]
+
+
+def test_fingerprints_scale_on_cross_linked_documents(tmp_path):
+    path = _make_pdf(tmp_path / 'enlazado.pdf', 40, links=True)
+    start = time.perf_counter()
+    fingerprints = pdf_tools.page_fingerprints(str(path))
+    # Cada objeto se describe una vez: sin memoria esto tardaba varios segundos
+    assert time.perf_counter() - start < 3
+    assert len(set(fingerprints)) == 40
+
+
+def test_history_undo_redo(tmp_path):
+    base = _make_pdf(tmp_path / 'base.pdf', 4)
+    edited = _stamp(base, tmp_path / 'editado.pdf', 2)
+
+    history = EditHistory()
+    assert history.record("Sello", str(base), str(edited)) == [2]
+
+    undone, changed, label = history.undo(str(edited))
+    assert (changed, label) == ([2], "Sello")
+    assert _texts(undone) == _texts(base)
+    assert history.can_redo() and not history.can_undo()
+
+    redone, changed, _ = history.redo(undone)
+    assert changed == [2]
+    assert _texts(redone) == _texts(edited)
+
+
+def test_history_budget_drops_oldest(tmp_path):
+    versions = [_make_pdf(tmp_path / 'v0.pdf', 4)]
+    for number in range(1, 5):
+        versions.append(_stamp(versions[-1], tmp_path / f'v{number}.pdf', number))
+
+    # Un presupuesto nulo no conserva nada
+    history = EditHistory(budget_bytes=0)
+    for before, after in zip(versions, versions[1:]):
+        history.record("Sello", str(before), str(after))
+    assert not history.can_undo()
+    assert history.memory_used == 0
+
+    history = EditHistory()
+    for before, after in zip(versions, versions[1:]):
+        history.record("Sello", str(before), str(after))
+    per_entry = [entry['bytes'] for entry in history.undo_stack]
+    assert all(size > 0 for size in per_entry)
+    assert history.memory_used == sum(per_entry)
+
+    # Caben justo las dos últimas operaciones: se descartan las dos más antiguas
+    history.budget = sum(per_entry[-2:])
+    history._enforce_budget()
+    assert len(history.undo_stack) == 2
+    assert history.memory_used == sum(per_entry[-2:])
+
+    # Un registro nuevo descarta lo que había para rehacer y libera su memoria
+    history.budget = EditHistory.BUDGET
+    history.undo(str(versions[-1]))
+    assert history.can_redo()
+    history.record("Sello", str(versions[0]), str(versions[1]))
+    assert not history.can_redo()
+    assert history.memory_used == sum(entry['bytes'] for entry in history.undo_stack)
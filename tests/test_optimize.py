@@ -0,0 +1,30 @@
+"""
+optimize_pdf también recomprime las imágenes que están dentro de Form XObjects.
+"""
+import os
+
+import pdf_tools
+
+
+def test_optimize_recompresses_stamped_images(tmp_path):
+    from PIL import Image
+    from reportlab.pdfgen import canvas
+
+    base = tmp_path / 'base.pdf'
+    can = canvas.Canvas(str(base))
+    can.drawString(100, 700, "Documento")
+    can.showPage()
+    can.save()
+
+    # Imagen grande (y poco comprimible) dibujada pequeña: el sello queda dentro de un Form XObject
+    image = tmp_path / 'sello.png'
+    Image.effect_noise((1200, 1200), 60).convert('RGB').save(image)
+    stamped = tmp_path / 'sellado.pdf'
+    pdf_tools.add_stamps_to_pdf(str(base), str(stamped), images=[
+        {'page': 1, 'path': str(image), 'x': 100, 'y': 100, 'width': 150, 'height': 150}])
+
+    output = tmp_path / 'optimizado.pdf'
+    report = pdf_tools.optimize_pdf(str(stamped), str(output), target_dpi=150)
+    assert report['images_total'] == 1
+    assert report['images_optimized'] == 1
+    assert os.path.getsize(output) < os.path.getsize(stamped) / 5
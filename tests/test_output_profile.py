@@ -0,0 +1,90 @@
+"""
+write_pdf con cada perfil de salida: el archivo se vuelve a abrir en pypdf (modo estricto),
+conserva el texto, /Info y /ID, y usa la estructura que pide el perfil.
+"""
+import io
+import re
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+import pdf_tools
+
+
+@pytest.fixture
+def source_pdf(tmp_path):
+    from reportlab.pdfgen import canvas
+
+    path = tmp_path / 'origen.pdf'
+    can = canvas.Canvas(str(path))
+    can.setTitle("Origen")
+    # Suficientes páginas para repartir los objetos en más de un object stream
+    for number in range(1, 251):
+        can.drawString(100, 700, f"Página {number}")
+        can.showPage()
+    can.save()
+    return path
+
+
+def _write(source_pdf, profile, prepare=None):
+    writer = PdfWriter(clone_from=str(source_pdf))
+    writer.add_metadata({'/Title': "Prueba de perfil"})
+    if prepare:
+        prepare(writer)
+    expected_id = writer._ID
+    buffer = io.BytesIO()
+    pdf_tools.write_pdf(writer, buffer, profile=profile)
+    return buffer.getvalue(), expected_id
+
+
+@pytest.mark.parametrize('profile', sorted(pdf_tools.OUTPUT_PROFILES))
+def test_round_trip(source_pdf, profile):
+    data, expected_id = _write(source_pdf, profile)
+    reader = PdfReader(io.BytesIO(data), strict=True)
+    original = PdfReader(str(source_pdf))
+
+    assert len(reader.pages) == len(original.pages)
+    for index in (0, 124, 249):
+        assert reader.pages[index].extract_text() == original.pages[index].extract_text()
+    assert reader.metadata['/Title'] == "Prueba de perfil"
+    assert [part.original_bytes for part in reader.trailer['/ID']] == [part.original_bytes for part in expected_id]
+
+
+@pytest.mark.parametrize('profile', ['compacto', 'maximo'])
+def test_object_streams_and_xref_stream(source_pdf, profile):
+    data, _ = _write(source_pdf, profile)
+    assert data[:8] >= b"%PDF-1.5"
+    assert b"/Type /XRef" in data
+    assert b"\nxref\n" not in data
+    # Un diccionario por página (el contenido va en streams sueltos): más de OBJECT_STREAM_SIZE
+    # objetos empaquetables
+    assert len(re.findall(rb"/Type /ObjStm", data)) >= 2
+
+    reader = PdfReader(io.BytesIO(data), strict=True)
+    # Los objetos empaquetados se resuelven a través del object stream
+    assert reader.trailer['/Root']['/Pages']['/Count'] == 250
+
+
+def test_compatible_profile_writes_classic_xref(source_pdf):
+    data, _ = _write(source_pdf, 'compatible')
+    assert b"\nxref\n" in data
+    assert b"/ObjStm" not in data
+
+
+def test_encrypted_writer_falls_back_to_classic_xref(source_pdf):
+    data, _ = _write(source_pdf, 'compacto', prepare=lambda writer: writer.encrypt("clave"))
+    assert b"\nxref\n" in data
+    assert b"/ObjStm" not in data
+
+    reader = PdfReader(io.BytesIO(data))
+    assert reader.is_encrypted
+    assert reader.decrypt("clave")
+    assert reader.pages[5].extract_text() == PdfReader(str(source_pdf)).pages[5].extract_text()
+    assert reader.metadata['/Title'] == "Prueba de perfil"
+
+
+def test_write_to_path(source_pdf, tmp_path):
+    output = tmp_path / 'salida.pdf'
+    writer = PdfWriter(clone_from=str(source_pdf))
+    pdf_tools.write_pdf(writer, str(output), profile='maximo')
+    assert len(PdfReader(str(output), strict=True).pages) == 250
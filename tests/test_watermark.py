@@ -0,0 +1,69 @@
+"""
+watermark_pdf coloca el sello según la página tal como se ve: con /Rotate las esquinas
+son las de la página girada y el sello se lee derecho.
+"""
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ContentStream
+
+import pdf_tools
+
+WIDTH, HEIGHT = 400, 600
+MARGIN = 36
+
+
+@pytest.fixture
+def rotated_pdf(tmp_path):
+    from reportlab.pdfgen import canvas
+
+    base = tmp_path / 'base.pdf'
+    can = canvas.Canvas(str(base), pagesize=(WIDTH, HEIGHT))
+    for _ in range(4):
+        can.showPage()
+    can.save()
+
+    writer = PdfWriter(clone_from=str(base))
+    for page, rotation in zip(writer.pages, (0, 90, 180, 270)):
+        page.rotate(rotation)
+    path = tmp_path / 'girado.pdf'
+    writer.write(str(path))
+    return path
+
+
+def _to_view(x, y, rotation):
+    """Punto del espacio de la página en la página mostrada (/Rotate gira en sentido horario)"""
+    return {0: (x, y), 90: (y, WIDTH - x), 180: (WIDTH - x, HEIGHT - y), 270: (HEIGHT - y, x)}[rotation]
+
+
+def _stamp_placement(reader, page):
+    """Caja del sello en pantalla (x0, y0, x1, y1) y dirección de su eje x"""
+    operations = ContentStream(page['/Contents'][-1].get_object(), reader).operations
+    a, b, c, d, e, f = map(float, [ops for ops, op in operations if op == b'cm'][-1])
+    name = [ops for ops, op in operations if op == b'Do'][-1][0]
+    x0, y0, x1, y1 = map(float, page['/Resources']['/XObject'][name]['/BBox'])
+    corners = [_to_view(a * x + c * y + e, b * x + d * y + f, page.rotation) for x in (x0, x1) for y in (y0, y1)]
+    origin = _to_view(e, f, page.rotation)
+    unit = _to_view(a + e, b + f, page.rotation)
+    box = (min(p[0] for p in corners), min(p[1] for p in corners),
+           max(p[0] for p in corners), max(p[1] for p in corners))
+    return box, (round(unit[0] - origin[0]), round(unit[1] - origin[1]))
+
+
+@pytest.mark.parametrize('position', ['top-left', 'bottom-right'])
+def test_watermark_follows_page_rotation(rotated_pdf, tmp_path, position):
+    output = tmp_path / 'sellado.pdf'
+    pdf_tools.watermark_pdf(str(rotated_pdf), str(output), text="CONFIDENCIAL", position=position,
+                            margin=MARGIN, font_size=20, opacity=1)
+
+    reader = PdfReader(str(output))
+    for page in reader.pages:
+        view_width, view_height = (HEIGHT, WIDTH) if page.rotation in (90, 270) else (WIDTH, HEIGHT)
+        (x0, y0, x1, y1), direction = _stamp_placement(reader, page)
+        # Se lee de izquierda a derecha en pantalla
+        assert direction == (1, 0)
+        if position == 'top-left':
+            assert x0 == pytest.approx(MARGIN, abs=0.01)
+            assert y1 == pytest.approx(view_height - MARGIN, abs=0.01)
+        else:
+            assert x1 == pytest.approx(view_width - MARGIN, abs=0.01)
+            assert y0 == pytest.approx(MARGIN, abs=0.01)